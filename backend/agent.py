@@ -1,24 +1,132 @@
 import os
+import contextvars
+import importlib
 import base64
 import json
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Any, Iterator, List, Optional, Tuple, Union, BinaryIO
 import requests
-from PIL import Image, ImageEnhance, ImageFilter
-import io
-from langfuse import Langfuse
-from openai import OpenAI
-try:
-    from groq import Groq
-except ImportError:
-    Groq = None
-try:
-    from langfuse.callback import CallbackHandler  # type: ignore
-except ImportError:
-    CallbackHandler = None
+from PIL import Image
+from cache import LRUCache, ResultCache, content_hash, make_cache_key
+from json_repair import parse_model_json, validate_schema
+from json_stream import IncrementalJSONParser
+from page_gate import BLANK, PRINTED, PageGate
+from preprocessing import ImagePreprocessor
+from metrics import metrics
+from tracing import HTTPSink, LangfuseSink, StageTimer, TraceExporter
+from providers import HuggingFaceProvider, OllamaProvider, ProviderRouter, VisionProvider
+from resilience import RetryPolicy
+from shared_state import KeyValueStore
+from singleflight import SingleFlight
+from tenants import FairShareScheduler, parse_weights
+from templates import TemplateRegistry, encode_crop, tile_fields
+
+if TYPE_CHECKING:
+    from langfuse import Langfuse
+
+HF_MODEL = "Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic"
+
+# Bump whenever EXTRACTION_PROMPT changes so cached results from the old prompt are not reused
+PROMPT_VERSION = "1"
+
+# Anything the agent accepts as an image: a filesystem path, raw bytes or a binary file-like object
+ImageSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+EXTRACTION_PROMPT = """You are an expert OCR system specialized in reading handwritten text with maximum accuracy.
+
+Analyze this handwritten document with extreme care and extract ALL the information you can see.
+
+CRITICAL INSTRUCTIONS FOR MAXIMUM ACCURACY:
+1. Read each character and word carefully - examine the image in detail
+2. DO NOT assume or hallucinate any fields - only extract what is clearly visible
+3. Pay special attention to:
+   - Numbers (phone numbers, dates, policy numbers, etc.) - read each digit precisely
+   - Names - read each letter carefully, including capitalization
+   - Addresses - read street names, numbers, and city names accurately
+   - Email addresses - verify @ symbols and domain names
+4. For partially readable text, extract what you can see clearly, even if incomplete
+5. If text is completely illegible or blank, mark it as "unreadable" (not null)
+6. Return the data as clean, structured JSON with proper nesting
+7. Create field names based on actual labels, headings, and form structure you see
+8. Preserve the exact logical structure and grouping of information
+9. Be extremely precise with values - read numbers and text character by character
+10. Double-check your extraction before returning the JSON
+
+IMPORTANT: Read slowly and carefully. Accuracy is more important than speed.
+Return ONLY valid JSON with no additional text, markdown, or explanation before or after.
+The JSON should have descriptive keys based on the actual content structure."""
+
+# Prompts for pages matched to a known form template (see templates.py); only field regions are sent
+TEMPLATE_PROMPT = """This image shows fields cropped from a known form, stacked top to bottom. The grey bar above each region carries the field name.
+
+Transcribe the handwriting in each region exactly as written. Read numbers, names and email addresses character by character; do not guess or correct spelling.
+
+Return ONLY a JSON object with exactly these keys: {fields}
+Use "unreadable" for a field you cannot read and "" for a field left blank. No markdown or explanation."""
+
+FIELD_PROMPT = """This image is the "{field}" field cropped from a form. Transcribe the handwriting in it exactly as written, character by character.
+
+Return ONLY a JSON object: {{"value": "<text>"}}
+Use "unreadable" if you cannot read it and "" if the field is blank. No markdown or explanation."""
+
+
+def startup_log(message: str):
+    """Print a configuration line once per deployment: only worker 0 reports when several workers start"""
+    if os.getenv("HANDWRITING_WORKER_ID", "0") == "0":
+        print(message)
+
+
+def _groq_key_configured(key: Optional[str]) -> bool:
+    return bool(key and key.strip() and key != "your_groq_api_key_here")
+
+
+def preload_clients() -> List[str]:
+    """Import the provider and tracing SDKs the current configuration will use.
+
+    The agent imports them lazily (they cost ~0.9s together); a pre-forking
+    launcher calls this once so every worker inherits the loaded modules.
+    """
+    modules = []
+    if os.getenv("HF_TOKEN"):
+        modules.append("openai")
+    if _groq_key_configured(os.getenv("GROQ_API_KEY")):
+        modules.append("groq")
+    if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
+        modules.append("langfuse")
+    loaded = []
+    for module in modules:
+        try:
+            importlib.import_module(module)
+            loaded.append(module)
+        except ImportError:
+            pass
+    return loaded
+
+
+def read_image_bytes(image: ImageSource) -> bytes:
+    """Return the raw bytes of an image given as a path, bytes-like or file-like object"""
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, (bytearray, memoryview)):
+        return bytes(image)
+    if hasattr(image, "read"):
+        if hasattr(image, "seek"):
+            image.seek(0)
+        return image.read()
+    with open(image, "rb") as image_file:
+        return image_file.read()
+
+
+def _sniff_mime_type(image_bytes: bytes) -> str:
+    if image_bytes.startswith(b"\x89PNG"):
+        return "image/png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
 
 
 class HandwritingExtractionAgent:
-    def __init__(self):
+    def __init__(self, shared_state: Optional[KeyValueStore] = None):
         self.ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
         self.ollama_model = os.getenv("OLLAMA_MODEL", "bakllava:latest")
         self.langfuse_public_key = os.getenv("LANGFUSE_PUBLIC_KEY")
@@ -28,33 +136,137 @@ class HandwritingExtractionAgent:
         self.temperature = float(os.getenv("OLLAMA_TEMPERATURE", "0.1"))
         self.num_predict = int(os.getenv("OLLAMA_NUM_PREDICT", "2048"))
         self.enable_preprocessing = os.getenv("ENABLE_IMAGE_PREPROCESSING", "true").lower() == "true"
+        # Optional JSON Schema every extraction is validated against unless the caller passes its own
+        self.extraction_schema: Optional[Dict[str, Any]] = None
+        if os.getenv("EXTRACTION_SCHEMA_FILE"):
+            with open(os.getenv("EXTRACTION_SCHEMA_FILE"), "r", encoding="utf-8") as schema_file:
+                self.extraction_schema = json.load(schema_file)
+        self.preprocessor = ImagePreprocessor(
+            max_edge=int(os.getenv("IMAGE_MAX_EDGE", "1536")),
+            min_edge=int(os.getenv("IMAGE_MIN_EDGE", "512")),
+            grayscale=os.getenv("IMAGE_GRAYSCALE", "auto").lower(),
+            denoise=os.getenv("IMAGE_DENOISE", "true").lower() == "true",
+            output_format=os.getenv("IMAGE_OUTPUT_FORMAT", "JPEG"),
+            byte_budget=int(os.getenv("IMAGE_BYTE_BUDGET_KB", "500")) * 1024
+        )
+        # Prepared (preprocessed + base64) payloads, reused by retries, consensus passes and failovers
+        self.encodings = LRUCache(
+            max_entries=int(os.getenv("ENCODING_CACHE_ENTRIES", "64")),
+            max_bytes=int(float(os.getenv("ENCODING_CACHE_MB", "64")) * 1024 * 1024),
+            ttl_seconds=float(os.getenv("ENCODING_CACHE_TTL_SECONDS", "600"))
+        )
+        # Local blank/printed/handwritten check that runs before any model call
+        self.page_gate: Optional[PageGate] = None
+        if os.getenv("PAGE_GATE_ENABLED", "true").lower() == "true":
+            self.page_gate = PageGate(
+                blank_max_ink=float(os.getenv("PAGE_GATE_BLANK_MAX_INK", "0.0005")),
+                printed_max_diagonal=float(os.getenv("PAGE_GATE_PRINTED_MAX_DIAGONAL", "0.3")),
+                ink_contrast=float(os.getenv("PAGE_GATE_INK_CONTRAST", "40")),
+                blank_contrast=float(os.getenv("PAGE_GATE_BLANK_CONTRAST", "20"))
+            )
+        # Known form layouts: matching pages send only their field regions to the model
+        self.templates: Optional[TemplateRegistry] = None
+        self.template_mode = os.getenv("FORM_TEMPLATE_MODE", "tiled").lower()
+        if os.getenv("FORM_TEMPLATES_DIR"):
+            self.templates = TemplateRegistry.from_directory(
+                os.getenv("FORM_TEMPLATES_DIR"),
+                min_score=float(os.getenv("FORM_TEMPLATE_MIN_SCORE", "0.3"))
+            )
+            startup_log(f"[OK] Loaded {len(self.templates.templates)} form template(s) ({self.template_mode} mode)")
         self.use_consensus = os.getenv("USE_CONSENSUS_MODE", "true").lower() == "true"
+        self.consensus_samples = max(2, int(os.getenv("CONSENSUS_SAMPLES", "3")))
+        self.consensus_early_exit = os.getenv("CONSENSUS_EARLY_EXIT", "true").lower() == "true"
+        self._consensus_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("CONSENSUS_WORKERS", "16")),
+            thread_name_prefix="consensus"
+        )
+        
+        # Concurrent identical uploads (double clicks, duplicate pages in a batch) share one extraction
+        self.inflight: Optional[SingleFlight] = None
+        if os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true":
+            self.inflight = SingleFlight()
+        
+        self.cache: Optional[ResultCache] = None
+        if os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true":
+            self.cache = ResultCache(
+                max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024")),
+                max_bytes=int(float(os.getenv("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400")),
+                disk_path=os.getenv("RESULT_CACHE_DB") or None,
+                # Shared with the other workers of a multi-worker deployment (see server.py)
+                shared=shared_state
+            )
         
         self.hf_token = os.getenv("HF_TOKEN")
         if self.hf_token:
+            from openai import OpenAI
+            # Retries are owned by the provider router, so the client's own retry loop is disabled
             self.hf_client = OpenAI(
-                base_url="https://router.huggingface.co/v1",
+                base_url=os.getenv("HF_BASE_URL", "https://router.huggingface.co/v1"),
                 api_key=self.hf_token,
+                max_retries=0,
             )
         else:
             self.hf_client = None
         
+        self.hf_provider = HuggingFaceProvider(
+            self.hf_client,
+            HF_MODEL,
+            timeout=float(os.getenv("HF_TIMEOUT_SECONDS", "120"))
+        ) if self.hf_client else None
+        self.ollama_provider = None
+        if os.getenv("OLLAMA_ENABLED", "true").lower() == "true":
+            self.ollama_provider = OllamaProvider(
+                host=self.ollama_host,
+                model=self.ollama_model,
+                timeout=self.request_timeout,
+                temperature=self.temperature,
+                num_predict=self.num_predict,
+                pool_size=int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+            )
+        # Local Ollama is listed first so it wins ties before any latency has been measured
+        self.router = ProviderRouter(
+            [provider for provider in (self.ollama_provider, self.hf_provider) if provider],
+            failure_cooldown=float(os.getenv("PROVIDER_FAILURE_COOLDOWN_SECONDS", "30")),
+            retry=RetryPolicy(
+                max_attempts=int(os.getenv("PROVIDER_MAX_ATTEMPTS", "3")),
+                base_delay=float(os.getenv("PROVIDER_RETRY_BASE_DELAY_SECONDS", "0.5")),
+                max_delay=float(os.getenv("PROVIDER_RETRY_MAX_DELAY_SECONDS", "8"))
+            ),
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            deadline_multiplier=float(os.getenv("PROVIDER_DEADLINE_MULTIPLIER", "3")),
+            min_deadline=float(os.getenv("PROVIDER_MIN_DEADLINE_SECONDS", "10")),
+            hedge=os.getenv("PROVIDER_HEDGE_ENABLED", "true").lower() == "true",
+            hedge_percentile=float(os.getenv("PROVIDER_HEDGE_PERCENTILE", "0.95")),
+            # Global cap on concurrent upstream calls, shared between tenants by weight
+            fair_share=FairShareScheduler(
+                int(os.getenv("FAIR_SHARE_MAX_CONCURRENCY", "16")),
+                parse_weights(os.getenv("TENANT_WEIGHTS", ""))
+            )
+        )
+        
         self.groq_api_key = os.getenv("GROQ_API_KEY")
+        self.groq_client = None
         # Check if API key is set and not a placeholder
-        if self.groq_api_key and self.groq_api_key.strip() and self.groq_api_key != "your_groq_api_key_here" and Groq:
+        if _groq_key_configured(self.groq_api_key):
             try:
+                from groq import Groq
                 self.groq_client = Groq(api_key=self.groq_api_key)
+            except ImportError:
+                pass
             except Exception as e:
                 print(f"[WARNING] Failed to initialize Groq client: {e}")
-                self.groq_client = None
-        else:
-            self.groq_client = None
         
-        self.langfuse: Optional[Langfuse] = None
+        self.langfuse: Optional["Langfuse"] = None
         self.langfuse_handler = None
         
         if self.langfuse_public_key and self.langfuse_secret_key:
             try:
+                from langfuse import Langfuse
+                try:
+                    from langfuse.callback import CallbackHandler  # type: ignore
+                except ImportError:
+                    CallbackHandler = None
                 self.langfuse = Langfuse(
                     public_key=self.langfuse_public_key,
                     secret_key=self.langfuse_secret_key,
@@ -66,158 +278,381 @@ class HandwritingExtractionAgent:
                         secret_key=self.langfuse_secret_key,
                         host=self.langfuse_host
                     )
-                print("[OK] Langfuse initialized successfully")
+                startup_log("[OK] Langfuse initialized successfully")
             except Exception as e:
-                print(f"[WARNING] Langfuse initialization failed: {e}")
-                print("Continuing without Langfuse tracing...")
+                startup_log(f"[WARNING] Langfuse initialization failed: {e}")
+                startup_log("Continuing without Langfuse tracing...")
         else:
-            print("[WARNING] Langfuse credentials not found. Continuing without tracing...")
+            startup_log("[WARNING] Langfuse credentials not found. Continuing without tracing...")
+        
+        # Traces are exported from a background thread so a slow tracing backend never adds request latency
+        trace_sinks = []
+        if self.langfuse:
+            try:
+                trace_sinks.append(LangfuseSink(self.langfuse))
+            except TypeError as e:
+                startup_log(f"[WARNING] Langfuse tracing disabled: {e}")
+        if os.getenv("TRACE_EXPORT_URL"):
+            trace_sinks.append(HTTPSink(os.getenv("TRACE_EXPORT_URL")))
+        self.tracer: Optional[TraceExporter] = None
+        if trace_sinks:
+            self.tracer = TraceExporter(
+                trace_sinks,
+                max_queue=int(os.getenv("TRACE_QUEUE_SIZE", "1000")),
+                batch_size=int(os.getenv("TRACE_BATCH_SIZE", "50")),
+                flush_interval=float(os.getenv("TRACE_FLUSH_INTERVAL_SECONDS", "2")),
+                sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1.0")),
+                max_payload_chars=int(os.getenv("TRACE_MAX_PAYLOAD_CHARS", "2000"))
+            )
         
         if self.hf_client:
-            print("[OK] HuggingFace API configured (Qwen2.5-VL-7B-Instruct)")
+            startup_log("[OK] HuggingFace API configured (Qwen2.5-VL-7B-Instruct)")
         else:
-            print("[WARNING] HuggingFace token not configured")
+            startup_log("[WARNING] HuggingFace token not configured")
         
         if self.groq_client:
-            print("[OK] Groq API configured (Qwen-2.5-32b)")
+            startup_log("[OK] Groq API configured (Qwen-2.5-32b)")
         else:
-            print("[WARNING] Groq API key not configured")
+            startup_log("[WARNING] Groq API key not configured")
         
-        print(f"[OK] Ollama configured (host={self.ollama_host}, model={self.ollama_model})")
+        if not self.ollama_provider:
+            startup_log("[WARNING] Ollama disabled (OLLAMA_ENABLED=false)")
+        elif self.ollama_provider.ping():
+            startup_log(f"[OK] Ollama reachable (host={self.ollama_host}, model={self.ollama_model})")
+        else:
+            self.router.mark_unhealthy(self.ollama_provider, "Not reachable at startup or model not pulled")
+            startup_log(f"[WARNING] Ollama not reachable at {self.ollama_host} or model {self.ollama_model} not pulled")
     
-    def preprocess_image(self, image_path: str) -> Image.Image:
-        """Enhance image quality for better OCR accuracy"""
-        img = Image.open(image_path)
-        
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Enhance contrast
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(1.5)
-        
-        # Enhance sharpness
-        enhancer = ImageEnhance.Sharpness(img)
-        img = enhancer.enhance(1.3)
-        
-        # Apply slight denoising
-        img = img.filter(ImageFilter.MedianFilter(size=3))
-        
-        # Resize if too small (minimum 512px on longest side for better detail)
-        width, height = img.size
-        min_size = 512
-        if max(width, height) < min_size:
-            scale = min_size / max(width, height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
+    def preprocess_image(self, image: ImageSource) -> Image.Image:
+        """Enhance image quality for better OCR accuracy and scale it to the model's input size"""
+        img = self.preprocessor.load(read_image_bytes(image))
+        img, _ = self.preprocessor.enhance(img)
         return img
     
-    def encode_image(self, image_path: str) -> str:
+    def encode_image(self, image: ImageSource) -> str:
         """Encode image to base64, with optional preprocessing"""
+        return self.prepare_image(image)["image_b64"]
+    
+    def prepare_image(
+        self,
+        image: ImageSource,
+        image_hash: Optional[str] = None,
+        timer: Optional[StageTimer] = None
+    ) -> Dict[str, Any]:
+        """Preprocess and base64-encode an image once, memoized by content hash.
+        
+        Every provider consumes this payload, so retries, consensus passes and
+        failovers for the same image never decode, filter or re-encode it again.
+        """
+        image_bytes = read_image_bytes(image)
+        signature = self.preprocessor.signature if self.enable_preprocessing else "raw"
+        key = f"{image_hash or content_hash(image_bytes)}|{signature}"
+        prepared = self.encodings.get(key)
+        if prepared is not None:
+            return prepared
+        
+        timer = timer or StageTimer()
+        encoded, mime_type, stats = image_bytes, _sniff_mime_type(image_bytes), None
         if self.enable_preprocessing:
             try:
-                img = self.preprocess_image(image_path)
-                buffer = io.BytesIO()
-                img.save(buffer, format='JPEG', quality=95)
-                image_bytes = buffer.getvalue()
+                encoded, mime_type, stats = self.preprocessor.process(image_bytes, timer)
+                print(
+                    f"[INFO] Preprocessed image {stats['original_size']} -> {stats['output_size']}: "
+                    f"{stats['original_bytes']} -> {stats['output_bytes']} bytes "
+                    f"(saved {stats['bytes_saved']}, {stats['elapsed_ms']}ms)"
+                )
             except Exception as e:
                 print(f"[WARNING] Image preprocessing failed, using original: {e}")
-                with open(image_path, "rb") as image_file:
-                    image_bytes = image_file.read()
-        else:
-            with open(image_path, "rb") as image_file:
-                image_bytes = image_file.read()
         
-        return base64.b64encode(image_bytes).decode('utf-8')
+        with timer.stage("encode"):
+            image_b64 = base64.standard_b64encode(encoded).decode("utf-8")
+        metrics.observe("handwriting_payload_bytes", len(image_b64), kind="model_payload")
+        prepared = {"image_b64": image_b64, "mime_type": mime_type, "stats": stats}
+        self.encodings.set(key, prepared, len(image_b64))
+        return prepared
     
-    def extract_handwriting(self, image_path: str, filename: str) -> Dict[str, Any]:
-        # Prefer HuggingFace for vision tasks (supports images)
-        # Fall back to Groq if HuggingFace is not available (though Groq doesn't support vision)
-        if self.hf_client:
-            return self.extract_handwriting_huggingface(image_path, filename)
+    def extract_handwriting(
+        self,
+        image: ImageSource,
+        filename: str,
+        schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Extract handwriting, serving repeat documents from the result cache.
+        
+        Identical images extracted concurrently share one extraction. The result is
+        validated against ``schema`` (or EXTRACTION_SCHEMA_FILE) when given.
+        """
+        image_bytes = read_image_bytes(image)
+        image_hash = content_hash(image_bytes)
+        key = make_cache_key(image_hash, self.active_model_id(), self.prompt_version())
+        if not self.inflight:
+            return self._validate(self._extract_and_store(key, image_bytes, filename, image_hash), schema)
+        
+        result, shared = self.inflight.do(key, self._extract_and_store, key, image_bytes, filename, image_hash)
+        metrics.inc("handwriting_inflight_requests_total", role="coalesced" if shared else "leader")
+        # Every caller gets its own copy: validation and the filename are per request
+        result = dict(result, filename=filename)
+        if shared:
+            result["coalesced"] = True
+        return self._validate(result, schema)
+    
+    def _extract_and_store(self, key: str, image_bytes: bytes, filename: str, image_hash: str) -> Dict[str, Any]:
+        if not self.cache:
+            return self._extract_uncached(image_bytes, filename, image_hash)
+        cached = self._cached_result(key, filename)
+        if cached is not None:
+            return cached
+        result = self._extract_uncached(image_bytes, filename, image_hash)
+        # Stored before the in-flight call is released, so a caller arriving just after it hits the cache
+        self._store_result(key, result)
+        return result
+    
+    def _validate(self, result: Dict[str, Any], schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Attach schema validation errors; validation is cheap, so cached results are re-checked per caller"""
+        schema = schema or self.extraction_schema
+        if schema is not None and result["success"]:
+            errors = validate_schema(result["extracted_data"], schema)
+            result["validation"] = {"valid": not errors, "errors": errors}
+        return result
+    
+    def extract_handwriting_stream(self, image: ImageSource, filename: str) -> Iterator[Dict[str, Any]]:
+        """Stream an extraction as events: model tokens, each top-level field as it closes, then the result.
+        
+        Pages matching a form template take the template path (no tokens, fields once
+        done), so they get, and cache, the same result as a non-streamed upload.
+        Other pages stream a single sample; with consensus on, that answer is cached
+        under its own key so /upload never serves it in place of a voted result.
+        """
+        image_bytes = read_image_bytes(image)
+        image_hash = content_hash(image_bytes)
+        key = single_key = None
+        if self.cache:
+            key = make_cache_key(image_hash, self.active_model_id(), self.prompt_version())
+            single_key = make_cache_key(image_hash, self.active_model_id(), f"{self.prompt_version()}|single") if self.use_consensus else key
+        
+        # A voted result is at least as good as a single sample, so it is preferred
+        cached = self._cached_result(key, filename) if key else None
+        if cached is None and single_key != key:
+            cached = self._cached_result(single_key, filename)
+        if cached is not None:
+            yield from self._result_events(self._validate(cached))
+            return
+        
+        timer = StageTimer()
+        page = self._classify_page(image_bytes, timer)
+        if page and page["kind"] == BLANK:
+            yield {"type": "result", "result": self._blank_result(filename, page, timer)}
+            return
+        
+        if not self.router.providers:
+            yield {"type": "result", "result": self.extract_handwriting_groq(image_bytes, filename)}
+            return
+        
+        crops, template = self._match_template(image_bytes, timer)
+        if crops:
+            result = self._extract_with_providers(
+                image_bytes, filename, image_hash=image_hash, timer=timer, page=page, matched=(crops, template)
+            )
+            if key:
+                self._store_result(key, result)
+            yield from self._result_events(self._validate(result))
+            return
+        
+        try:
+            prepared = self.prepare_image(image_bytes, image_hash, timer)
+            parser = IncrementalJSONParser()
+            with timer.stage("model_call"):
+                chunks, provider = self.router.stream(EXTRACTION_PROMPT, prepared["image_b64"], prepared["mime_type"])
+                for chunk in chunks:
+                    yield {"type": "token", "text": chunk}
+                    for field, value in parser.feed(chunk):
+                        yield {"type": "field", "key": field, "value": value}
+            
+            with timer.stage("parse"):
+                structured_data, parsing = self._parse_json_response(parser.text)
+            result = self._validate({
+                "success": True,
+                "filename": filename,
+                "extracted_data": structured_data,
+                "message": f"Handwriting extracted successfully using {provider.label}",
+                "preprocessing": prepared["stats"],
+                "parsing": parsing,
+                "page": page,
+                "timings_ms": timer.durations()
+            })
+            self._record(f"{provider.trace_name}_stream", filename, result, timer, provider)
+        except Exception as e:
+            result = {
+                "success": False,
+                "filename": filename,
+                "error": str(e),
+                "message": "Failed to extract handwriting"
+            }
+            self._record("handwriting_extraction_error", filename, result, timer, error=e)
+        
+        if single_key:
+            self._store_result(single_key, result)
+        yield {"type": "result", "result": result}
+    
+    def _result_events(self, result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Stream events for a result that was not produced token by token"""
+        if result["success"] and isinstance(result["extracted_data"], dict):
+            for field, value in result["extracted_data"].items():
+                yield {"type": "field", "key": field, "value": value}
+        yield {"type": "result", "result": result}
+    
+    def _cached_result(self, key: str, filename: str) -> Optional[Dict[str, Any]]:
+        cached = self.cache.get(key)
+        metrics.inc("handwriting_cache_requests_total", result="miss" if cached is None else "hit")
+        if cached is None:
+            return None
+        return {
+            "success": True,
+            "filename": filename,
+            "extracted_data": cached["extracted_data"],
+            "message": cached["message"],
+            "cached": True
+        }
+    
+    def _store_result(self, key: str, result: Dict[str, Any]):
+        # Skipped pages are not cached: the gate is cheap and its thresholds may be retuned.
+        # Nor are replies that never parsed into JSON, so a re-upload gets another try at the model
+        if result.get("parsing", {}).get("recovered") is False:
+            return
+        if result["success"] and not result.get("skipped"):
+            self.cache.set(key, {
+                "extracted_data": result["extracted_data"],
+                "message": result["message"]
+            })
+    
+    def active_model_id(self) -> str:
+        """Identifier of the models that may serve the next extraction"""
+        return self.router.model_id
+    
+    def prompt_version(self) -> str:
+        """Prompt version for cache keys; template edits change what is extracted, so they count too"""
+        if self.templates and self.templates.templates:
+            return f"{PROMPT_VERSION}|templates:{self.templates.version}"
+        return PROMPT_VERSION
+    
+    def _extract_uncached(self, image_bytes: bytes, filename: str, image_hash: Optional[str] = None) -> Dict[str, Any]:
+        timer = StageTimer()
+        page = self._classify_page(image_bytes, timer)
+        if page and page["kind"] == BLANK:
+            return self._blank_result(filename, page, timer)
+        
+        # Route between the vision providers (local Ollama, remote HuggingFace) with failover
+        if self.router.providers:
+            return self._extract_with_providers(image_bytes, filename, image_hash=image_hash, timer=timer, page=page)
         else:
             # Try Groq (will fall back to HuggingFace if available, or return error)
-            return self.extract_handwriting_groq(image_path, filename)
+            return self.extract_handwriting_groq(image_bytes, filename)
+    
+    def _classify_page(self, image_bytes: bytes, timer: StageTimer) -> Optional[Dict[str, Any]]:
+        """Page gate verdict, or None when the gate is disabled, cannot read the image or declines to judge it"""
+        if not self.page_gate:
+            return None
+        try:
+            with timer.stage("page_gate"):
+                page = self.page_gate.classify(image_bytes)
+        except Exception as e:
+            print(f"[WARNING] Page gate failed, extracting anyway: {type(e).__name__}: {e}")
+            return None
+        if page is None:
+            return None
+        metrics.inc("handwriting_page_gate_total", kind=page["kind"])
+        return page
     
-    def extract_handwriting_huggingface(self, image_path: str, filename: str) -> Dict[str, Any]:
+    def _blank_result(self, filename: str, page: Dict[str, Any], timer: StageTimer) -> Dict[str, Any]:
+        print(f"[INFO] Skipping blank page {filename} (faint ink density {page['faint_ink_density']})")
+        result = {
+            "success": True,
+            "filename": filename,
+            "extracted_data": {},
+            "message": "Blank page skipped; no model call made",
+            "page": page,
+            "skipped": True,
+            "timings_ms": timer.durations()
+        }
+        self._record("blank_page_skipped", filename, result, timer)
+        return result
+    
+    def extract_handwriting_huggingface(self, image: ImageSource, filename: str) -> Dict[str, Any]:
         """Extract handwriting using HuggingFace Qwen2.5-VL model via OpenAI API"""
-        if not self.hf_client:
+        if not self.hf_provider:
             return {
                 "success": False,
                 "filename": filename,
                 "error": "HuggingFace token not configured",
                 "message": "HF_TOKEN environment variable not set"
             }
+        return self._extract_with_providers(image, filename, only=[self.hf_provider])
+    
+    def extract_handwriting_ollama(self, image: ImageSource, filename: str) -> Dict[str, Any]:
+        """Extract handwriting using the local Ollama vision model"""
+        if not self.ollama_provider:
+            return {
+                "success": False,
+                "filename": filename,
+                "error": "Ollama disabled",
+                "message": "OLLAMA_ENABLED is set to false"
+            }
+        return self._extract_with_providers(image, filename, only=[self.ollama_provider])
+    
+    def _extract_with_providers(
+        self,
+        image: ImageSource,
+        filename: str,
+        only: Optional[List[VisionProvider]] = None,
+        image_hash: Optional[str] = None,
+        timer: Optional[StageTimer] = None,
+        page: Optional[Dict[str, Any]] = None,
+        matched: Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]] = None
+    ) -> Dict[str, Any]:
+        """Run the extraction prompt through the provider router and parse the JSON reply.
         
+        Pages matching a known form template only send their field regions;
+        anything else goes to the model as a full page. Pages the gate judged
+        printed take a single sample instead of a consensus vote. ``matched`` is
+        a template match the caller already made.
+        """
+        timer = timer or StageTimer()
         try:
-            with open(image_path, "rb") as image_file:
-                image_data = base64.standard_b64encode(image_file.read()).decode("utf-8")
-            
-            prompt = """You are an expert OCR system specialized in reading handwritten text with maximum accuracy.
-
-Analyze this handwritten document with extreme care and extract ALL the information you can see.
-
-CRITICAL INSTRUCTIONS FOR MAXIMUM ACCURACY:
-1. Read each character and word carefully - examine the image in detail
-2. DO NOT assume or hallucinate any fields - only extract what is clearly visible
-3. Pay special attention to:
-   - Numbers (phone numbers, dates, policy numbers, etc.) - read each digit precisely
-   - Names - read each letter carefully, including capitalization
-   - Addresses - read street names, numbers, and city names accurately
-   - Email addresses - verify @ symbols and domain names
-4. For partially readable text, extract what you can see clearly, even if incomplete
-5. If text is completely illegible or blank, mark it as "unreadable" (not null)
-6. Return the data as clean, structured JSON with proper nesting
-7. Create field names based on actual labels, headings, and form structure you see
-8. Preserve the exact logical structure and grouping of information
-9. Be extremely precise with values - read numbers and text character by character
-10. Double-check your extraction before returning the JSON
-
-IMPORTANT: Read slowly and carefully. Accuracy is more important than speed.
-Return ONLY valid JSON with no additional text, markdown, or explanation before or after.
-The JSON should have descriptive keys based on the actual content structure."""
-            
-            completion = self.hf_client.chat.completions.create(
-                model="Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-            )
-            
-            extracted_text = completion.choices[0].message.content
-            structured_data = self._parse_json_response(extracted_text)
+            image_bytes = read_image_bytes(image)
+            crops, template = matched if matched is not None else self._match_template(image_bytes, timer)
+            consensus = None
+            if crops and self.template_mode == "fields":
+                structured_data, provider, parsing = self._extract_fields(crops, only, timer)
+                stats = None
+            else:
+                if crops:
+                    prepared = self.prepare_image(tile_fields(crops), timer=timer)
+                    prompt = TEMPLATE_PROMPT.format(fields=json.dumps(list(crops)))
+                else:
+                    prepared = self.prepare_image(image_bytes, image_hash, timer)
+                    prompt = EXTRACTION_PROMPT
+                if self.use_consensus and not (page and page["kind"] == PRINTED):
+                    structured_data, provider, parsing, consensus = self._extract_consensus(prepared, only, timer, prompt)
+                else:
+                    structured_data, provider, parsing = self._extract_sample(prepared, only, timer, prompt)
+                stats = prepared["stats"]
+            if crops and isinstance(structured_data, dict) and parsing["recovered"]:
+                # Keep the answer to the template's fields, in template order
+                structured_data = {field: structured_data.get(field, "unreadable") for field in crops}
             
             result = {
                 "success": True,
                 "filename": filename,
                 "extracted_data": structured_data,
-                "message": "Handwriting extracted successfully using HuggingFace"
+                "message": f"Handwriting extracted successfully using {provider.label}",
+                "preprocessing": stats,
+                "parsing": parsing,
+                "consensus": consensus,
+                "template": template,
+                "page": page,
+                "timings_ms": timer.durations()
             }
-            
-            if self.langfuse:
-                try:
-                    trace = self.langfuse.trace(name="handwriting_extraction_hf")  # type: ignore
-                    trace.update(input={"filename": filename}, output=result)
-                except Exception as e:
-                    print(f"[WARNING] Langfuse trace failed: {e}")
-            
+            self._record(provider.trace_name, filename, result, timer, provider)
             return result
             
         except Exception as e:
@@ -225,19 +660,176 @@ The JSON should have descriptive keys based on the actual content structure."""
                 "success": False,
                 "filename": filename,
                 "error": str(e),
-                "message": "Failed to extract handwriting using HuggingFace"
+                "message": "Failed to extract handwriting"
             }
-            
-            if self.langfuse:
-                try:
-                    trace = self.langfuse.trace(name="handwriting_extraction_hf_error")  # type: ignore
-                    trace.update(input={"filename": filename}, output=error_result)
-                except:
-                    pass
-            
+            self._record("handwriting_extraction_error", filename, error_result, timer, error=e)
             return error_result
     
-    def extract_handwriting_groq(self, image_path: str, filename: str) -> Dict[str, Any]:
+    def _match_template(self, image_bytes: bytes, timer: StageTimer) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Field crops and a template summary for a page matching a known form, else ({}, None)"""
+        if not self.templates or not self.templates.templates:
+            return {}, None
+        try:
+            with timer.stage("template_match"):
+                match = self.templates.match(image_bytes)
+            if match is None:
+                metrics.inc("handwriting_template_matches_total", template="none")
+                return {}, None
+            with timer.stage("crop"):
+                crops = self.templates.crop_fields(image_bytes, match)
+        except Exception as e:
+            # Alignment is an optimization; a page it cannot handle still gets a full-page extraction
+            print(f"[WARNING] Template matching failed, extracting full page: {type(e).__name__}: {e}")
+            return {}, None
+        
+        name = match["template"].name
+        metrics.inc("handwriting_template_matches_total", template=name)
+        print(f"[INFO] Matched form template '{name}' (score {match['score']:.2f}, skew {match['skew']:+.1f} deg)")
+        return crops, {
+            "name": name,
+            "score": round(match["score"], 3),
+            "skew_degrees": match["skew"],
+            "offset": [round(offset, 4) for offset in match["offset"]],
+            "fields": len(crops),
+            "mode": self.template_mode
+        }
+    
+    def _extract_fields(
+        self,
+        crops: Dict[str, Image.Image],
+        only: Optional[List[VisionProvider]],
+        timer: StageTimer
+    ) -> Tuple[Dict[str, Any], VisionProvider, Dict[str, Any]]:
+        """One concurrent model call per field crop, each with a prompt naming its field"""
+        futures = {
+            field: self._consensus_executor.submit(
+                contextvars.copy_context().run,
+                self._extract_sample,
+                self.prepare_image(encode_crop(crop), timer=timer),
+                only,
+                timer,
+                FIELD_PROMPT.format(field=field)
+            )
+            for field, crop in crops.items()
+        }
+        structured_data: Dict[str, Any] = {}
+        repairs = set()
+        provider = None
+        for field, future in futures.items():
+            data, provider, report = future.result()
+            structured_data[field] = data.get("value", "unreadable") if isinstance(data, dict) else data
+            repairs.update(report["repairs"])
+        return structured_data, provider, {"recovered": True, "repairs": sorted(repairs)}
+    
+    def _record(
+        self,
+        name: str,
+        filename: str,
+        result: Dict[str, Any],
+        timer: Optional[StageTimer] = None,
+        provider: Optional[VisionProvider] = None,
+        error: Optional[Exception] = None
+    ):
+        """Record stage metrics and hand a trace to the background exporter; never blocks the request"""
+        provider_name = provider.name if provider else "none"
+        metrics.inc("handwriting_extractions_total", provider=provider_name, outcome="success" if result["success"] else "error")
+        if error is not None:
+            metrics.inc("handwriting_errors_total", type=type(error).__name__)
+        if timer:
+            metrics.observe_spans(timer.spans)
+        
+        if self.tracer:
+            self.tracer.record(
+                name,
+                input={"filename": filename},
+                output=result,
+                spans=timer.spans if timer else None,
+                metadata={"model": provider.model} if provider else None
+            )
+    
+    def shutdown(self):
+        """Flush pending traces and stop background threads"""
+        if self.tracer:
+            self.tracer.close()
+        self._consensus_executor.shutdown(wait=False, cancel_futures=True)
+        self.router.shutdown()
+    
+    def _extract_sample(
+        self,
+        prepared: Dict[str, Any],
+        only: Optional[List[VisionProvider]] = None,
+        timer: Optional[StageTimer] = None,
+        prompt: str = EXTRACTION_PROMPT
+    ) -> Tuple[Dict[str, Any], VisionProvider, Dict[str, Any]]:
+        """One model call on a prepared image: (structured data, provider, parse report)"""
+        timer = timer or StageTimer()
+        with timer.stage("model_call"):
+            extracted_text, provider = self.router.complete(
+                prompt,
+                prepared["image_b64"],
+                prepared["mime_type"],
+                only=only
+            )
+        with timer.stage("parse"):
+            structured_data, parsing = self._parse_json_response(extracted_text)
+        return structured_data, provider, parsing
+    
+    def _extract_consensus(
+        self,
+        prepared: Dict[str, Any],
+        only: Optional[List[VisionProvider]] = None,
+        timer: Optional[StageTimer] = None,
+        prompt: str = EXTRACTION_PROMPT
+    ) -> Tuple[Dict[str, Any], VisionProvider, Dict[str, Any], Dict[str, Any]]:
+        """Run several extractions concurrently and merge them by per-field vote.
+        
+        With early exit, two samples run first and the rest are only requested
+        when those two disagree; otherwise all samples run at once.
+        """
+        first_wave = 2 if self.consensus_early_exit else self.consensus_samples
+        futures = [
+            self._consensus_executor.submit(contextvars.copy_context().run, self._extract_sample, prepared, only, timer, prompt)
+            for _ in range(first_wave)
+        ]
+        samples, errors = self._collect_samples(futures)
+        
+        agreed_early = self.consensus_early_exit and len(samples) == 2 and samples[0][0] == samples[1][0]
+        if not agreed_early and first_wave < self.consensus_samples:
+            futures = [
+                self._consensus_executor.submit(contextvars.copy_context().run, self._extract_sample, prepared, only, timer, prompt)
+                for _ in range(self.consensus_samples - first_wave)
+            ]
+            more_samples, more_errors = self._collect_samples(futures)
+            samples += more_samples
+            errors += more_errors
+        
+        if not samples:
+            raise errors[0] if errors else RuntimeError("No consensus samples completed")
+        
+        # Unparseable replies only count when nothing parsed
+        parsed = [sample for sample in samples if sample[2]["recovered"]] or samples
+        merged = self._merge_extractions(*(data for data, _, _ in parsed))
+        parsing = {
+            "recovered": parsed[0][2]["recovered"],
+            "repairs": sorted({repair for _, _, report in samples for repair in report["repairs"]})
+        }
+        return merged, parsed[0][1], parsing, {
+            "samples": len(samples),
+            "failed_samples": len(errors),
+            "agreed_early": agreed_early,
+            "providers": [provider.name for _, provider, _ in samples]
+        }
+    
+    def _collect_samples(self, futures) -> Tuple[List[Tuple[Dict[str, Any], VisionProvider, Dict[str, Any]]], List[Exception]]:
+        samples, errors = [], []
+        for future in futures:
+            try:
+                samples.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        return samples, errors
+    
+    def extract_handwriting_groq(self, image: ImageSource, filename: str) -> Dict[str, Any]:
         """Extract handwriting using Groq API with Qwen-2.5-32b model"""
         if not self.groq_client:
             return {
@@ -248,40 +840,13 @@ The JSON should have descriptive keys based on the actual content structure."""
             }
         
         try:
-            with open(image_path, "rb") as image_file:
-                image_data = base64.standard_b64encode(image_file.read()).decode("utf-8")
-            
-            prompt = """You are an expert OCR system specialized in reading handwritten text with maximum accuracy.
-
-Analyze this handwritten document with extreme care and extract ALL the information you can see.
-
-CRITICAL INSTRUCTIONS FOR MAXIMUM ACCURACY:
-1. Read each character and word carefully - examine the image in detail
-2. DO NOT assume or hallucinate any fields - only extract what is clearly visible
-3. Pay special attention to:
-   - Numbers (phone numbers, dates, policy numbers, etc.) - read each digit precisely
-   - Names - read each letter carefully, including capitalization
-   - Addresses - read street names, numbers, and city names accurately
-   - Email addresses - verify @ symbols and domain names
-4. For partially readable text, extract what you can see clearly, even if incomplete
-5. If text is completely illegible or blank, mark it as "unreadable" (not null)
-6. Return the data as clean, structured JSON with proper nesting
-7. Create field names based on actual labels, headings, and form structure you see
-8. Preserve the exact logical structure and grouping of information
-9. Be extremely precise with values - read numbers and text character by character
-10. Double-check your extraction before returning the JSON
-
-IMPORTANT: Read slowly and carefully. Accuracy is more important than speed.
-Return ONLY valid JSON with no additional text, markdown, or explanation before or after.
-The JSON should have descriptive keys based on the actual content structure."""
-            
             # Note: Groq's text models (like qwen-2.5-32b) don't support vision/image inputs.
             # We need to fall back to HuggingFace which supports vision models.
             
             # Check if HuggingFace is available as fallback
             if self.hf_client:
                 print("[INFO] Groq doesn't support vision, falling back to HuggingFace vision model")
-                return self.extract_handwriting_huggingface(image_path, filename)
+                return self.extract_handwriting_huggingface(image, filename)
             
             # If no fallback, return error
             return {
@@ -305,62 +870,58 @@ The JSON should have descriptive keys based on the actual content structure."""
                 "message": "Failed to extract handwriting using Groq API"
             }
             
-            if self.langfuse:
-                try:
-                    trace = self.langfuse.trace(name="handwriting_extraction_groq_error")  # type: ignore
-                    trace.update(input={"filename": filename}, output=error_result)
-                except:
-                    pass
-            
+            self._record("handwriting_extraction_groq_error", filename, error_result, error=e)
             return error_result
     
-    def _parse_json_response(self, text: str) -> Dict[str, Any]:
-        """Parse JSON from model response, handling markdown code blocks"""
-        extracted_text = text.strip()
-        
-        # Remove markdown code blocks
-        if extracted_text.startswith("```json"):
-            extracted_text = extracted_text[7:]
-        if extracted_text.startswith("```"):
-            extracted_text = extracted_text[3:]
-        if extracted_text.endswith("```"):
-            extracted_text = extracted_text[:-3]
-        extracted_text = extracted_text.strip()
-        
-        try:
-            return json.loads(extracted_text)
-        except json.JSONDecodeError:
-            return {"raw_text": extracted_text}
+    def _parse_json_response(self, text: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Tolerantly parse the model reply into (data, report of applied repairs)"""
+        data, report = parse_model_json(text)
+        for repair in report["repairs"]:
+            metrics.inc("handwriting_json_repairs_total", repair=repair)
+        if not report["recovered"]:
+            metrics.inc("handwriting_json_unrecovered_total")
+            print(f"[WARNING] No JSON found in model reply ({len(text)} chars); returning raw text")
+        return data, report
     
-    def _merge_extractions(self, data1: Dict[str, Any], data2: Dict[str, Any]) -> Dict[str, Any]:
-        """Merge two extraction results, preferring more complete/accurate values"""
-        def merge_dicts(d1: Dict, d2: Dict) -> Dict:
+    def _merge_extractions(self, *extractions: Any) -> Any:
+        """Merge N extraction results field by field, voting and preferring more complete values.
+        
+        Replies that are not all objects (a top-level array or scalar) are voted on as a whole.
+        """
+        def is_blank(value: Any) -> bool:
+            return value is None or value == "unreadable"
+        
+        def vote(values: List[Any]) -> Any:
+            readable = [value for value in values if not is_blank(value)]
+            if not readable:
+                # Nobody could read it - keep "unreadable" over a missing value
+                return next((value for value in values if value is not None), None)
+            
+            if all(isinstance(value, dict) for value in readable):
+                # All readable values are dicts - merge recursively
+                return merge_dicts(readable)
+            
+            # Majority vote; ties go to the longer/more complete string, then to the earliest sample
+            tallies: Dict[str, List[Any]] = {}
+            for value in readable:
+                tallies.setdefault(json.dumps(value, sort_keys=True), []).append(value)
+            top = max(len(group) for group in tallies.values())
+            candidates = [group[0] for group in tallies.values() if len(group) == top]
+            if all(isinstance(value, str) for value in candidates):
+                return max(candidates, key=len)
+            return candidates[0]
+        
+        def merge_dicts(dicts: List[Dict]) -> Dict:
             result = {}
-            all_keys = set(d1.keys()) | set(d2.keys())
+            all_keys: Dict[str, None] = {}
+            for d in dicts:
+                all_keys.update(dict.fromkeys(d.keys()))
             
             for key in all_keys:
-                val1 = d1.get(key)
-                val2 = d2.get(key)
-                
-                if val1 == val2:
-                    # Both agree - use the value
-                    result[key] = val1
-                elif isinstance(val1, dict) and isinstance(val2, dict):
-                    # Both are dicts - merge recursively
-                    result[key] = merge_dicts(val1, val2)
-                elif val1 is None or val1 == "unreadable":
-                    # Prefer val2 if val1 is unreadable
-                    result[key] = val2
-                elif val2 is None or val2 == "unreadable":
-                    # Prefer val1 if val2 is unreadable
-                    result[key] = val1
-                elif isinstance(val1, str) and isinstance(val2, str):
-                    # Both have values - prefer longer/more complete one
-                    result[key] = val1 if len(val1) >= len(val2) else val2
-                else:
-                    # Default to first value
-                    result[key] = val1 if val1 is not None else val2
+                result[key] = vote([d[key] for d in dicts if key in d])
             
             return result
         
-        return merge_dicts(data1, data2)
+        if all(isinstance(extraction, dict) for extraction in extractions):
+            return merge_dicts(list(extractions))
+        return vote(list(extractions))
@@ -0,0 +1,157 @@
+import io
+import json
+import random
+from pathlib import Path
+from typing import Dict, List, Tuple
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+# Name -> (width, height) in pixels
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "small": (850, 1100),     # letter page at 100 DPI / downscaled phone shot
+    "scan": (2550, 3300),     # letter page scanned at 300 DPI
+    "phone": (3024, 4032)     # 12MP phone camera photo
+}
+
+FIELDS = ["Name", "Date of Birth", "Phone", "Email", "Street", "City", "ZIP", "Notes"]
+
+
+def _scribble(draw: ImageDraw.ImageDraw, rng: random.Random, x: int, y: int, width: int, height: int, stroke: int, pencil: bool = False):
+    """Cursive-looking polyline: loops of random height drifting along a baseline, in pen or light pencil"""
+    if pencil:
+        ink = (rng.randint(175, 200),) * 3
+    else:
+        ink = (rng.randint(10, 40), rng.randint(20, 60), rng.randint(90, 160))
+    cursor = x
+    while cursor < x + width:
+        word = rng.randint(3, 9)
+        points: List[Tuple[float, float]] = []
+        for _ in range(word * 4):
+            cursor += rng.uniform(0.15, 0.35) * height
+            points.append((cursor, y + rng.uniform(-0.45, 0.45) * height))
+        draw.line(points, fill=ink, width=stroke, joint="curve")
+        cursor += rng.uniform(0.6, 1.2) * height
+
+
+def _field_row(index: int) -> float:
+    """Baseline of field ``index`` in units of height / 40"""
+    return 5 + index * 3.5
+
+
+def generate_form(resolution: str = "scan", seed: int = 0, fmt: str = "JPEG", quality: int = 90, blank: bool = False) -> bytes:
+    """Render a synthetic handwritten intake form and return the encoded image bytes.
+
+    ``blank=True`` leaves the fields unfilled, which makes a template reference image.
+    """
+    rng = random.Random(seed)
+    img, unit, font = _new_page(resolution, rng)
+    width = img.width
+    draw = ImageDraw.Draw(img)
+
+    draw.text((width * 0.08, unit * 2), "PATIENT INTAKE FORM", fill=(30, 30, 30), font=font)
+    for index, field in enumerate(FIELDS):
+        y = unit * _field_row(index)
+        label_x, line_x = width * 0.08, width * 0.32
+        draw.text((label_x, y - unit * 0.6), f"{field}:", fill=(40, 40, 40), font=font)
+        draw.line([(line_x, y + unit * 0.5), (width * 0.92, y + unit * 0.5)], fill=(120, 120, 120), width=max(1, int(unit / 20)))
+        if not blank:
+            _scribble(draw, rng, int(line_x + unit * 0.3), int(y), int(width * rng.uniform(0.2, 0.55)), int(unit * 0.8), max(2, int(unit / 10)))
+
+    return _capture(img, unit, fmt, quality)
+
+
+def _new_page(resolution: str, rng: random.Random) -> Tuple[Image.Image, float, ImageFont.ImageFont]:
+    """Blank sheet of off-white paper, its layout unit (height / 40) and a body font"""
+    width, height = RESOLUTIONS[resolution]
+    paper = tuple(rng.randint(236, 250) for _ in range(3))
+    unit = height / 40
+    try:
+        font = ImageFont.load_default(size=int(unit * 0.8))
+    except TypeError:
+        font = ImageFont.load_default()
+    return Image.new("RGB", (width, height), paper), unit, font
+
+
+def _capture(img: Image.Image, unit: float, fmt: str, quality: int) -> bytes:
+    """Camera-like imperfections (slight blur, sensor noise, a lighting gradient), then encode"""
+    width, height = img.size
+    img = img.filter(ImageFilter.GaussianBlur(radius=max(0.5, unit / 60)))
+    noise = Image.effect_noise((width, height), 12).convert("RGB")
+    img = Image.blend(img, noise, 0.06)
+    shade = Image.linear_gradient("L").resize((width, height)).point(lambda value: 255 - value // 6)
+    img = Image.composite(img, Image.new("RGB", (width, height), (180, 180, 180)), shade)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def generate_note(resolution: str = "scan", seed: int = 0, lines: int = 12, fmt: str = "JPEG", quality: int = 90, pencil: bool = False) -> bytes:
+    """Free-form handwritten page with ``lines`` lines of cursive and no printed text; ``pencil`` writes thin, light strokes"""
+    rng = random.Random(seed)
+    img, unit, _ = _new_page(resolution, rng)
+    draw = ImageDraw.Draw(img)
+    for line in range(lines):
+        y = unit * (4 + line * 2.2)
+        stroke = max(2, int(unit / 25)) if pencil else max(2, int(unit / 10))
+        _scribble(draw, rng, int(img.width * 0.1), int(y), int(img.width * rng.uniform(0.3, 0.8)), int(unit * 0.8), stroke, pencil)
+    return _capture(img, unit, fmt, quality)
+
+
+def generate_blank(resolution: str = "scan", seed: int = 0, bleed: bool = False, fmt: str = "JPEG", quality: int = 90) -> bytes:
+    """Empty page: a separator sheet, or with ``bleed`` the back of a page with faint show-through and specks"""
+    rng = random.Random(seed)
+    img, unit, font = _new_page(resolution, rng)
+    if bleed:
+        ghost = Image.new("RGB", img.size, img.getpixel((0, 0)))
+        draw = ImageDraw.Draw(ghost)
+        faint = tuple(channel - 10 for channel in img.getpixel((0, 0)))
+        for line in range(20):
+            draw.text((img.width * 0.1, unit * (3 + line * 1.6)), "x" * rng.randint(20, 60), fill=faint, font=font)
+        img = ghost.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        draw = ImageDraw.Draw(img)
+        for _ in range(30):
+            x, y = rng.uniform(0, img.width), rng.uniform(0, img.height)
+            draw.ellipse([x, y, x + unit / 15, y + unit / 15], fill=(90, 90, 90))
+    return _capture(img, unit, fmt, quality)
+
+
+WORDS = (
+    "the of and to in is for that with as on by this be are from at or an it which policy claim "
+    "member coverage period payment account statement please contact service number date total"
+).split()
+
+
+def generate_printed(resolution: str = "scan", seed: int = 0, fmt: str = "JPEG", quality: int = 90) -> bytes:
+    """Typed page (letter or cover sheet): a heading and justified-looking paragraphs of printed text"""
+    rng = random.Random(seed)
+    img, unit, font = _new_page(resolution, rng)
+    draw = ImageDraw.Draw(img)
+    draw.text((img.width * 0.1, unit * 2), "ACCOUNT STATEMENT", fill=(20, 20, 20), font=font)
+    y = unit * 4.5
+    while y < unit * 36:
+        for _ in range(rng.randint(3, 7)):
+            words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 14)))
+            draw.text((img.width * 0.1, y), words, fill=(25, 25, 25), font=font)
+            y += unit * 1.3
+        y += unit * 1.2
+    return _capture(img, unit, fmt, quality)
+
+
+def generate_forms(resolution: str, count: int, fmt: str = "JPEG") -> List[bytes]:
+    """``count`` distinct forms, so content-hash caches do not turn the run into a cache benchmark"""
+    return [generate_form(resolution, seed, fmt) for seed in range(count)]
+
+
+def write_template(directory: str, resolution: str = "scan", name: str = "intake_form") -> Path:
+    """Write a blank reference form and its field boxes as a form template (see ``templates.py``)"""
+    target = Path(directory)
+    target.mkdir(parents=True, exist_ok=True)
+    (target / f"{name}.png").write_bytes(generate_form(resolution, seed=0, fmt="PNG", blank=True))
+    fields = {
+        field: [0.3, round((_field_row(index) - 0.9) / 40, 4), 0.93, round((_field_row(index) + 0.9) / 40, 4)]
+        for index, field in enumerate(FIELDS)
+    }
+    spec = {"name": name, "description": "Synthetic patient intake form", "reference": f"{name}.png", "fields": fields}
+    path = target / f"{name}.json"
+    path.write_text(json.dumps(spec, indent=2))
+    return path
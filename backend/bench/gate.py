@@ -0,0 +1,124 @@
+"""Benchmark the local page gate: how many model calls it avoids on a synthetic batch.
+
+The corpus mimics a scanned batch: handwritten forms and notes (some in light
+pencil), printed cover sheets, blank separator pages and the backs of pages (faint show-through and
+dust). Run from ``backend/``::
+
+    python -m bench.gate
+    python -m bench.gate --handwritten 40 --printed 10 --blank 20 --consensus-calls 3
+    python -m bench.gate --printed-max-diagonal 0.28 --output gate_results.json
+
+Without the gate every page costs ``--consensus-calls`` model calls. With it,
+blank pages cost none and printed pages cost one (no consensus vote).
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from bench.forms import RESOLUTIONS, generate_blank, generate_form, generate_note, generate_printed
+from page_gate import BLANK, HANDWRITTEN, PRINTED, PageGate
+
+KINDS = (HANDWRITTEN, PRINTED, BLANK)
+
+
+def build_corpus(resolution: str, handwritten: int, printed: int, blank: int) -> List[Tuple[str, str, bytes]]:
+    """(name, expected kind, image bytes); half the handwritten pages are forms, half free notes of 1-15 lines,
+    every other note in pencil"""
+    corpus = []
+    for seed in range(handwritten):
+        if seed % 4 == 3:
+            corpus.append((f"pencil-{seed}", HANDWRITTEN, generate_note(resolution, seed, lines=1 + seed % 15, pencil=True)))
+        elif seed % 2:
+            corpus.append((f"note-{seed}", HANDWRITTEN, generate_note(resolution, seed, lines=1 + seed % 15)))
+        else:
+            corpus.append((f"form-{seed}", HANDWRITTEN, generate_form(resolution, seed)))
+    for seed in range(printed):
+        if seed % 4 == 3:
+            # An unfilled form is printed matter too
+            corpus.append((f"empty-form-{seed}", PRINTED, generate_form(resolution, seed, blank=True)))
+        else:
+            corpus.append((f"printed-{seed}", PRINTED, generate_printed(resolution, seed)))
+    for seed in range(blank):
+        corpus.append((f"blank-{seed}", BLANK, generate_blank(resolution, seed, bleed=bool(seed % 2))))
+    return corpus
+
+
+def calls_for(kind: str, consensus_calls: int) -> int:
+    return {BLANK: 0, PRINTED: 1}.get(kind, consensus_calls)
+
+
+def evaluate(gate: PageGate, corpus: List[Tuple[str, str, bytes]], consensus_calls: int) -> Dict:
+    confusion = {expected: {kind: 0 for kind in KINDS} for expected in KINDS}
+    latencies = []
+    misclassified = []
+    gated_calls = 0
+    for name, expected, data in corpus:
+        started = time.perf_counter()
+        verdict = gate.classify(data)
+        latencies.append((time.perf_counter() - started) * 1000)
+        confusion[expected][verdict["kind"]] += 1
+        gated_calls += calls_for(verdict["kind"], consensus_calls)
+        if verdict["kind"] != expected:
+            misclassified.append({"name": name, "expected": expected, **verdict})
+
+    baseline_calls = len(corpus) * consensus_calls
+    ordered = sorted(latencies)
+    return {
+        "pages": len(corpus),
+        "confusion": confusion,
+        "accuracy": round(1 - len(misclassified) / len(corpus), 3),
+        # The costly mistake: handwriting dropped without ever reaching the model
+        "handwritten_skipped": confusion[HANDWRITTEN][BLANK],
+        "model_calls_baseline": baseline_calls,
+        "model_calls_gated": gated_calls,
+        "model_calls_avoided": baseline_calls - gated_calls,
+        "avoided_rate": round((baseline_calls - gated_calls) / baseline_calls, 3) if baseline_calls else 0.0,
+        "gate_ms_mean": round(statistics.fmean(latencies), 1),
+        "gate_ms_p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 1),
+        "misclassified": misclassified
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure model calls avoided by the local page gate")
+    parser.add_argument("--resolution", choices=sorted(RESOLUTIONS), default="scan")
+    parser.add_argument("--handwritten", type=int, default=30, help="Handwritten pages in the corpus")
+    parser.add_argument("--printed", type=int, default=8, help="Printed pages in the corpus")
+    parser.add_argument("--blank", type=int, default=12, help="Blank pages in the corpus")
+    parser.add_argument("--consensus-calls", type=int, default=2, help="Model calls a page costs without the gate")
+    parser.add_argument("--blank-max-ink", type=float, default=0.0005)
+    parser.add_argument("--printed-max-diagonal", type=float, default=0.3)
+    parser.add_argument("--ink-contrast", type=float, default=40)
+    parser.add_argument("--blank-contrast", type=float, default=20)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    print(f"[INFO] Generating {args.handwritten + args.printed + args.blank} {args.resolution} pages...")
+    corpus = build_corpus(args.resolution, args.handwritten, args.printed, args.blank)
+    gate = PageGate(args.blank_max_ink, args.printed_max_diagonal, args.ink_contrast, args.blank_contrast)
+    results = evaluate(gate, corpus, args.consensus_calls)
+    results["settings"] = {key: value for key, value in vars(args).items() if key != "output"}
+
+    print(f"{'expected':<12}" + "".join(f"{kind:>12}" for kind in KINDS))
+    for expected in KINDS:
+        print(f"{expected:<12}" + "".join(f"{results['confusion'][expected][kind]:>12}" for kind in KINDS))
+    print(
+        f"accuracy {results['accuracy']:.1%}  handwritten skipped {results['handwritten_skipped']}  "
+        f"gate {results['gate_ms_mean']}ms mean / {results['gate_ms_p95']}ms p95"
+    )
+    print(
+        f"model calls {results['model_calls_baseline']} -> {results['model_calls_gated']} "
+        f"({results['model_calls_avoided']} avoided, {results['avoided_rate']:.1%})"
+    )
+    for miss in results["misclassified"]:
+        print(f"          wrong: {miss['name']} ({miss['expected']} -> {miss['kind']})")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"[OK] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+SAMPLE_EXTRACTION = {
+    "name": "Jane Doe",
+    "date_of_birth": "1987-03-14",
+    "phone": "555-0142",
+    "email": "jane.doe@example.com",
+    "address": {"street": "42 Elm Street", "city": "Springfield", "zip": "49503"},
+    "notes": "Allergic to penicillin"
+}
+
+
+class MockVisionServer:
+    """Local stand-in for the vision providers, so the stack can be load tested without paid models.
+
+    Serves the OpenAI-compatible ``/v1/chat/completions`` API (used by the
+    HuggingFace provider via ``HF_BASE_URL``) and Ollama's ``/api/generate`` and
+    ``/api/tags`` (via ``OLLAMA_HOST``), streaming and non-streaming. Every
+    model call sleeps ``latency`` seconds plus uniform ``jitter`` and fails with
+    HTTP 500 at ``error_rate``.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.5,
+        jitter: float = 0.1,
+        error_rate: float = 0.0,
+        model: str = "bakllava:latest",
+        response: Optional[Dict[str, Any]] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.model = model
+        self.response_text = json.dumps(response or SAMPLE_EXTRACTION)
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockVisionServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-vision", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "errors": self.errors}
+
+    def _simulate_call(self) -> bool:
+        """Sleep for one model call; returns False if this call should fail"""
+        with self._lock:
+            self.calls += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return False
+        return True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/api/tags"):
+                    self._send_json({"models": [{"name": server.model}]})
+                elif self.path.startswith("/v1/models"):
+                    self._send_json({"object": "list", "data": [{"id": server.model, "object": "model"}]})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not server._simulate_call():
+                    self._send_json({"error": "simulated provider failure"}, 500)
+                elif self.path.startswith("/api/generate"):
+                    self._ollama(body)
+                elif self.path.startswith("/v1/chat/completions"):
+                    self._openai(body)
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def _ollama(self, body: Dict[str, Any]):
+                if not body.get("stream"):
+                    self._send_json({"model": server.model, "response": server.response_text, "done": True})
+                    return
+                self._start_stream("application/x-ndjson")
+                for piece in _pieces(server.response_text):
+                    self._write_chunk(json.dumps({"response": piece, "done": False}) + "\n")
+                self._write_chunk(json.dumps({"response": "", "done": True}) + "\n")
+                self._write_chunk("")
+
+            def _openai(self, body: Dict[str, Any]):
+                completion_id = f"chatcmpl-{random.getrandbits(48):x}"
+                if not body.get("stream"):
+                    self._send_json({
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", server.model),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": server.response_text},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                    })
+                    return
+                self._start_stream("text/event-stream")
+                for piece in _pieces(server.response_text):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", server.model),
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self._write_chunk("")
+
+            def _send_json(self, payload: Dict[str, Any], status: int = 200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _start_stream(self, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def _pieces(text: str, size: int = 8):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible / Ollama vision server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Uniform +/- seconds added to each call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 500")
+    args = parser.parse_args()
+
+    server = MockVisionServer(args.host, args.port, args.latency, args.jitter, args.error_rate).start()
+    print(f"[OK] Mock vision server on {server.url} (latency={args.latency}s +/- {args.jitter}s, errors={args.error_rate})")
+    print(f"     OLLAMA_HOST={server.url}  HF_BASE_URL={server.url}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark model-reply parsing on a corpus of malformed outputs.
+
+Compares the original strip-code-fences-then-json.loads parser with the
+tolerant single-pass parser in ``json_repair``. Run from ``backend/``::
+
+    python -m bench.parse
+    python -m bench.parse --corpus my_outputs.jsonl --output parse_results.json
+
+Corpus lines are ``{"name": ..., "output": <model text>, "expected": <data or null>}``;
+``expected: null`` means no JSON should be recovered.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from json_repair import parse_model_json
+
+DEFAULT_CORPUS = Path(__file__).with_name("malformed_outputs.jsonl")
+
+
+def legacy_parse(text: str) -> Any:
+    """The parser extraction used before json_repair: strip fences, json.loads, else raw_text"""
+    extracted_text = text.strip()
+    if extracted_text.startswith("```json"):
+        extracted_text = extracted_text[7:]
+    if extracted_text.startswith("```"):
+        extracted_text = extracted_text[3:]
+    if extracted_text.endswith("```"):
+        extracted_text = extracted_text[:-3]
+    extracted_text = extracted_text.strip()
+    try:
+        return json.loads(extracted_text)
+    except json.JSONDecodeError:
+        return {"raw_text": extracted_text}
+
+
+def tolerant_parse(text: str) -> Any:
+    return parse_model_json(text)[0]
+
+
+def evaluate(parse: Callable[[str], Any], corpus: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    recovered = exact = 0
+    failures = []
+    for case in corpus:
+        data = parse(case["output"])
+        got_json = not (isinstance(data, dict) and set(data) == {"raw_text"})
+        if case["expected"] is None:
+            correct = not got_json
+        else:
+            recovered += int(got_json)
+            correct = data == case["expected"]
+        exact += int(correct)
+        if not correct:
+            failures.append(case["name"])
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for case in corpus:
+            parse(case["output"])
+    elapsed = time.perf_counter() - started
+
+    expecting_json = sum(1 for case in corpus if case["expected"] is not None)
+    return {
+        "cases": len(corpus),
+        "recovered": recovered,
+        "recovery_rate": round(recovered / expecting_json, 3) if expecting_json else None,
+        "exact": exact,
+        "exact_rate": round(exact / len(corpus), 3),
+        "mean_us_per_parse": round(elapsed / (repeat * len(corpus)) * 1e6, 2),
+        "failures": failures
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model-output JSON parsing")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--repeat", type=int, default=200, help="Timing passes over the corpus")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    corpus = [json.loads(line) for line in Path(args.corpus).read_text().splitlines() if line.strip()]
+    results = {
+        "corpus": args.corpus,
+        "legacy": evaluate(legacy_parse, corpus, args.repeat),
+        "tolerant": evaluate(tolerant_parse, corpus, args.repeat)
+    }
+    for name in ("legacy", "tolerant"):
+        entry = results[name]
+        print(
+            f"{name:<9} recovered {entry['recovered']}/{sum(1 for c in corpus if c['expected'] is not None)}  "
+            f"exact {entry['exact']}/{entry['cases']}  {entry['mean_us_per_parse']} us/parse"
+        )
+        if entry["failures"]:
+            print(f"          wrong: {', '.join(entry['failures'])}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"[OK] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
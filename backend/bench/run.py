@@ -0,0 +1,387 @@
+"""Offline load benchmark for the extraction API.
+
+Starts a mock vision provider and the FastAPI app (uvicorn, as a subprocess),
+drives /upload, /upload/batch and /upload/stream with synthetic forms, and
+writes a JSON report. Run from ``backend/``::
+
+    python -m bench.run --endpoints upload stream --requests 200 --concurrency 16
+    python -m bench.run --output bench/results/after.json --compare bench/results/before.json
+
+Reports go to ``bench/results/`` by default, which is gitignored.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import requests
+
+from bench.forms import RESOLUTIONS, generate_forms
+from bench.mock_server import MockVisionServer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BACKEND_DIR / "bench" / "results"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentile(values: List[float], point: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for an empty sample"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(point * len(ordered)))]
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p90_ms": ms(percentile(values, 0.90)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(max(values)) if values else None
+    }
+
+
+class ResourceSampler:
+    """Polls /proc for a process's resident memory and CPU time (Linux only; no-op elsewhere)"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def available(self) -> bool:
+        return Path(f"/proc/{self.pid}/stat").exists()
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            fields = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat (1-based, counting pid and comm)
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def _sample_rss(self):
+        try:
+            status = Path(f"/proc/{self.pid}/status").read_text()
+        except OSError:
+            return
+        for key in ("VmHWM", "VmRSS"):
+            match = re.search(rf"^{key}:\s+(\d+) kB", status, re.MULTILINE)
+            if match:
+                self.peak_rss_bytes = max(self.peak_rss_bytes, int(match.group(1)) * 1024)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample_rss()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.available():
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sample_rss()
+
+
+def parse_stage_metrics(text: str) -> Dict[str, Dict[str, float]]:
+    """Pull per-stage wall/CPU sums and counts out of the /metrics exposition"""
+    stages: Dict[str, Dict[str, float]] = {}
+    pattern = re.compile(r'^handwriting_stage_(duration|cpu)_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match:
+            kind, field, stage, value = match.groups()
+            stages.setdefault(stage, {})[f"{kind}_{field}"] = float(value)
+    return stages
+
+
+def stage_report(before: Dict[str, Dict[str, float]], after: Dict[str, Dict[str, float]], health: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-stage wall and CPU totals for the measured run only, plus the server's recent percentiles"""
+    percentiles = (health.get("latency") or {}).get("handwriting_stage_duration_seconds", {})
+    report = {}
+    for stage, totals in after.items():
+        base = before.get(stage, {})
+        delta = {key: value - base.get(key, 0.0) for key, value in totals.items()}
+        count = delta.get("duration_count", 0)
+        if not count:
+            continue
+        cpu_count = delta.get("cpu_count", 0)
+        recent = percentiles.get(f"stage={stage}", {})
+        report[stage] = {
+            "count": int(count),
+            "wall_mean_ms": round(delta["duration_sum"] / count * 1000, 2),
+            "wall_p50_ms": recent.get("p50"),
+            "wall_p95_ms": recent.get("p95"),
+            "wall_p99_ms": recent.get("p99"),
+            "cpu_total_s": round(delta.get("cpu_sum", 0.0), 3) if cpu_count else None,
+            "cpu_mean_ms": round(delta["cpu_sum"] / cpu_count * 1000, 2) if cpu_count else None
+        }
+    return report
+
+
+class LoadDriver:
+    """Fires requests at one endpoint from ``concurrency`` threads and records per-request latency"""
+
+    def __init__(self, base_url: str, images: List[bytes], concurrency: int, batch_size: int):
+        self.base_url = base_url
+        self.images = images
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _image(self, index: int):
+        return (f"form_{index % len(self.images)}.jpg", self.images[index % len(self.images)], "image/jpeg")
+
+    def one(self, endpoint: str, index: int) -> Dict[str, Any]:
+        session = self._session()
+        started = time.perf_counter()
+        first_byte = None
+        try:
+            if endpoint == "upload":
+                response = session.post(f"{self.base_url}/upload", files={"file": self._image(index)}, timeout=600)
+            elif endpoint == "batch":
+                files = [("files", self._image(index * self.batch_size + offset)) for offset in range(self.batch_size)]
+                response = session.post(f"{self.base_url}/upload/batch", files=files, timeout=600)
+            elif endpoint == "stream":
+                response = session.post(f"{self.base_url}/upload/stream", files={"file": self._image(index)}, stream=True, timeout=600)
+                for line in response.iter_lines():
+                    if line and first_byte is None:
+                        first_byte = time.perf_counter() - started
+            else:
+                raise ValueError(f"Unknown endpoint {endpoint}")
+            status = response.status_code
+            error = None if response.ok else response.text[:200]
+        except requests.RequestException as e:
+            status, error = 0, f"{type(e).__name__}: {e}"
+        return {
+            "latency": time.perf_counter() - started,
+            "first_byte": first_byte,
+            "status": status,
+            "error": error
+        }
+
+    def run(self, endpoint: str, requests_count: int) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            samples = list(executor.map(lambda index: self.one(endpoint, index), range(requests_count)))
+        wall = time.perf_counter() - started
+
+        ok = [sample for sample in samples if sample["status"] == 200]
+        statuses: Dict[str, int] = {}
+        for sample in samples:
+            statuses[str(sample["status"])] = statuses.get(str(sample["status"]), 0) + 1
+        images = len(ok) * (self.batch_size if endpoint == "batch" else 1)
+        report = {
+            "requests": len(samples),
+            "succeeded": len(ok),
+            "failed": len(samples) - len(ok),
+            "statuses": statuses,
+            "wall_seconds": round(wall, 3),
+            "requests_per_second": round(len(ok) / wall, 3) if wall else None,
+            "images_per_second": round(images / wall, 3) if wall else None,
+            "latency": summarize_latencies([sample["latency"] for sample in ok]),
+            "sample_errors": sorted({sample["error"] for sample in samples if sample["error"]})[:5]
+        }
+        if endpoint == "stream":
+            report["time_to_first_event"] = summarize_latencies([
+                sample["first_byte"] for sample in ok if sample["first_byte"] is not None
+            ])
+        return report
+
+
+def start_api(port: int, mock_url: str, args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_HOST": mock_url,
+        "OLLAMA_ENABLED": "true",
+        "HF_TOKEN": "bench" if args.hf else "",
+        "HF_BASE_URL": f"{mock_url}/v1",
+        "LANGFUSE_PUBLIC_KEY": "",
+        "LANGFUSE_SECRET_KEY": "",
+        "TRACE_EXPORT_URL": "",
+        "USE_CONSENSUS_MODE": "true" if args.consensus else "false",
+        "RESULT_CACHE_ENABLED": "true" if args.cache else "false",
+        # Without --cache every request pays for preprocessing, as it would with unique uploads
+        "ENCODING_CACHE_ENTRIES": os.getenv("ENCODING_CACHE_ENTRIES", "64") if args.cache else "0",
+        "EXTRACTION_WORKERS": str(args.workers),
+        "PYTHONUNBUFFERED": "1"
+    })
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+
+
+def wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).json().get("agent_initialized"):
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError("API server did not become ready")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable regressions of throughput and p95 latency beyond ``tolerance`` (a fraction)"""
+    regressions = []
+    for endpoint, result in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        old_rps, new_rps = before.get("requests_per_second"), result.get("requests_per_second")
+        old_p95, new_p95 = before["latency"].get("p95_ms"), result["latency"].get("p95_ms")
+        if old_rps and new_rps is not None:
+            change = (new_rps - old_rps) / old_rps
+            print(f"  {endpoint:<7} rps  {old_rps:>9.2f} -> {new_rps:>9.2f} ({change:+.1%})")
+            if change < -tolerance:
+                regressions.append(f"{endpoint}: throughput {change:+.1%}")
+        if old_p95 and new_p95 is not None:
+            change = (new_p95 - old_p95) / old_p95
+            print(f"  {endpoint:<7} p95  {old_p95:>9.1f} -> {new_p95:>9.1f} ms ({change:+.1%})")
+            if change > tolerance:
+                regressions.append(f"{endpoint}: p95 latency {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput/latency benchmark for the extraction API")
+    parser.add_argument("--endpoints", nargs="+", default=["upload"], choices=["upload", "batch", "stream"])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per /upload/batch request")
+    parser.add_argument("--resolution", default="scan", choices=sorted(RESOLUTIONS))
+    parser.add_argument("--images", type=int, default=16, help="Distinct synthetic forms to cycle through")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Mock model latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock model calls that fail")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("EXTRACTION_WORKERS", "8")))
+    parser.add_argument("--consensus", action="store_true", help="Enable consensus mode (several model calls per image)")
+    parser.add_argument("--cache", action="store_true", help="Keep the result and encoding caches enabled")
+    parser.add_argument("--hf", action="store_true", help="Also route to the OpenAI-compatible (HuggingFace) mock")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests before measuring")
+    parser.add_argument("--output", default=str(RESULTS_DIR / "bench_results.json"))
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression fraction for --compare")
+    parser.add_argument("--server-log", help="File to capture API server output")
+    args = parser.parse_args()
+
+    print(f"[INFO] Generating {args.images} synthetic '{args.resolution}' forms {RESOLUTIONS[args.resolution]}")
+    images = generate_forms(args.resolution, args.images)
+
+    mock = MockVisionServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+    process = start_api(args.port, mock.url, args)
+    sampler = ResourceSampler(process.pid)
+    try:
+        wait_ready(base_url, process)
+        print(f"[OK] API ready on {base_url}, mock provider on {mock.url}")
+        driver = LoadDriver(base_url, images, args.concurrency, args.batch_size)
+        for index in range(args.warmup):
+            driver.one("upload", index)
+
+        stages_before = parse_stage_metrics(requests.get(f"{base_url}/metrics").text)
+        cpu_before = sampler.cpu_seconds()
+        sampler.start()
+        started = time.perf_counter()
+
+        endpoints = {}
+        for endpoint in args.endpoints:
+            print(f"[INFO] {endpoint}: {args.requests} requests, concurrency {args.concurrency}")
+            endpoints[endpoint] = driver.run(endpoint, args.requests)
+            result = endpoints[endpoint]
+            print(
+                f"[OK] {endpoint}: {result['requests_per_second']} req/s, "
+                f"p50 {result['latency']['p50_ms']} ms, p95 {result['latency']['p95_ms']} ms, "
+                f"p99 {result['latency']['p99_ms']} ms, failed {result['failed']}"
+            )
+
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        cpu_after = sampler.cpu_seconds()
+        health = requests.get(f"{base_url}/health").json()
+        stages_after = parse_stage_metrics(requests.get(f"{base_url}/metrics").text)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        mock.stop()
+
+    cpu_used = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "revision": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "server_log")},
+        "endpoints": endpoints,
+        "server": {
+            "peak_rss_mb": round(sampler.peak_rss_bytes / (1024 * 1024), 1) if sampler.peak_rss_bytes else None,
+            "cpu_seconds": round(cpu_used, 2) if cpu_used is not None else None,
+            "cpu_utilization": round(cpu_used / elapsed, 3) if cpu_used is not None and elapsed else None
+        },
+        "stages": stage_report(stages_before, stages_after, health),
+        "mock_provider": mock.stats()
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"[OK] Results written to {args.output}")
+    print(f"     peak RSS {results['server']['peak_rss_mb']} MB, CPU {results['server']['cpu_seconds']} s")
+    for stage, entry in results["stages"].items():
+        print(f"     {stage:<12} wall {entry['wall_mean_ms']:>9} ms  cpu {entry['cpu_mean_ms']} ms  (n={entry['count']})")
+
+    if args.compare:
+        print(f"[INFO] Comparing against {args.compare}")
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print("[WARNING] Regressions: " + "; ".join(regressions))
+            sys.exit(1)
+        print("[OK] No regressions beyond tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from shared_state import KeyValueStore
+
+
+def content_hash(data: bytes) -> str:
+    """Hex SHA-256 digest of raw content bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(image_hash: str, model_id: str, prompt_version: str) -> str:
+    """Combine image hash, model and prompt version into a single cache key"""
+    return hashlib.sha256(f"{image_hash}|{model_id}|{prompt_version}".encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU with per-entry TTL and entry/byte bounds"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class SQLiteCacheTier:
+    """Persistent cache tier backed by a single SQLite table"""
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            # Only takes effect on a new file (before WAL is enabled); lets purge_expired hand freed pages back
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM extraction_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO extraction_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + self.ttl_seconds)
+        )
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        conn = self._conn()
+        cursor = conn.execute("DELETE FROM extraction_cache WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+        if cursor.rowcount:
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript("PRAGMA incremental_vacuum;")
+        return cursor.rowcount
+
+
+class KeyValueCacheTier:
+    """Cache tier on a shared key-value store, so every worker process sees every other worker's results"""
+
+    def __init__(self, store: KeyValueStore, ttl_seconds: float, prefix: str = "cache"):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self.store.get(f"{self.prefix}:{key}")
+
+    def set(self, key: str, value: str):
+        self.store.set(f"{self.prefix}:{key}", value, ex=self.ttl_seconds)
+
+
+class ResultCache:
+    """Extraction result cache: in-memory LRU in front of an optional shared store and SQLite file"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 86400,
+        disk_path: Optional[str] = None,
+        shared: Optional[KeyValueStore] = None
+    ):
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.shared = KeyValueCacheTier(shared, ttl_seconds) if shared is not None else None
+        self.disk: Optional[SQLiteCacheTier] = None
+        if disk_path:
+            try:
+                self.disk = SQLiteCacheTier(disk_path, ttl_seconds)
+            except Exception as e:
+                print(f"[WARNING] Disk cache unavailable at {disk_path}: {e}")
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        if self.shared:
+            try:
+                raw = self.shared.get(key)
+            except Exception as e:
+                print(f"[WARNING] Shared cache read failed: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.memory.set(key, value, len(raw))
+                self.shared_hits += 1
+                return value
+
+        if self.disk:
+            try:
+                raw = self.disk.get(key)
+            except Exception as e:
+                print(f"[WARNING] Disk cache read failed: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.memory.set(key, value, len(raw))
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        raw = json.dumps(value)
+        self.memory.set(key, value, len(raw))
+        if self.shared:
+            try:
+                self.shared.set(key, raw)
+            except Exception as e:
+                print(f"[WARNING] Shared cache write failed: {e}")
+        if self.disk:
+            try:
+                self.disk.set(key, raw)
+            except Exception as e:
+                print(f"[WARNING] Disk cache write failed: {e}")
+
+    def purge_expired(self) -> int:
+        """Delete expired rows from the disk tier; the memory and shared tiers expire on their own"""
+        if not self.disk:
+            return 0
+        return self.disk.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.shared_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "shared_hits": self.shared_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self.memory),
+            "size_bytes": self.memory.size_bytes,
+            "evictions": self.memory.evictions,
+            "shared_enabled": self.shared is not None,
+            "disk_enabled": self.disk is not None
+        }
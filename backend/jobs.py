@@ -0,0 +1,494 @@
+import asyncio
+import base64
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from shared_state import KeyValueStore
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+TERMINAL_STATUSES = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class JobStore:
+    """Persistence interface for extraction jobs.
+
+    Jobs are plain dicts; the uploaded bytes are stored alongside as an opaque
+    payload that the scheduler fetches when the job starts and that is dropped
+    once the job reaches a terminal status.
+    """
+
+    def create(self, job: Dict[str, Any], payload: bytes):
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields: Any):
+        raise NotImplementedError
+
+    def take_payload(self, job_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Atomically move a queued job to running under ``owner``; False if it is not queued
+        (already claimed by another worker sharing the store, or cancelled)"""
+        raise NotImplementedError
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Jobs that were queued or running when the store was last used"""
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def prune(self, finished_before: float) -> int:
+        """Delete finished, failed and cancelled jobs that ended before ``finished_before``; returns how many"""
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """In-process job store; jobs are lost on restart"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._payloads: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any], payload: bytes):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            self._payloads[job["id"]] = payload
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields: Any):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+                if fields.get("status") in TERMINAL_STATUSES:
+                    self._payloads.pop(job_id, None)
+
+    def take_payload(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._payloads.pop(job_id, None)
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                return False
+            job.update(status=RUNNING, started_at=time.time(), owner=owner)
+            return True
+
+    def pending(self) -> List[Dict[str, Any]]:
+        return []
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+    def prune(self, finished_before: float) -> int:
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in TERMINAL_STATUSES and (job["finished_at"] or 0) < finished_before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """SQLite-backed job store; queued jobs survive a restart and are re-scheduled"""
+
+    _COLUMNS = ("id", "status", "priority", "filename", "created_at", "started_at", "finished_at", "result", "error", "owner", "tenant")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL, filename TEXT NOT NULL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, result TEXT, error TEXT, payload BLOB)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        try:
+            # Databases created before jobs were claimed by a named worker
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        except sqlite3.OperationalError:
+            pass
+        try:
+            # ... and before jobs recorded the tenant that submitted them
+            conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT")
+        except sqlite3.OperationalError:
+            pass
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(self._COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, job: Dict[str, Any], payload: bytes):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO jobs (id, status, priority, filename, created_at, tenant, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job["id"], job["status"], job["priority"], job["filename"], job["created_at"], job["tenant"], payload)
+        )
+        conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def update(self, job_id: str, **fields: Any):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        values = list(fields.values())
+        if fields.get("status") in TERMINAL_STATUSES:
+            assignments += ", payload = NULL"
+        conn = self._conn()
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*values, job_id))
+        conn.commit()
+
+    def take_payload(self, job_id: str) -> Optional[bytes]:
+        row = self._conn().execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        conn = self._conn()
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, started_at = ?, owner = ? WHERE id = ? AND status = ?",
+            (RUNNING, time.time(), owner, job_id, QUEUED)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+    def pending(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (QUEUED, RUNNING)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def prune(self, finished_before: float) -> int:
+        statuses = sorted(TERMINAL_STATUSES)
+        conn = self._conn()
+        cursor = conn.execute(
+            f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(statuses))}) AND COALESCE(finished_at, 0) < ?",
+            (*statuses, finished_before)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+
+class KeyValueJobStore(JobStore):
+    """Job store on a shared key-value store (see shared_state), so every worker process sees every job.
+
+    Each job is a JSON document with its payload base64-encoded beside it; a set
+    per status backs ``pending`` and ``counts``, and a set-if-absent claim key
+    makes sure exactly one worker runs a queued job.
+    """
+
+    def __init__(self, store: KeyValueStore, prefix: str = "jobs"):
+        self.store = store
+        self.prefix = prefix
+
+    def _key(self, job_id: str, suffix: str = "") -> str:
+        return f"{self.prefix}:{job_id}{suffix}"
+
+    def _status_key(self, status: str) -> str:
+        return f"{self.prefix}:status:{status}"
+
+    def create(self, job: Dict[str, Any], payload: bytes):
+        self.store.set(self._key(job["id"], ":payload"), base64.b64encode(payload).decode("ascii"))
+        self.store.set(self._key(job["id"]), json.dumps(job))
+        self.store.sadd(self._status_key(job["status"]), job["id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.store.get(self._key(job_id))
+        return json.loads(raw) if raw else None
+
+    def update(self, job_id: str, **fields: Any):
+        job = self.get(job_id)
+        if job is None:
+            return
+        previous = job["status"]
+        job.update(fields)
+        self.store.set(self._key(job_id), json.dumps(job))
+        if job["status"] != previous:
+            self.store.srem(self._status_key(previous), job_id)
+            self.store.sadd(self._status_key(job["status"]), job_id)
+        if job["status"] in TERMINAL_STATUSES:
+            self.store.delete(self._key(job_id, ":payload"), self._key(job_id, ":claim"))
+        elif job["status"] == QUEUED:
+            # Re-queued after an interrupted run: it can be claimed again
+            self.store.delete(self._key(job_id, ":claim"))
+
+    def take_payload(self, job_id: str) -> Optional[bytes]:
+        raw = self.store.get(self._key(job_id, ":payload"))
+        return base64.b64decode(raw) if raw else None
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        if not self.store.set(self._key(job_id, ":claim"), owner, nx=True):
+            return False
+        job = self.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            self.store.delete(self._key(job_id, ":claim"))
+            return False
+        self.update(job_id, status=RUNNING, started_at=time.time(), owner=owner)
+        return True
+
+    def pending(self) -> List[Dict[str, Any]]:
+        jobs = [
+            self.get(job_id)
+            for status in (QUEUED, RUNNING)
+            for job_id in self.store.smembers(self._status_key(status))
+        ]
+        return sorted((job for job in jobs if job), key=lambda job: job["created_at"])
+
+    def counts(self) -> Dict[str, int]:
+        counts = {
+            status: self.store.scard(self._status_key(status))
+            for status in (QUEUED, RUNNING, *sorted(TERMINAL_STATUSES))
+        }
+        return {status: count for status, count in counts.items() if count}
+
+    def prune(self, finished_before: float) -> int:
+        pruned = 0
+        for status in TERMINAL_STATUSES:
+            for job_id in self.store.smembers(self._status_key(status)):
+                job = self.get(job_id)
+                if job is not None and (job["finished_at"] or 0) >= finished_before:
+                    continue
+                self.store.delete(self._key(job_id))
+                self.store.srem(self._status_key(status), job_id)
+                pruned += 1
+        return pruned
+
+
+class JobQueueFullError(Exception):
+    """Raised when the scheduler already holds its maximum number of queued jobs"""
+
+
+class JobScheduler:
+    """Runs queued jobs in priority order on a fixed number of asyncio runner tasks.
+
+    ``run_job`` receives the payload bytes, filename and submitting tenant and
+    returns the job result dict; it is expected to offload the blocking work itself (e.g. onto the
+    extraction pool). Higher ``priority`` values run first; ties run FIFO.
+
+    Several schedulers (one per worker process) may share a store: each job is
+    claimed by exactly one of them, recorded under that scheduler's ``owner``.
+    Jobs that ended more than ``retention`` seconds ago are deleted, results
+    included (None keeps them forever).
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        run_job: Callable[[bytes, str, Optional[str]], Awaitable[Dict[str, Any]]],
+        workers: int = 2,
+        max_queued: int = 1000,
+        owner: str = "0",
+        retention: Optional[float] = 86400
+    ):
+        self.store = store
+        self.run_job = run_job
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.owner = owner
+        self.retention = retention
+        self._queue: "asyncio.PriorityQueue" = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._finished: Dict[str, asyncio.Event] = {}
+
+    def start(self, recover: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        """Queue the store's pending jobs and start the runners.
+
+        A job that was running when its process died is retried from the start.
+        ``recover`` picks which of those this scheduler restarts when several
+        worker processes share the store (the default, None, restarts them all),
+        so a restarted worker never resets a job a live worker is running.
+        """
+        for job in self.store.pending():
+            if job["status"] == RUNNING:
+                if recover and not recover(job):
+                    continue
+                self.store.update(job["id"], status=QUEUED, started_at=None, owner=None)
+            self._enqueue(job["id"], job["priority"])
+        if self._queue.qsize():
+            print(f"[OK] Re-queued {self._queue.qsize()} pending jobs")
+        self._tasks = [asyncio.create_task(self._runner()) for _ in range(self.workers)]
+        if self.retention:
+            self._tasks.append(asyncio.create_task(self._pruner()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _enqueue(self, job_id: str, priority: int):
+        self._queue.put_nowait((-priority, next(self._sequence), job_id))
+
+    def submit(self, payload: bytes, filename: str, priority: int = 0, tenant: Optional[str] = None) -> Dict[str, Any]:
+        if self._queue.qsize() >= self.max_queued:
+            raise JobQueueFullError(f"Job queue is full ({self.max_queued} jobs queued)")
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "priority": priority,
+            "filename": filename,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "owner": None,
+            "tenant": tenant
+        }
+        self.store.create(job, payload)
+        self._enqueue(job["id"], priority)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll: return the job once it is finished or ``timeout`` seconds have passed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in TERMINAL_STATUSES or remaining <= 0:
+                return job
+            event = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                # Short slices so jobs finished by another process sharing the store are noticed
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return job
+        self.store.update(job_id, status=CANCELLED, finished_at=time.time())
+        task = self._running.get(job_id)
+        if task:
+            task.cancel()
+        self._notify(job_id)
+        return self.store.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "running": len(self._running),
+            "max_queued": self.max_queued,
+            "by_status": self.store.counts()
+        }
+
+    def _notify(self, job_id: str):
+        event = self._finished.pop(job_id, None)
+        if event:
+            event.set()
+
+    async def _pruner(self):
+        # Every scheduler sharing a store prunes it; deleting an already deleted job is harmless
+        while True:
+            try:
+                pruned = await asyncio.to_thread(self.store.prune, time.time() - self.retention)
+                if pruned:
+                    print(f"[INFO] Pruned {pruned} jobs finished more than {self.retention:g}s ago")
+            except Exception as e:
+                print(f"[WARNING] Pruning finished jobs failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(min(self.retention, 600))
+
+    async def _runner(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                await self._run_one(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Job runner failed on {job_id}: {type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_one(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or not self.store.claim(job_id, self.owner):
+            return
+        payload = self.store.take_payload(job_id)
+        if payload is None:
+            self.store.update(job_id, status=FAILED, finished_at=time.time(), error="Job payload missing")
+            self._notify(job_id)
+            return
+
+        task = asyncio.create_task(self.run_job(payload, job["filename"], job.get("tenant")))
+        self._running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # The runner itself is being stopped
+                raise
+            # Only this job was cancelled; cancel() already recorded the status
+            return
+        except Exception as e:
+            self.store.update(job_id, status=FAILED, finished_at=time.time(), error=f"{type(e).__name__}: {e}")
+            self._notify(job_id)
+            return
+        finally:
+            self._running.pop(job_id, None)
+
+        if self.store.get(job_id)["status"] == CANCELLED:
+            return
+        if result.get("success"):
+            self.store.update(job_id, status=SUCCEEDED, finished_at=time.time(), result=result)
+        else:
+            self.store.update(
+                job_id,
+                status=FAILED,
+                finished_at=time.time(),
+                result=result,
+                error=result.get("error", "Extraction failed")
+            )
+        self._notify(job_id)
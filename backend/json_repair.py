@@ -0,0 +1,321 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$\- ]*")
+_WHITESPACE = re.compile(r"\s*")
+_BARE_VALUE_END = re.compile(r"[,}\]\n]")
+_STRING_RUNS = {'"': re.compile(r'[^"\\\n\r\t]*'), "'": re.compile(r"[^'\\\n\r\t]*")}
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_CLOSERS = {"{": "}", "[": "]"}
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "'": "'"}
+
+
+class JSONRepairError(ValueError):
+    """Raised when no JSON object or array can be recovered from the text"""
+
+
+class _Parser:
+    """Single forward pass over model output that tolerates the usual LLM JSON defects.
+
+    Every deviation from strict JSON is accepted and recorded by name in
+    ``repairs``: single-quoted strings, unquoted keys, Python literals, comments,
+    trailing or missing commas, raw control characters in strings, and output
+    that stops before its closing brackets.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.repairs: List[str] = []
+
+    def repair(self, name: str):
+        if name not in self.repairs:
+            self.repairs.append(name)
+
+    def skip(self):
+        """Skip whitespace and comments"""
+        text = self.text
+        while True:
+            self.pos = _WHITESPACE.match(text, self.pos).end()
+            if text.startswith("//", self.pos):
+                end = text.find("\n", self.pos)
+                self.pos = len(text) if end < 0 else end + 1
+                self.repair("comments")
+            elif text.startswith("/*", self.pos):
+                end = text.find("*/", self.pos + 2)
+                self.pos = len(text) if end < 0 else end + 2
+                self.repair("comments")
+            else:
+                return
+
+    def at_end(self) -> bool:
+        return self.pos >= len(self.text)
+
+    def value(self) -> Any:
+        self.skip()
+        if self.at_end():
+            raise JSONRepairError("Unexpected end of input")
+        char = self.text[self.pos]
+        if char == "{":
+            return self.container("{")
+        if char == "[":
+            return self.container("[")
+        if char in "\"'":
+            return self.string()
+        match = _NUMBER.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            if number.startswith(".") or number.endswith(".") or number.startswith("-."):
+                self.repair("number_format")
+                return float(number)
+            return json.loads(number)
+        match = _IDENTIFIER.match(self.text, self.pos)
+        if match:
+            word = match.group().split()[0]
+            if word in _LITERALS:
+                self.pos += len(word)
+                if word not in ("true", "false", "null"):
+                    self.repair("python_literals")
+                return _LITERALS[word]
+            if self.pos + len(word) == len(self.text):
+                literal = next((name for name in ("true", "false", "null") if name.startswith(word)), None)
+                if literal:
+                    self.pos = len(self.text)
+                    self.repair("truncated")
+                    return _LITERALS[literal]
+            # Bare text as a value ("name": John Doe): take it up to the next delimiter
+            end = _BARE_VALUE_END.search(self.text, self.pos)
+            raw = self.text[self.pos:end.start() if end else len(self.text)]
+            self.pos += len(raw)
+            self.repair("unquoted_values")
+            return raw.strip()
+        raise JSONRepairError(f"Unexpected character {char!r} at {self.pos}")
+
+    def key(self) -> str:
+        char = self.text[self.pos]
+        if char in "\"'":
+            return self.string()
+        match = _IDENTIFIER.match(self.text, self.pos)
+        if not match:
+            raise JSONRepairError(f"Expected a key at {self.pos}")
+        self.pos = match.end()
+        self.repair("unquoted_keys")
+        return match.group().strip()
+
+    def container(self, opener: str) -> Any:
+        closer = _CLOSERS[opener]
+        is_object = opener == "{"
+        result: Any = {} if is_object else []
+        self.pos += 1
+        expecting_member = True
+        while True:
+            self.skip()
+            if self.at_end():
+                self.repair("truncated")
+                return result
+            char = self.text[self.pos]
+            if char == closer:
+                self.pos += 1
+                return result
+            if char in "}]":
+                # Wrong closer (e.g. "]" ending an object): treat it as ours
+                self.repair("mismatched_brackets")
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                self.skip()
+                if not self.at_end() and self.text[self.pos] == closer:
+                    self.repair("trailing_commas")
+                expecting_member = True
+                continue
+            if not expecting_member:
+                self.repair("missing_commas")
+
+            if is_object:
+                name = self.key()
+                self.skip()
+                if self.at_end():
+                    self.repair("truncated")
+                    return result
+                if self.text[self.pos] == ":":
+                    self.pos += 1
+                elif self.text[self.pos] == "=":
+                    self.pos += 1
+                    self.repair("missing_colons")
+                else:
+                    self.repair("missing_colons")
+                self.skip()
+                if self.at_end():
+                    # "key": with no value before the output stopped; drop the member
+                    self.repair("truncated")
+                    return result
+                result[name] = self.value()
+            else:
+                result.append(self.value())
+            expecting_member = False
+
+    def string(self) -> str:
+        text = self.text
+        quote = text[self.pos]
+        if quote == "'":
+            self.repair("single_quotes")
+        self.pos += 1
+        pieces: List[str] = []
+        start = self.pos
+        run = _STRING_RUNS[quote]
+        while True:
+            # Jump over ordinary characters in one regex step; stop at quotes, escapes and control characters
+            self.pos = run.match(text, self.pos).end()
+            if self.pos >= len(text):
+                self.repair("truncated")
+                pieces.append(text[start:])
+                return "".join(pieces)
+            char = text[self.pos]
+            if char == quote:
+                pieces.append(text[start:self.pos])
+                self.pos += 1
+                return "".join(pieces)
+            if char == "\\":
+                pieces.append(text[start:self.pos])
+                escape = text[self.pos + 1:self.pos + 2]
+                if escape == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[self.pos + 2:self.pos + 6]):
+                    pieces.append(chr(int(text[self.pos + 2:self.pos + 6], 16)))
+                    self.pos += 6
+                elif escape in _ESCAPES:
+                    pieces.append(_ESCAPES[escape])
+                    self.pos += 2
+                else:
+                    self.repair("invalid_escapes")
+                    pieces.append(escape)
+                    self.pos += 2
+                start = self.pos
+                continue
+            if char in "\n\r\t":
+                self.repair("control_characters")
+            self.pos += 1
+
+
+def _candidates(text: str):
+    """Start offsets of every "{" then every "[", in order of appearance"""
+    for opener in "{[":
+        index = text.find(opener)
+        while index >= 0:
+            yield index
+            index = text.find(opener, index + 1)
+
+
+def _surrounding_repairs(text: str, start: int, end: int) -> List[str]:
+    """Name the non-JSON text found before ``start`` and after ``end``"""
+    repairs = []
+    if text[:start].strip():
+        repairs.append("code_fence" if text[:start].rstrip().endswith(("```", "```json")) else "leading_text")
+    if text[end:].strip() not in ("", "```"):
+        repairs.append("trailing_text")
+    return repairs
+
+
+def repair_json(text: str) -> Tuple[Any, List[str]]:
+    """Recover the outermost JSON object (or array) from model output.
+
+    Returns ``(value, repairs)`` where ``repairs`` names each fix that was needed;
+    it is empty when the text was already valid JSON. Raises JSONRepairError if
+    nothing usable is found.
+    """
+    stripped = text.strip()
+    try:
+        return json.loads(stripped), []
+    except json.JSONDecodeError:
+        pass
+
+    # Common case: valid JSON wrapped in prose or a code fence; let the C parser try the outer slice
+    first, last = text.find("{"), text.rfind("}")
+    if 0 <= first < last:
+        try:
+            value = json.loads(text[first:last + 1])
+        except json.JSONDecodeError:
+            pass
+        else:
+            return value, _surrounding_repairs(text, first, last + 1)
+
+    for start in _candidates(text):
+        parser = _Parser(text)
+        parser.pos = start
+        try:
+            value = parser.value()
+        except JSONRepairError:
+            continue
+        if isinstance(value, (dict, list)) and not value and len(parser.repairs) > 0:
+            # "{}" salvaged from a stray brace in prose is not an answer; keep looking
+            continue
+        parser.skip()
+        return value, _surrounding_repairs(text, start, parser.pos) + parser.repairs
+    raise JSONRepairError("No JSON object found in model output")
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None)
+}
+
+
+def _matches_type(value: Any, expected: str) -> bool:
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _TYPES.get(expected, object))
+
+
+def validate_schema(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """Check ``value`` against a JSON Schema subset (type, enum, properties, required,
+    additionalProperties, items); returns human-readable errors, empty when valid"""
+    errors: List[str] = []
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_matches_type(value, name) for name in types):
+            return [f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}: missing required field '{name}'")
+        for name, item in value.items():
+            if name in properties:
+                errors.extend(validate_schema(item, properties[name], f"{path}.{name}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected field '{name}'")
+            elif isinstance(schema.get("additionalProperties"), dict):
+                errors.extend(validate_schema(item, schema["additionalProperties"], f"{path}.{name}"))
+    elif isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for index, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+def parse_model_json(text: str, schema: Optional[Dict[str, Any]] = None) -> Tuple[Any, Dict[str, Any]]:
+    """Tolerantly parse model output; returns (data, report).
+
+    ``report`` has ``repairs`` (list of applied fixes), ``recovered`` (False when
+    nothing parsed and the data is ``{"raw_text": ...}``) and, if a schema was
+    given, ``schema_errors``.
+    """
+    try:
+        data, repairs = repair_json(text)
+        report: Dict[str, Any] = {"recovered": True, "repairs": repairs}
+    except JSONRepairError:
+        data = {"raw_text": text.strip()}
+        report = {"recovered": False, "repairs": []}
+    if schema is not None:
+        report["schema_errors"] = validate_schema(data, schema) if report["recovered"] else ["$: no JSON found"]
+    return data, report
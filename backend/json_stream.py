@@ -0,0 +1,76 @@
+import json
+from typing import Any, List, Tuple
+
+
+class IncrementalJSONParser:
+    """Incrementally scans streamed model output and yields top-level object fields as they close.
+
+    Text before the first ``{`` (prose, code fences) is ignored. Each ``feed`` call
+    returns the ``(key, value)`` pairs whose value finished in that chunk, so a
+    caller can surface ``"name": "..."`` long before the whole object is complete.
+    Members that do not parse on their own are skipped; the caller still gets the
+    full text for a final, tolerant parse.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self._done = False
+        self._member: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        """True once the top-level object has closed"""
+        return self._done
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        fields: List[Tuple[str, Any]] = []
+        for char in chunk:
+            if self._done:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._member.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._done = True
+                    self._emit(fields)
+                    continue
+            elif char == "," and self._depth == 1:
+                self._emit(fields)
+                continue
+            self._member.append(char)
+        return fields
+
+    def _emit(self, fields: List[Tuple[str, Any]]):
+        member = "".join(self._member).strip()
+        self._member = []
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return
+        fields.extend(parsed.items())
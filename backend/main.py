@@ -1,39 +1,193 @@
 import os
 import shutil
 import json
+import uuid
+import hashlib
+import time
+import asyncio
+import zipfile
+import io
+import socket
+import threading
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, Query, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
-from agent import HandwritingExtractionAgent
+from agent import HandwritingExtractionAgent, startup_log
+from worker_pool import ExtractionPool, PoolSaturatedError
+from pdf_pages import count_pages, iter_pdf_pages
+from jobs import JobScheduler, JobQueueFullError, JobStore, KeyValueJobStore, MemoryJobStore, SQLiteJobStore, TERMINAL_STATUSES
+from metrics import metrics
+from shared_state import KeyValueStore, open_store
+from tenants import DEFAULT_TENANT, RateLimiter, current_tenant, retry_after_header
+
+IMPORTED_AT = time.time()
 
 # Load .env file from the backend directory
 env_path = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Debug aid: keep a copy of every upload on disk. Extraction itself never reads from UPLOAD_DIR.
+SAVE_UPLOADS = os.getenv("SAVE_UPLOADS", "false").lower() == "true"
+if SAVE_UPLOADS:
+    UPLOAD_DIR.mkdir(exist_ok=True)
 
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".pdf"}
 MAX_FILE_SIZE = 10 * 1024 * 1024
 
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "8"))
+EXTRACTION_MAX_INFLIGHT = int(os.getenv("EXTRACTION_MAX_INFLIGHT", str(EXTRACTION_WORKERS * 4)))
+SATURATED_STATUS_CODE = int(os.getenv("EXTRACTION_SATURATED_STATUS", "503"))
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+MAX_ARCHIVE_SIZE = int(os.getenv("BATCH_MAX_ARCHIVE_MB", "200")) * 1024 * 1024
+
+PDF_DEFAULT_DPI = int(os.getenv("PDF_DPI", "200"))
+PDF_MAX_DPI = 400
+PDF_PAGE_CONCURRENCY = int(os.getenv("PDF_PAGE_CONCURRENCY", "4"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "86400"))
+JOB_STORE_DB = os.getenv("JOB_STORE_DB")
+JOB_MAX_WAIT_SECONDS = 60
+
+# Cache, job and metrics state shared by the workers of a multi-worker deployment (see server.py)
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL")
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL_SECONDS", "5"))
+PURGE_INTERVAL = 600
+
+# Per-tenant token bucket on the extraction endpoints (0 disables); a batch costs one token per file,
+# a PDF one per page, and anything costing more than the burst is rejected outright
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", str(max(1.0, RATE_LIMIT_PER_MINUTE / 6))))
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST) if RATE_LIMIT_PER_MINUTE > 0 else None
+
 agent = None
+pool = None
+scheduler = None
+shared_state: Optional[KeyValueStore] = None
+startup: Dict[str, Any] = {"state": "starting", "worker": "0", "pid": os.getpid(), "ready_seconds": None}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    global pool, scheduler, shared_state
+    # Read here, not at import: server.py imports this module once and forks the workers afterwards
+    worker = os.getenv("HANDWRITING_WORKER_ID", "0")
+    workers = int(os.getenv("HANDWRITING_WORKERS", "1"))
+    startup.update(state="starting", worker=worker, pid=os.getpid(), ready_seconds=None)
+    pool = ExtractionPool(EXTRACTION_WORKERS, EXTRACTION_MAX_INFLIGHT)
+    startup_log(f"[OK] Extraction pool ready (workers={pool.workers}, max_inflight={pool.max_inflight})")
+    if SHARED_STATE_URL:
+        try:
+            shared_state = open_store(SHARED_STATE_URL)
+            startup_log(f"[OK] Sharing cache, job and metrics state between workers ({type(shared_state).__name__})")
+        except Exception as e:
+            print(f"[WARNING] Shared state unavailable, keeping state per worker: {e}")
+    
+    scheduler = JobScheduler(
+        _job_store(),
+        _run_job,
+        workers=JOB_WORKERS,
+        max_queued=JOB_MAX_QUEUED,
+        retention=JOB_RETENTION_SECONDS or None,
+        owner=f"{socket.gethostname()}/{worker}"
+    )
+    # Build the agent off the event loop so /health answers (as "starting") while clients are set up
+    agent_task = asyncio.create_task(_start_agent(_recoverable_jobs(int(worker), workers)))
+    publisher = asyncio.create_task(_publish_metrics(worker)) if shared_state else None
+    purger = asyncio.create_task(_purge_expired())
+    yield
+    # Shutdown
+    purger.cancel()
+    if publisher:
+        publisher.cancel()
+    await agent_task
+    await scheduler.stop()
+    pool.shutdown()
+    if agent:
+        agent.shutdown()
+    if shared_state:
+        shared_state.close()
+
+def _job_store() -> JobStore:
+    if JOB_STORE_DB:
+        return SQLiteJobStore(JOB_STORE_DB)
+    if shared_state:
+        return KeyValueJobStore(shared_state)
+    return MemoryJobStore()
+
+def _recoverable_jobs(worker: int, workers: int) -> Callable[[Dict[str, Any]], bool]:
+    """Interrupted jobs this worker restarts: those claimed by the worker it replaces and, for worker 0,
+    those of worker slots this deployment no longer has (or claimed before jobs had owners)"""
+    host = socket.gethostname()
+    def recoverable(job: Dict[str, Any]) -> bool:
+        if not job.get("owner"):
+            return worker == 0
+        owner_host, _, slot = job["owner"].rpartition("/")
+        if owner_host != host or not slot.isdigit():
+            return False
+        return int(slot) == worker or (worker == 0 and int(slot) >= workers)
+    return recoverable
+
+async def _start_agent(recover: Callable[[Dict[str, Any]], bool]):
     global agent
     try:
-        agent = HandwritingExtractionAgent()
-        print("[OK] Handwriting Extraction Agent initialized")
+        agent = await asyncio.to_thread(HandwritingExtractionAgent, shared_state)
+        startup_log("[OK] Handwriting Extraction Agent initialized")
     except Exception as e:
         print(f"[WARNING] Agent initialization failed: {e}")
         print("Please ensure Ollama is running and reachable (see README)")
-    yield
-    # Shutdown (if needed)
-    pass
+    scheduler.start(recover=recover)
+    startup["state"] = "ready" if agent else "failed"
+    startup["ready_seconds"] = round(time.time() - _process_started_at(), 3)
+    startup_log(f"[OK] Worker {startup['worker']} ready in {startup['ready_seconds']}s")
+
+def _process_started_at() -> float:
+    """Wall-clock time this process started (a forked worker: when it was forked), from /proc where available"""
+    try:
+        with open("/proc/self/stat") as stat, open("/proc/uptime") as uptime:
+            started_ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+            uptime_seconds = float(uptime.read().split()[0])
+        return time.time() - uptime_seconds + started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return IMPORTED_AT
+
+async def _publish_metrics(worker: str):
+    """Keep this worker's series visible to whichever worker answers the next /metrics scrape"""
+    while True:
+        try:
+            await asyncio.to_thread(metrics.publish, shared_state, worker, _local_gauges(), METRICS_PUBLISH_INTERVAL * 3)
+        except Exception as e:
+            print(f"[WARNING] Publishing metrics to shared state failed: {e}")
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+
+async def _purge_expired():
+    """Delete expired entries that storage backends only skip on read, at startup and then periodically"""
+    while True:
+        if shared_state:
+            try:
+                purged = await asyncio.to_thread(shared_state.purge_expired)
+                if purged:
+                    print(f"[INFO] Purged {purged} expired shared-state keys")
+            except Exception as e:
+                print(f"[WARNING] Purging expired shared-state keys failed: {e}")
+        if agent and agent.cache:
+            try:
+                purged = await asyncio.to_thread(agent.cache.purge_expired)
+                if purged:
+                    print(f"[INFO] Purged {purged} expired disk cache entries")
+            except Exception as e:
+                print(f"[WARNING] Purging expired disk cache entries failed: {e}")
+        await asyncio.sleep(PURGE_INTERVAL)
 
 app = FastAPI(
     title="Handwriting Extraction API",
@@ -50,6 +204,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, so /jobs/{job_id} stays one series
+    route = request.scope.get("route")
+    metrics.observe(
+        "handwriting_request_duration_seconds",
+        time.perf_counter() - started,
+        endpoint=getattr(route, "path", "unmatched"),
+        method=request.method,
+        status=response.status_code
+    )
+    return response
+
 @app.get("/")
 async def root():
     return {
@@ -57,7 +226,12 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "/upload": "POST - Upload handwritten image for extraction",
-            "/health": "GET - Health check"
+            "/upload/stream": "POST - Upload an image and stream tokens and fields as NDJSON while extracting",
+            "/upload/batch": "POST - Upload many images (or a zip archive) for concurrent extraction",
+            "/jobs": "POST - Queue an image for background extraction, returns a job id",
+            "/jobs/{job_id}": "GET - Job status and result (?wait=seconds to long-poll), DELETE - Cancel job",
+            "/health": "GET - Health check",
+            "/metrics": "GET - Prometheus metrics (stage latencies, payload sizes, cache and error counters)"
         }
     }
 
@@ -66,20 +240,138 @@ async def health_check():
     ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
     ollama_model = os.getenv("OLLAMA_MODEL", "llava")
     return {
-        "status": "healthy",
+        "status": "starting" if startup["state"] == "starting" else "healthy",
         "agent_initialized": agent is not None,
+        "startup": startup,
+        "shared_state": type(shared_state).__name__ if shared_state else None,
         "ollama_host": ollama_host,
         "ollama_model": ollama_model,
-        "langfuse_configured": bool(os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"))
+        "langfuse_configured": bool(os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY")),
+        "providers": agent.router.stats() if agent else None,
+        "tracing": agent.tracer.stats() if agent and agent.tracer else None,
+        "extraction_pool": pool.stats() if pool else None,
+        "result_cache": agent.cache.stats() if agent and agent.cache else None,
+        "inflight_dedup": agent.inflight.stats() if agent and agent.inflight else None,
+        "jobs": scheduler.stats() if scheduler else None,
+        "fair_share": agent.router.fair_share.stats() if agent and agent.router.fair_share else None,
+        "rate_limit": rate_limiter.stats() if rate_limiter else None,
+        # Recent percentiles of this worker only; /metrics aggregates across workers
+        "latency": metrics.summary()
     }
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    if not agent:
-        raise HTTPException(
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    gauges = _local_gauges()
+    snapshots = None
+    if shared_state:
+        try:
+            await asyncio.to_thread(metrics.publish, shared_state, startup["worker"], gauges, METRICS_PUBLISH_INTERVAL * 3)
+            snapshots, gauges = await asyncio.to_thread(metrics.collect, shared_state)
+        except Exception as e:
+            print(f"[WARNING] Reading shared metrics failed, reporting this worker only: {e}")
+    return PlainTextResponse(metrics.render(gauges, snapshots), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _local_gauges() -> Dict[str, Tuple[str, Any]]:
+    gauges = {}
+    if pool:
+        pool_stats = pool.stats()
+        gauges["handwriting_pool_in_flight"] = ("Extractions admitted to the worker pool", pool_stats["in_flight"])
+        gauges["handwriting_pool_waiting"] = ("Callers waiting for a worker pool slot", pool_stats["waiting"])
+    if scheduler:
+        gauges["handwriting_job_queue_depth"] = ("Background jobs waiting to run", scheduler.stats()["queue_depth"])
+    if agent:
+        gauges["handwriting_circuit_open:provider"] = (
+            "1 while a provider's circuit breaker is open or half-open",
+            {name: int(state != "closed") for name, state in agent.router.circuit_states().items()}
+        )
+        gauges["handwriting_provider_deadline_seconds:provider"] = (
+            "Current latency-derived per-call deadline",
+            {name: entry["deadline_s"] for name, entry in agent.router.stats().items()}
+        )
+        if agent.router.fair_share:
+            tenants = agent.router.fair_share.stats()["tenants"]
+            gauges["handwriting_tenant_queued:tenant"] = (
+                "Provider calls waiting for a fair-share slot, by tenant",
+                {tenant: entry["queued"] for tenant, entry in tenants.items()}
+            )
+            gauges["handwriting_tenant_running:tenant"] = (
+                "Provider calls holding a fair-share slot, by tenant",
+                {tenant: entry["running"] for tenant, entry in tenants.items()}
+            )
+    return gauges
+
+def _agent_unavailable() -> HTTPException:
+    if startup["state"] == "starting":
+        return HTTPException(
             status_code=503,
-            detail="Agent not initialized. Please ensure the Ollama service is running."
+            detail="Agent is still starting up. Please retry shortly.",
+            headers={"Retry-After": "2"}
+        )
+    return HTTPException(
+        status_code=503,
+        detail="Agent not initialized. Please ensure the Ollama service is running."
+    )
+
+def _tenant(request: Request) -> str:
+    """API key (hashed, so it never shows up in metrics) or else the client address"""
+    api_key = request.headers.get("x-api-key")
+    authorization = request.headers.get("authorization", "")
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return f"ip:{request.client.host}" if request.client else DEFAULT_TENANT
+
+def _charge(tenant: str, endpoint: str, cost: int):
+    """Take ``cost`` tokens (one per image or page) from the tenant's rate limit"""
+    if not rate_limiter or not cost:
+        return
+    if cost > rate_limiter.burst:
+        # Could never be admitted, however long the client waits
+        metrics.inc("handwriting_rate_limited_total", endpoint=endpoint)
+        raise HTTPException(
+            status_code=413,
+            detail=f"Request covers {cost} images or pages; the rate limit allows at most "
+                   f"{rate_limiter.burst:g} at once. Split it into smaller requests."
         )
+    retry_after = rate_limiter.acquire(tenant, cost)
+    if retry_after:
+        metrics.inc("handwriting_rate_limited_total", endpoint=endpoint)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for {tenant}. Please retry later.",
+            headers={"Retry-After": retry_after_header(retry_after)}
+        )
+
+def _admit(request: Request, endpoint: str, cost: int = 1) -> str:
+    """Charge the caller's rate limit and tag the request's provider calls with its tenant"""
+    tenant = _tenant(request)
+    _charge(tenant, endpoint, cost)
+    current_tenant.set(tenant)
+    return tenant
+
+def _saturated_response(e: PoolSaturatedError) -> HTTPException:
+    return HTTPException(
+        status_code=SATURATED_STATUS_CODE,
+        detail={
+            "message": "Server is busy processing other extractions. Please retry shortly.",
+            "queue": e.stats
+        },
+        headers={"Retry-After": "5"}
+    )
+
+@app.post("/upload")
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    dpi: int = Query(PDF_DEFAULT_DPI, ge=50, le=PDF_MAX_DPI, description="PDF rasterization DPI"),
+    first_page: Optional[int] = Query(None, ge=1, description="First PDF page to extract (1-based)"),
+    last_page: Optional[int] = Query(None, ge=1, description="Last PDF page to extract (inclusive)"),
+    # Sent as "schema"; a parameter of that name would shadow BaseModel.schema in the generated form model
+    schema_text: Optional[str] = Form(None, alias="schema", description="JSON Schema the extracted data is validated against")
+):
+    if not agent:
+        raise _agent_unavailable()
     
     filename = file.filename or "unknown.jpg"
     file_ext = Path(filename).suffix.lower()
@@ -88,16 +380,12 @@ async def upload_file(file: UploadFile = File(...)):
             status_code=400,
             detail=f"File type {file_ext} not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
+    # PDFs are charged per page once the page range is known
+    tenant = _admit(request, "/upload", cost=0 if file_ext == ".pdf" else 1)
+    extraction_schema = _parse_schema(schema_text)
     
-    if file_ext == ".pdf":
-        raise HTTPException(
-            status_code=400,
-            detail="PDF processing requires additional setup with poppler-utils. Please upload JPG or PNG images."
-        )
-    
-    file_path = None
     try:
-        contents = await file.read()
+        contents = await _read_upload(file)
         
         if len(contents) > MAX_FILE_SIZE:
             raise HTTPException(
@@ -105,24 +393,19 @@ async def upload_file(file: UploadFile = File(...)):
                 detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE / (1024*1024)}MB"
             )
         
-        file_path = UPLOAD_DIR / filename
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        result = agent.extract_handwriting(str(file_path), filename)
+        if SAVE_UPLOADS:
+            _save_upload_copy(contents, filename)
         
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            print(f"[WARNING] Failed to delete temporary file: {e}")
+        if file_ext == ".pdf":
+            result = await _extract_pdf(contents, filename, dpi, first_page, last_page, extraction_schema, tenant)
+        else:
+            try:
+                result = await pool.run(agent.extract_handwriting, contents, filename, extraction_schema)
+            except PoolSaturatedError as e:
+                raise _saturated_response(e)
         
         if result["success"]:
-            formatted_result = {
-                "success": result["success"],
-                "filename": result["filename"],
-                "message": result["message"],
-                "extracted_data": result["extracted_data"]
-            }
+            formatted_result = _format_result(result)
             return JSONResponse(
                 content=formatted_result,
                 media_type="application/json"
@@ -139,17 +422,399 @@ async def upload_file(file: UploadFile = File(...)):
         print(f"[ERROR] Upload error: {error_type}: {error_details}")
         print(f"[ERROR] Traceback: {traceback.format_exc()}")
         
-        if file_path and file_path.exists():
-            try:
-                os.remove(file_path)
-            except:
-                pass
-        
         raise HTTPException(
             status_code=500,
             detail=f"Error processing file: {error_type}: {error_details}"
         )
 
+def _parse_schema(schema: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not schema:
+        return None
+    try:
+        parsed = json.loads(schema)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"schema is not valid JSON: {e}")
+    if not isinstance(parsed, dict):
+        raise HTTPException(status_code=400, detail="schema must be a JSON object")
+    return parsed
+
+@app.post("/upload/stream")
+async def upload_stream(request: Request, file: UploadFile = File(...)):
+    """Stream extraction progress as NDJSON events.
+    
+    Event types: ``token`` (raw model text), ``field`` (a completed top-level
+    field with ``key`` and ``value``), then one final ``result`` in the /upload
+    response shape, or ``error`` if extraction crashed.
+    """
+    if not agent:
+        raise _agent_unavailable()
+    
+    filename = file.filename or "unknown.jpg"
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in ALLOWED_EXTENSIONS or file_ext == ".pdf":
+        raise HTTPException(
+            status_code=400,
+            detail=f"File type {file_ext} not supported for streaming"
+        )
+    
+    contents = await _read_upload(file)
+    if len(contents) > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE / (1024*1024)}MB"
+        )
+    
+    tenant = _admit(request, "/upload/stream")
+    
+    if pool.saturated:
+        raise _saturated_response(PoolSaturatedError(pool.stats()))
+    
+    return StreamingResponse(_stream_events(contents, filename, tenant), media_type="application/x-ndjson")
+
+async def _stream_events(contents: bytes, filename: str, tenant: str):
+    """Bridge the agent's blocking event generator, running on the pool, to an async NDJSON stream"""
+    # The response body is iterated outside the endpoint, so the tenant is set again here
+    current_tenant.set(tenant)
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    finished = object()
+    stop = threading.Event()
+    
+    def produce():
+        stream = agent.extract_handwriting_stream(contents, filename)
+        try:
+            for event in stream:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        finally:
+            # Closing the generator also closes the upstream model stream
+            stream.close()
+    
+    task = asyncio.create_task(pool.run(produce, wait=True))
+    task.add_done_callback(lambda _: events.put_nowait(finished))
+    try:
+        while True:
+            event = await events.get()
+            if event is finished:
+                break
+            if event["type"] == "result":
+                event = {"type": "result", **_format_result(event["result"])}
+            yield json.dumps(event) + "\n"
+        
+        if not task.cancelled() and task.exception():
+            e = task.exception()
+            print(f"[ERROR] Streaming extraction failed: {type(e).__name__}: {e}")
+            yield json.dumps({"type": "error", "error": f"{type(e).__name__}: {e}"}) + "\n"
+    finally:
+        # Client went away: let the worker thread stop at the next event
+        stop.set()
+
+async def _extract_pdf_page(
+    page_number: int,
+    page_bytes: bytes,
+    filename: str,
+    slots: asyncio.Semaphore,
+    schema: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        result = await pool.run(agent.extract_handwriting, page_bytes, f"{filename}#page={page_number}", schema, wait=True)
+    except Exception as e:
+        result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        slots.release()
+    
+    entry: Dict[str, Any] = {"page": page_number, "success": result["success"]}
+    if result["success"]:
+        entry["data"] = result["extracted_data"]
+        if "validation" in result:
+            entry["validation"] = result["validation"]
+        if result.get("page"):
+            entry["page_kind"] = result["page"]["kind"]
+    else:
+        entry["error"] = result.get("error", "Extraction failed")
+    entry["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return entry
+
+async def _extract_pdf(
+    contents: bytes,
+    filename: str,
+    dpi: int,
+    first_page: Optional[int],
+    last_page: Optional[int],
+    schema: Optional[Dict[str, Any]] = None,
+    tenant: Optional[str] = None
+) -> Dict[str, Any]:
+    """Rasterize a PDF page by page and extract pages concurrently, assembling results in page order.
+
+    A page is only rasterized once a concurrency slot is free, so at most
+    PDF_PAGE_CONCURRENCY page bitmaps are held in memory at a time.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        total_pages = await loop.run_in_executor(None, count_pages, contents)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read PDF: {type(e).__name__}: {e}")
+    
+    first = first_page or 1
+    last = min(last_page or total_pages, total_pages)
+    if first > last:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid page range {first}-{last_page or total_pages} for a {total_pages}-page document"
+        )
+    if last - first + 1 > PDF_MAX_PAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Page range covers {last - first + 1} pages; maximum allowed is {PDF_MAX_PAGES}"
+        )
+    if tenant:
+        _charge(tenant, "/upload", last - first + 1)
+    
+    pages = iter_pdf_pages(contents, dpi=dpi, first_page=first, last_page=last)
+    slots = asyncio.Semaphore(max(1, PDF_PAGE_CONCURRENCY))
+    tasks: List[asyncio.Task] = []
+    try:
+        while True:
+            await slots.acquire()
+            page = await loop.run_in_executor(None, next, pages, None)
+            if page is None:
+                slots.release()
+                break
+            page_number, page_bytes = page
+            tasks.append(asyncio.create_task(_extract_pdf_page(page_number, page_bytes, filename, slots, schema)))
+    finally:
+        try:
+            pages.close()
+        except ValueError:
+            # Cancelled while a page was still being rasterized in a worker thread
+            pass
+        page_entries = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    page_entries = [entry for entry in page_entries if isinstance(entry, dict)]
+    succeeded = sum(1 for entry in page_entries if entry["success"])
+    if not succeeded:
+        return {
+            "success": False,
+            "filename": filename,
+            "error": f"Extraction failed for all {len(page_entries)} pages",
+            "message": "Failed to extract handwriting from PDF"
+        }
+    return {
+        "success": True,
+        "filename": filename,
+        "message": f"Handwriting extracted from {succeeded} of {len(page_entries)} pages",
+        "extracted_data": {
+            "page_count": total_pages,
+            "pages": page_entries
+        }
+    }
+
+def _format_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape an agent result into the public response format"""
+    if result["success"]:
+        formatted = {
+            "success": result["success"],
+            "filename": result["filename"],
+            "message": result["message"],
+            "extracted_data": result["extracted_data"]
+        }
+        if result.get("parsing", {}).get("repairs"):
+            formatted["repairs"] = result["parsing"]["repairs"]
+        if "validation" in result:
+            formatted["validation"] = result["validation"]
+        if result.get("template"):
+            formatted["template"] = result["template"]
+        if result.get("page"):
+            formatted["page"] = result["page"]
+        return formatted
+    return {
+        "success": False,
+        "filename": result["filename"],
+        "message": result.get("message", "Extraction failed"),
+        "error": result.get("error", "Extraction failed")
+    }
+
+# A batch item is its filename plus a coroutine factory that yields its bytes on demand,
+# so archive members are only decompressed when a concurrency slot is free.
+BatchItem = Tuple[str, Callable[[], Awaitable[bytes]]]
+
+async def _read_upload(upload: UploadFile) -> bytes:
+    """Read an upload once, capped just past the size limit (Starlette has already spooled it)"""
+    started = time.perf_counter()
+    contents = await upload.read(MAX_FILE_SIZE + 1)
+    metrics.observe("handwriting_stage_duration_seconds", time.perf_counter() - started, stage="upload_read")
+    metrics.observe("handwriting_payload_bytes", len(contents), kind="upload")
+    return contents
+
+async def _read_archive_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    if info.file_size > MAX_FILE_SIZE:
+        raise ValueError(f"File size exceeds maximum allowed size of {MAX_FILE_SIZE / (1024*1024)}MB")
+    # Decompression is CPU-bound; ZipFile serialises concurrent member reads on its own lock
+    return await asyncio.to_thread(archive.read, info)
+
+async def _expand_batch(files: List[UploadFile]) -> List[BatchItem]:
+    items: List[BatchItem] = []
+    for upload in files:
+        filename = upload.filename or "unknown.jpg"
+        if Path(filename).suffix.lower() != ".zip":
+            items.append((filename, partial(_read_upload, upload)))
+            continue
+        
+        data = await upload.read(MAX_ARCHIVE_SIZE + 1)
+        if len(data) > MAX_ARCHIVE_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Archive {filename} exceeds maximum allowed size of {MAX_ARCHIVE_SIZE / (1024*1024)}MB"
+            )
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail=f"Archive {filename} is not a valid zip file")
+        
+        for info in archive.infolist():
+            member_name = Path(info.filename).name
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or member_name.startswith("."):
+                continue
+            items.append((member_name, partial(_read_archive_member, archive, info)))
+    return items
+
+async def _process_batch_item(filename: str, load: Callable[[], Awaitable[bytes]], slots: asyncio.Semaphore) -> Dict[str, Any]:
+    async with slots:
+        started = time.perf_counter()
+        try:
+            file_ext = Path(filename).suffix.lower()
+            if file_ext not in ALLOWED_EXTENSIONS or file_ext == ".pdf":
+                raise ValueError(f"File type {file_ext} not supported in batches")
+            
+            contents = await load()
+            if len(contents) > MAX_FILE_SIZE:
+                raise ValueError(f"File size exceeds maximum allowed size of {MAX_FILE_SIZE / (1024*1024)}MB")
+            
+            result = await pool.run(agent.extract_handwriting, contents, filename, wait=True)
+            entry = _format_result(result)
+        except ValueError as e:
+            entry = {"success": False, "filename": filename, "message": "File rejected", "error": str(e)}
+        except Exception as e:
+            print(f"[ERROR] Batch item {filename} failed: {type(e).__name__}: {e}")
+            entry = {
+                "success": False,
+                "filename": filename,
+                "message": "Failed to process file",
+                "error": f"{type(e).__name__}: {e}"
+            }
+        entry["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return entry
+
+@app.post("/upload/batch")
+async def upload_batch(request: Request, files: List[UploadFile] = File(...)):
+    if not agent:
+        raise _agent_unavailable()
+    
+    started = time.perf_counter()
+    items = await _expand_batch(files)
+    if not items:
+        raise HTTPException(status_code=400, detail="No files found in batch")
+    if len(items) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch contains {len(items)} files; maximum allowed is {BATCH_MAX_FILES}"
+        )
+    _admit(request, "/upload/batch", cost=len(items))
+    
+    slots = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+    results = await asyncio.gather(*(
+        _process_batch_item(filename, load, slots) for filename, load in items
+    ))
+    
+    succeeded = sum(1 for entry in results if entry["success"])
+    return {
+        "success": succeeded == len(results),
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "wall_clock_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": results
+    }
+
+async def _run_job(contents: bytes, filename: str, tenant: Optional[str]) -> Dict[str, Any]:
+    if not agent:
+        raise RuntimeError("Agent not initialized")
+    # Runs on the scheduler's own task; jobs queued before tenants were recorded share the default
+    current_tenant.set(tenant or DEFAULT_TENANT)
+    result = await pool.run(agent.extract_handwriting, contents, filename, wait=True)
+    return _format_result(result)
+
+def _public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "filename": job["filename"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "result": job["result"],
+        "error": job["error"]
+    }
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request, file: UploadFile = File(...), priority: int = Form(0)):
+    if not agent:
+        raise _agent_unavailable()
+    
+    filename = file.filename or "unknown.jpg"
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in ALLOWED_EXTENSIONS or file_ext == ".pdf":
+        raise HTTPException(
+            status_code=400,
+            detail=f"File type {file_ext} not supported for jobs"
+        )
+    
+    contents = await _read_upload(file)
+    if len(contents) > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE / (1024*1024)}MB"
+        )
+    
+    tenant = _admit(request, "/jobs")
+    
+    try:
+        job = scheduler.submit(contents, filename, priority, tenant)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return _public_job(job)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    if wait > 0:
+        job = await scheduler.wait(job_id, min(wait, JOB_MAX_WAIT_SECONDS))
+    else:
+        job = scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return _public_job(job)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already {job['status']}")
+    return _public_job(scheduler.cancel(job_id))
+
+def _save_upload_copy(contents: bytes, filename: str):
+    """Write a debug copy of an upload under a unique name so concurrent uploads never collide"""
+    try:
+        file_path = UPLOAD_DIR / f"{uuid.uuid4().hex}_{Path(filename).name}"
+        with open(file_path, "wb") as f:
+            f.write(contents)
+    except Exception as e:
+        print(f"[WARNING] Failed to save upload copy: {e}")
+
 @app.delete("/cleanup")
 async def cleanup_uploads():
     try:
@@ -163,5 +828,6 @@ async def cleanup_uploads():
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
+    # Single process; use server.py for a multi-worker deployment
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
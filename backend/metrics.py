@@ -0,0 +1,278 @@
+import bisect
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = tuple(float(1024 * 2 ** power) for power in range(0, 15, 2))  # 1KB .. 16MB
+# Labelled gauges that count things per label (so workers' values add up) rather than report a state
+SUMMED_LABELLED_GAUGES = {"handwriting_tenant_queued", "handwriting_tenant_running"}
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative Prometheus buckets plus a window of recent samples for percentiles"""
+
+    def __init__(self, buckets: Iterable[float], window: int):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent: deque = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self, points: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> Dict[str, float]:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {}
+        return {
+            f"p{int(point * 100)}": ordered[min(len(ordered) - 1, int(point * len(ordered)))]
+            for point in points
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in the Prometheus text format.
+
+    Histograms keep cumulative buckets for scraping and the last ``window``
+    samples per label set, from which ``summary`` reports p50/p95/p99.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+        self._histograms.setdefault(name, {})
+
+    def counter(self, name: str, help_text: str):
+        self._meta[name] = ("counter", help_text, ())
+        self._counters.setdefault(name, {})
+
+    def observe(self, name: str, value: float, **labels: Any):
+        key = _label_set(labels)
+        with self._lock:
+            series = self._histograms[name]
+            if key not in series:
+                series[key] = Histogram(self._meta[name][2], self.window)
+            series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: Any):
+        key = _label_set(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe_spans(self, spans: List[Dict[str, Any]]):
+        """Feed StageTimer spans into the per-stage latency and CPU histograms"""
+        for span in spans:
+            self.observe("handwriting_stage_duration_seconds", span["duration_ms"] / 1000, stage=span["name"])
+            if "cpu_ms" in span:
+                self.observe("handwriting_stage_cpu_seconds", span["cpu_ms"] / 1000, stage=span["name"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counter values and histogram buckets as JSON-ready data, for merging across worker processes"""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [[list(key), value] for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [[list(key), list(histogram.counts), histogram.sum, histogram.count] for key, histogram in series.items()]
+                    for name, series in self._histograms.items()
+                }
+            }
+
+    def render(
+        self,
+        gauges: Optional[Dict[str, Tuple[str, Any]]] = None,
+        snapshots: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
+        """Prometheus text exposition.
+
+        ``gauges`` maps name -> (help, value) sampled at scrape time, where value is
+        a number or a ``{label value: number}`` dict labelled by the name's suffix
+        after ``:`` (e.g. ``"handwriting_circuit_open:provider"``). ``snapshots``
+        (from ``snapshot`` in every worker process) are summed and rendered instead
+        of this process's own series.
+        """
+        counters, histograms = _merge(snapshots if snapshots else [self.snapshot()])
+        lines: List[str] = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for key, value in counters.get(name, {}).items():
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            for key, (counts, total, count) in histograms.get(name, {}).items():
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, le=_format_value(bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, le='+Inf')} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        for key, (help_text, value) in (gauges or {}).items():
+            name, _, label = key.partition(":")
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for label_value, number in value.items():
+                    lines.append(f"{name}{_format_labels(((label, str(label_value)),))} {_format_value(number)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """Recent p50/p95/p99 per histogram series (latencies in ms) plus counter totals"""
+        summary: Dict[str, Any] = {}
+        with self._lock:
+            for name, series in self._histograms.items():
+                scale = 1000 if name.endswith("_seconds") else 1
+                entries = {}
+                for key, histogram in series.items():
+                    entry = {"count": histogram.count}
+                    entry.update({
+                        point: round(value * scale, 2)
+                        for point, value in histogram.quantiles().items()
+                    })
+                    entries[",".join(f"{k}={v}" for k, v in key) or "all"] = entry
+                if entries:
+                    summary[name] = entries
+            for name, series in self._counters.items():
+                if series:
+                    summary[name] = {",".join(f"{k}={v}" for k, v in key) or "all": value for key, value in series.items()}
+        return summary
+
+
+    def publish(self, store: Any, worker: str, gauges: Optional[Dict[str, Tuple[str, Any]]] = None, ttl: float = 15):
+        """Share this process's series and scrape-time gauges with the other workers through ``store``
+        (a shared_state.KeyValueStore); the entry expires unless republished within ``ttl`` seconds"""
+        store.set(f"metrics:worker:{worker}", json.dumps({"metrics": self.snapshot(), "gauges": gauges or {}}), ex=ttl)
+        store.sadd("metrics:workers", worker)
+
+    def collect(self, store: Any) -> Tuple[List[Dict[str, Any]], Dict[str, Tuple[str, Any]]]:
+        """Snapshots of every worker that published recently, and their gauges combined.
+
+        Plain gauges (queue depths, in-flight counts) and the per-label counts in
+        SUMMED_LABELLED_GAUGES are summed; other labelled gauges (circuit state,
+        deadlines) keep the highest value any worker reported.
+        """
+        snapshots: List[Dict[str, Any]] = []
+        gauges: Dict[str, Tuple[str, Any]] = {}
+        for worker in sorted(store.smembers("metrics:workers")):
+            raw = store.get(f"metrics:worker:{worker}")
+            if raw is None:
+                # Expired: the worker stopped (or was scaled away) without unregistering
+                store.srem("metrics:workers", worker)
+                continue
+            entry = json.loads(raw)
+            snapshots.append(entry["metrics"])
+            for key, (help_text, value) in entry["gauges"].items():
+                if key not in gauges:
+                    gauges[key] = (help_text, value)
+                elif isinstance(value, dict):
+                    summed = key.partition(":")[0] in SUMMED_LABELLED_GAUGES
+                    merged = dict(gauges[key][1])
+                    for label_value, number in value.items():
+                        if summed:
+                            merged[label_value] = merged.get(label_value, 0) + number
+                        else:
+                            merged[label_value] = max(merged.get(label_value, number), number)
+                    gauges[key] = (help_text, merged)
+                else:
+                    gauges[key] = (help_text, gauges[key][1] + value)
+        return snapshots, gauges
+
+
+def _merge(snapshots: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[LabelSet, float]], Dict[str, Dict[LabelSet, list]]]:
+    """Sum counters and histogram buckets series by series across snapshots"""
+    counters: Dict[str, Dict[LabelSet, float]] = {}
+    histograms: Dict[str, Dict[LabelSet, list]] = {}
+    for snapshot in snapshots:
+        for name, series in snapshot["counters"].items():
+            merged = counters.setdefault(name, {})
+            for key, value in series:
+                key = tuple(tuple(pair) for pair in key)
+                merged[key] = merged.get(key, 0) + value
+        for name, series in snapshot["histograms"].items():
+            merged = histograms.setdefault(name, {})
+            for key, counts, total, count in series:
+                key = tuple(tuple(pair) for pair in key)
+                if key not in merged:
+                    merged[key] = [list(counts), total, count]
+                else:
+                    entry = merged[key]
+                    entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                    entry[1] += total
+                    entry[2] += count
+    return counters, histograms
+
+
+def _label_set(labels: Dict[str, Any]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelSet, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = MetricsRegistry()
+metrics.histogram(
+    "handwriting_stage_duration_seconds",
+    "Time spent in each extraction stage (upload_read, decode, preprocess, compress, encode, model_call, parse)"
+)
+metrics.histogram(
+    "handwriting_request_duration_seconds",
+    "HTTP request latency until response headers, by endpoint and status"
+)
+metrics.histogram(
+    "handwriting_stage_cpu_seconds",
+    "CPU time the handling thread spent in each extraction stage"
+)
+metrics.histogram(
+    "handwriting_fair_share_wait_seconds",
+    "Time provider calls waited for a slot under the global concurrency cap"
+)
+metrics.histogram("handwriting_payload_bytes", "Upload and model payload sizes", SIZE_BUCKETS)
+metrics.counter("handwriting_extractions_total", "Extractions by provider and outcome")
+metrics.counter("handwriting_cache_requests_total", "Result cache lookups by result")
+metrics.counter("handwriting_errors_total", "Failed extractions by error type")
+metrics.counter("handwriting_json_repairs_total", "Model replies that needed a JSON repair, by repair")
+metrics.counter("handwriting_json_unrecovered_total", "Model replies with no recoverable JSON")
+metrics.counter("handwriting_provider_calls_total", "Provider calls by outcome (success, error, timeout)")
+metrics.counter("handwriting_provider_retries_total", "Provider calls repeated after a retryable failure")
+metrics.counter("handwriting_provider_hedges_total", "Hedged duplicate calls issued because the primary provider was slow")
+metrics.counter("handwriting_provider_hedge_wins_total", "Hedged calls that answered before the primary")
+metrics.counter("handwriting_page_gate_total", "Pages classified by the local gate, by kind (blank pages skip the model)")
+metrics.counter("handwriting_template_matches_total", "Pages checked against form templates, by matched template (none = full page)")
+metrics.counter(
+    "handwriting_inflight_requests_total",
+    "Extractions by single-flight role: leader (ran the extraction) or coalesced (shared a concurrent identical one)"
+)
+metrics.counter("handwriting_rate_limited_total", "Requests rejected by the per-tenant rate limit, by endpoint")
@@ -0,0 +1,148 @@
+import io
+from typing import Any, Dict, Optional
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+BLANK = "blank"
+PRINTED = "printed"
+HANDWRITTEN = "handwritten"
+
+
+class PageGate:
+    """Cheap local page classifier run before any model call.
+
+    Works on a small grayscale copy of the page: ink is whatever is at least
+    ``ink_contrast`` levels darker than the local background, so paper tint,
+    lighting gradients and faint show-through from the back side do not count.
+    Long horizontal runs (ruled lines, form borders) are set aside, then:
+
+    - a page whose ink covers less than ``blank_max_ink`` of its area is blank.
+      This test has its own, lower ``blank_contrast`` and runs at up to twice
+      the working width, because downscaling thins pencil and light-scan
+      strokes below ``ink_contrast``. Faint pages that pass it but show too
+      little full-contrast ink to judge are treated as handwritten;
+    - a page whose ink edges are mostly horizontal/vertical (fewer than
+      ``printed_max_diagonal`` of them slanted) is printed: type is upright,
+      handwriting is full of slanted and curved strokes.
+    """
+
+    def __init__(
+        self,
+        blank_max_ink: float = 0.0005,
+        printed_max_diagonal: float = 0.3,
+        ink_contrast: float = 40,
+        blank_contrast: float = 20,
+        max_aspect: float = 4.0,
+        width: int = 800
+    ):
+        self.blank_max_ink = blank_max_ink
+        self.printed_max_diagonal = printed_max_diagonal
+        self.ink_contrast = ink_contrast
+        self.blank_contrast = blank_contrast
+        self.max_aspect = max_aspect
+        self.width = width
+
+    def classify(self, image_bytes: bytes) -> Optional[Dict[str, Any]]:
+        """Returns ``kind`` (blank, printed or handwritten) plus the statistics it was decided on,
+        or None for strips too elongated to judge (receipts, slices), which go to the model as they are"""
+        page = self._load(image_bytes)
+        if page is None:
+            return None
+        gray = self._scaled(page, self.width)
+        pixels = np.asarray(gray, dtype=np.float32)
+        ink = self._ink(gray, self.ink_contrast)
+        lines, line_count, runs = self._ruled_lines(ink)
+        strokes = ink & ~lines
+
+        # Edge orientation around the strokes: 0 degrees is a horizontal gradient (a vertical stroke)
+        gy, gx = np.gradient(pixels)
+        near_strokes = strokes.copy()
+        near_strokes[1:] |= strokes[:-1]
+        near_strokes[:-1] |= strokes[1:]
+        near_strokes[:, 1:] |= strokes[:, :-1]
+        near_strokes[:, :-1] |= strokes[:, 1:]
+        edges = (np.hypot(gx, gy) > self.ink_contrast * 0.75) & near_strokes & ~lines
+        angles = np.degrees(np.arctan2(np.abs(gy[edges]), np.abs(gx[edges])))
+        diagonal = float(((angles > 30) & (angles < 60)).mean()) if angles.size else 0.0
+
+        ink_density = float(strokes.mean())
+        faint_density = ink_density
+        if ink_density < self.blank_max_ink:
+            # Nothing at full contrast: look again at twice the width with the lower blank threshold
+            fine = self._scaled(page, max(self.width, min(page.width, 2 * self.width)))
+            faint_ink = self._ink(fine, self.blank_contrast)
+            faint_lines, _, _ = self._ruled_lines(faint_ink)
+            faint_density = float((faint_ink & ~faint_lines).mean())
+        if faint_density < self.blank_max_ink:
+            kind = BLANK
+        elif ink_density < self.blank_max_ink or not angles.size:
+            # Only faint ink: too few sharp edges to tell type from handwriting, so take the full pipeline
+            kind = HANDWRITTEN
+        elif diagonal < self.printed_max_diagonal:
+            kind = PRINTED
+        else:
+            kind = HANDWRITTEN
+        return {
+            "kind": kind,
+            "ink_density": round(ink_density, 5),
+            "faint_ink_density": round(faint_density, 5),
+            "edge_density": round(float(edges.mean()), 5),
+            "diagonal_edge_ratio": round(diagonal, 3),
+            "stroke_width": round(float(np.median(runs)), 2) if runs.size else 0.0,
+            "ruled_lines": line_count
+        }
+
+    def _load(self, image_bytes: bytes) -> Optional[Image.Image]:
+        """Upright grayscale page, decoded no larger than needed; None when the aspect ratio is past ``max_aspect``"""
+        img = Image.open(io.BytesIO(image_bytes))
+        # Checked on the header size, before decoding: the working height follows the aspect ratio
+        if max(img.size) > self.max_aspect * min(img.size):
+            return None
+        if img.format == "JPEG":
+            # Let libjpeg decode at a reduced DCT scale; the gate only needs a thumbnail
+            img.draft("L", (self.width, self.width))
+        return ImageOps.exif_transpose(img).convert("L")
+
+    @staticmethod
+    def _scaled(gray: Image.Image, width: int) -> Image.Image:
+        if gray.width == width:
+            return gray
+        return gray.resize((width, max(1, round(gray.height * width / gray.width))), Image.Resampling.BILINEAR)
+
+    def _ink(self, gray: Image.Image, contrast: float) -> np.ndarray:
+        """Pixels at least ``contrast`` levels darker than the local background, despeckled"""
+        pixels = np.asarray(gray, dtype=np.float32)
+        background = np.asarray(gray.filter(ImageFilter.BoxBlur(gray.width // 40)), dtype=np.float32)
+        return self._despeckle(background - pixels > contrast)
+
+    @staticmethod
+    def _despeckle(mask: np.ndarray) -> np.ndarray:
+        """Drop ink pixels with fewer than two inked 4-neighbours (dust, sensor noise, JPEG ringing)"""
+        neighbours = np.zeros(mask.shape, dtype=np.uint8)
+        neighbours[1:] += mask[:-1]
+        neighbours[:-1] += mask[1:]
+        neighbours[:, 1:] += mask[:, :-1]
+        neighbours[:, :-1] += mask[:, 1:]
+        return mask & (neighbours >= 2)
+
+    @staticmethod
+    def _ruled_lines(ink: np.ndarray):
+        """Mask of horizontal ink runs longer than 5% of the width (plus a 2px margin), their count,
+        and the lengths of the remaining, stroke-sized runs"""
+        padded = np.pad(ink, ((0, 0), (1, 1))).astype(np.int8)
+        change = np.diff(padded, axis=1)
+        rows, starts = np.nonzero(change == 1)
+        _, ends = np.nonzero(change == -1)
+        lengths = ends - starts
+        long = lengths > ink.shape[1] * 0.05
+
+        # Paint long runs with +1/-1 markers and a cumulative sum instead of a Python loop
+        markers = np.zeros((ink.shape[0], ink.shape[1] + 1), dtype=np.int32)
+        np.add.at(markers, (rows[long], starts[long]), 1)
+        np.add.at(markers, (rows[long], ends[long]), -1)
+        lines = np.cumsum(markers, axis=1)[:, :-1] > 0
+        thick = lines.copy()
+        for offset in (1, 2):
+            thick[offset:] |= lines[:-offset]
+            thick[:-offset] |= lines[offset:]
+        return thick, int(long.sum()), lengths[~long]
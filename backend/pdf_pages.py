@@ -0,0 +1,49 @@
+import io
+import os
+import tempfile
+from typing import Iterator, Optional, Tuple
+from PyPDF2 import PdfReader
+from pdf2image import convert_from_path
+
+
+def count_pages(data: bytes) -> int:
+    """Number of pages in a PDF document"""
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+
+def iter_pdf_pages(
+    data: bytes,
+    dpi: int = 200,
+    first_page: int = 1,
+    last_page: Optional[int] = None
+) -> Iterator[Tuple[int, bytes]]:
+    """Rasterize a PDF one page at a time, yielding (page_number, jpeg_bytes).
+
+    Only a single page bitmap is alive at once, so memory stays flat regardless of
+    document length. poppler needs a real file, so the PDF is written to one
+    temporary file for the lifetime of the generator.
+    """
+    if last_page is None:
+        last_page = count_pages(data)
+
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as pdf_file:
+            pdf_file.write(data)
+
+        for page_number in range(first_page, last_page + 1):
+            images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)
+            if not images:
+                continue
+            page_image = images[0]
+            if page_image.mode != "RGB":
+                page_image = page_image.convert("RGB")
+            buffer = io.BytesIO()
+            page_image.save(buffer, format="JPEG", quality=90)
+            page_image.close()
+            yield page_number, buffer.getvalue()
+    finally:
+        try:
+            os.remove(pdf_path)
+        except OSError:
+            pass
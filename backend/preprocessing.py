@@ -0,0 +1,217 @@
+import io
+import time
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageOps
+from tracing import StageTimer
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Upload formats that may be forwarded to the model unchanged
+PASSTHROUGH_MIME_TYPES = {**MIME_TYPES, "PNG": "image/png"}
+
+
+class ImagePreprocessor:
+    """Size-aware preprocessing that turns an upload into a compact, model-ready image.
+
+    The pipeline downsamples to the vision model's native input size, drops colour
+    when the page is effectively monochrome, applies contrast stretching plus a
+    3x3 median denoise and light unsharp mask as NumPy array ops, and finally
+    picks the highest encoder quality that fits within ``byte_budget``. An upload
+    that needed no resizing and is already smaller than that re-encoding (and
+    within budget) is sent as it is.
+    """
+
+    def __init__(
+        self,
+        max_edge: int = 1536,
+        min_edge: int = 512,
+        grayscale: str = "auto",
+        denoise: bool = True,
+        output_format: str = "JPEG",
+        byte_budget: int = 500 * 1024,
+        min_quality: int = 50,
+        max_quality: int = 92
+    ):
+        self.max_edge = max_edge
+        self.min_edge = min_edge
+        self.grayscale = grayscale
+        self.denoise = denoise
+        self.output_format = output_format.upper() if output_format.upper() in MIME_TYPES else "JPEG"
+        self.byte_budget = byte_budget
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+
+    @property
+    def signature(self) -> str:
+        """Identifies the settings that shape the output, for keying memoized encodings"""
+        return (
+            f"{self.max_edge}|{self.min_edge}|{self.grayscale}|{int(self.denoise)}|"
+            f"{self.output_format}|{self.byte_budget}|{self.min_quality}|{self.max_quality}"
+        )
+
+    def load(self, image_bytes: bytes) -> Image.Image:
+        """Decode and resize an image to the configured edge bounds"""
+        img = Image.open(io.BytesIO(image_bytes))
+        original_edge = max(img.size)
+        if original_edge > self.max_edge and img.format == "JPEG":
+            # Let libjpeg decode at a reduced DCT scale instead of inflating the full bitmap
+            scale = self.max_edge / original_edge
+            img.draft("RGB", (int(img.size[0] * scale), int(img.size[1] * scale)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        width, height = img.size
+        longest = max(width, height)
+        if longest > self.max_edge:
+            scale = self.max_edge / longest
+            img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.LANCZOS)
+        elif longest < self.min_edge:
+            scale = self.min_edge / longest
+            img = img.resize((round(width * scale), round(height * scale)), Image.Resampling.LANCZOS)
+        return img
+
+    def enhance(self, img: Image.Image) -> Tuple[Image.Image, bool]:
+        """Contrast stretch, denoise and sharpen; returns the image and whether it was made grayscale"""
+        pixels = np.asarray(img)
+        if pixels.ndim == 3 and self._should_grayscale(pixels):
+            pixels = pixels.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+        pixels = self._stretch_contrast(pixels)
+        if self.denoise:
+            pixels = self._denoise_and_sharpen(pixels)
+
+        return Image.fromarray(pixels), pixels.ndim == 2
+
+    def process(self, image_bytes: bytes, timer: Optional[StageTimer] = None) -> Tuple[bytes, str, Dict[str, Any]]:
+        """Run the full pipeline, returning (encoded bytes, mime type, stats); stages are timed on ``timer``"""
+        timer = timer or StageTimer()
+        started = time.perf_counter()
+        with timer.stage("decode"):
+            with Image.open(io.BytesIO(image_bytes)) as probe:
+                original_size = probe.size
+                original_format = probe.format
+                original_gray = probe.mode in ("1", "L")
+                # EXIF rotation is applied on load; an upload relying on it can't be sent as it is
+                upright = probe.getexif().get(0x0112, 1) == 1
+            img = self.load(image_bytes)
+        with timer.stage("preprocess"):
+            img, is_gray = self.enhance(img)
+        with timer.stage("compress"):
+            encoded, quality = self._encode_within_budget(img)
+        durations = timer.durations()
+
+        output_format = self.output_format
+        passthrough = (
+            upright
+            and img.size == original_size
+            and original_format in PASSTHROUGH_MIME_TYPES
+            and len(image_bytes) <= min(len(encoded), self.byte_budget)
+        )
+        if passthrough:
+            # Already compact: re-encoding would only grow it (and re-compress the artifacts)
+            encoded, quality, output_format = image_bytes, None, original_format
+            is_gray = original_gray
+
+        stats = {
+            "original_bytes": len(image_bytes),
+            "output_bytes": len(encoded),
+            "bytes_saved": len(image_bytes) - len(encoded),
+            "original_size": list(original_size),
+            "output_size": list(img.size),
+            "grayscale": is_gray,
+            "format": output_format,
+            "quality": quality,
+            "passthrough": passthrough,
+            "decode_ms": durations["decode"],
+            "enhance_ms": durations["preprocess"],
+            "compress_ms": durations["compress"],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        return encoded, PASSTHROUGH_MIME_TYPES[output_format], stats
+
+    def _should_grayscale(self, pixels: np.ndarray) -> bool:
+        if self.grayscale == "never":
+            return False
+        if self.grayscale == "always":
+            return True
+        # Sample every 4th pixel: mean channel spread is a cheap proxy for "is there colour ink"
+        sample = pixels[::4, ::4]
+        spread = sample.max(axis=2).astype(np.int16) - sample.min(axis=2)
+        return float(spread.mean()) < 12.0
+
+    def _stretch_contrast(self, pixels: np.ndarray) -> np.ndarray:
+        """Linearly map the 1st..99th luminance percentiles onto the full 0..255 range"""
+        luminance = pixels if pixels.ndim == 2 else pixels[::2, ::2].mean(axis=2)
+        low, high = np.percentile(luminance[::2, ::2], (1, 99))
+        if high - low < 1:
+            return np.clip(pixels, 0, 255).astype(np.uint8)
+        # Lookup table instead of per-pixel float math: 256 entries cover every uint8 input
+        if pixels.dtype == np.uint8:
+            table = np.clip((np.arange(256, dtype=np.float32) - low) * (255.0 / (high - low)), 0, 255)
+            return table.astype(np.uint8)[pixels]
+        return np.clip((pixels - low) * (255.0 / (high - low)), 0, 255).astype(np.uint8)
+
+    def _denoise_and_sharpen(self, pixels: np.ndarray) -> np.ndarray:
+        """Exact 3x3 median filter followed by a light unsharp mask, all as whole-array min/max ops"""
+        height, width = pixels.shape[:2]
+        pad = ((1, 1), (1, 1)) + ((0, 0),) * (pixels.ndim - 2)
+        padded = np.pad(pixels, pad, mode="edge")
+
+        # Sort each vertical triple, then the median of the 3x3 window is
+        # med3(max of column minima, med3 of column middles, min of column maxima)
+        top, mid, bottom = padded[:-2], padded[1:-1], padded[2:]
+        low = np.minimum(np.minimum(top, mid), bottom)
+        high = np.maximum(np.maximum(top, mid), bottom)
+        middle = np.maximum(np.minimum(top, mid), np.minimum(np.maximum(top, mid), bottom))
+
+        def columns(plane: np.ndarray):
+            return plane[:, :-2], plane[:, 1:-1], plane[:, 2:]
+
+        lows = columns(low)
+        highs = columns(high)
+        middles = columns(middle)
+        max_low = np.maximum(np.maximum(lows[0], lows[1]), lows[2])
+        min_high = np.minimum(np.minimum(highs[0], highs[1]), highs[2])
+        a, b, c = middles
+        med_mid = np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+        median = np.maximum(
+            np.minimum(max_low, med_mid),
+            np.minimum(np.maximum(max_low, med_mid), min_high)
+        )
+
+        # Separable 3x3 box blur of the padded input for the unsharp mask
+        padded_f = padded.astype(np.float32)
+        vertical = padded_f[:-2] + padded_f[1:-1] + padded_f[2:]
+        blurred = (vertical[:, :-2] + vertical[:, 1:-1] + vertical[:, 2:]) / 9.0
+        median_f = median.astype(np.float32)
+        sharpened = median_f + 0.3 * (median_f - blurred)
+        return np.clip(sharpened, 0, 255).astype(np.uint8)
+
+    def _encode(self, img: Image.Image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        if self.output_format == "WEBP":
+            img.save(buffer, format="WEBP", quality=quality, method=4)
+        else:
+            img.save(buffer, format="JPEG", quality=quality, optimize=True)
+        return buffer.getvalue()
+
+    def _encode_within_budget(self, img: Image.Image) -> Tuple[bytes, int]:
+        encoded = self._encode(img, self.max_quality)
+        if len(encoded) <= self.byte_budget:
+            return encoded, self.max_quality
+
+        # Binary search for the highest quality that fits; falls back to min_quality if nothing does
+        low, high = self.min_quality, self.max_quality - 1
+        best, best_quality = None, self.min_quality
+        while low <= high:
+            quality = (low + high) // 2
+            candidate = self._encode(img, quality)
+            if len(candidate) <= self.byte_budget:
+                best, best_quality = candidate, quality
+                low = quality + 1
+            else:
+                high = quality - 1
+        if best is None:
+            return self._encode(img, self.min_quality), self.min_quality
+        return best, best_quality
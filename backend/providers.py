@@ -0,0 +1,533 @@
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import metrics
+from resilience import HALF_OPEN, OPEN, CircuitBreaker, LatencyWindow, RetryPolicy, is_retryable, is_timeout
+from tenants import FairShareScheduler, current_tenant
+
+
+class ProviderError(Exception):
+    """Raised when no vision provider could serve a request"""
+
+
+class VisionProvider:
+    """A backend that turns (prompt, image) into model text"""
+
+    name = "provider"
+    label = "provider"
+    trace_name = "handwriting_extraction"
+
+    def __init__(self, model: str, timeout: float = 120):
+        self.model = model
+        # Upper bound for one call; the router passes a tighter, latency-derived deadline once it has data
+        self.timeout = timeout
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def complete(self, prompt: str, image_b64: str, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, image_b64: str, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> Iterator[str]:
+        """Yield the reply in chunks as the model produces it; defaults to one chunk"""
+        yield self.complete(prompt, image_b64, mime_type, timeout)
+
+    def ping(self) -> bool:
+        """Cheap reachability check; providers without one are assumed reachable"""
+        return True
+
+
+class HuggingFaceProvider(VisionProvider):
+    """Remote vision model served through the HuggingFace router's OpenAI-compatible API"""
+
+    name = "huggingface"
+    label = "HuggingFace"
+    trace_name = "handwriting_extraction_hf"
+
+    def __init__(self, client, model: str, timeout: float = 120):
+        super().__init__(model, timeout)
+        self.client = client
+
+    def _messages(self, prompt: str, image_b64: str, mime_type: str) -> List[Dict[str, Any]]:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{image_b64}"
+                        }
+                    }
+                ]
+            }
+        ]
+
+    def complete(self, prompt: str, image_b64: str, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> str:
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt, image_b64, mime_type),
+            timeout=timeout or self.timeout,
+        )
+        return completion.choices[0].message.content
+
+    def stream(self, prompt: str, image_b64: str, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> Iterator[str]:
+        chunks = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt, image_b64, mime_type),
+            stream=True,
+            timeout=timeout or self.timeout,
+        )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OllamaProvider(VisionProvider):
+    """Local vision model served by Ollama, over a persistent pooled HTTP session"""
+
+    name = "ollama"
+    label = "Ollama"
+    trace_name = "handwriting_extraction_ollama"
+
+    def __init__(
+        self,
+        host: str,
+        model: str,
+        timeout: float = 120,
+        temperature: float = 0.1,
+        num_predict: int = 2048,
+        pool_size: int = 16
+    ):
+        super().__init__(model, timeout)
+        self.host = host.rstrip("/")
+        self.temperature = temperature
+        self.num_predict = num_predict
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _payload(self, prompt: str, image_b64: str, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "images": [image_b64],
+            "stream": stream,
+            "format": "json",
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.num_predict
+            }
+        }
+
+    def complete(self, prompt: str, image_b64: str, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> str:
+        response = self.session.post(
+            f"{self.host}/api/generate",
+            json=self._payload(prompt, image_b64, stream=False),
+            timeout=timeout or self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def stream(self, prompt: str, image_b64: str, mime_type: str = "image/jpeg", timeout: Optional[float] = None) -> Iterator[str]:
+        with self.session.post(
+            f"{self.host}/api/generate",
+            json=self._payload(prompt, image_b64, stream=True),
+            timeout=timeout or self.timeout,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("error"):
+                    raise ProviderError(event["error"])
+                if event.get("response"):
+                    yield event["response"]
+                if event.get("done"):
+                    break
+
+    def ping(self) -> bool:
+        try:
+            response = self.session.get(f"{self.host}/api/tags", timeout=2)
+            response.raise_for_status()
+        except requests.RequestException:
+            return False
+        models = {entry.get("name") for entry in response.json().get("models", [])}
+        # Ollama reports "llava:latest" for a model pulled as "llava"
+        return self.model in models or f"{self.model}:latest" in models
+
+
+class ProviderRouter:
+    """Routes each request to the fastest healthy provider, with failover, retries and hedging.
+
+    Providers are ranked by an exponentially weighted moving average of their
+    successful call latency; a provider that has not been measured yet ranks
+    first so it gets a chance to prove itself. A provider that just failed is
+    pushed to the back of the order for ``failure_cooldown`` seconds, and one
+    whose circuit breaker is open is skipped altogether until it recovers.
+
+    Each call gets a deadline of ``deadline_multiplier`` x the provider's recent
+    p95 latency, clamped between ``min_deadline`` and the provider's own timeout.
+    If every provider fails with a retryable error, the whole round is retried
+    after a jittered exponential backoff. With ``hedge`` enabled, a call still
+    running after the primary's ``hedge_percentile`` latency is duplicated on the
+    next provider and the first reply wins.
+
+    With a ``fair_share`` scheduler, every upstream call (hedges included) holds
+    one of its slots, taken on the caller's thread for the request's tenant.
+    Hedges only go out when a slot is free: duplicating calls under contention
+    would spend the shared quota twice.
+    """
+
+    def __init__(
+        self,
+        providers: List[VisionProvider],
+        failure_cooldown: float = 30,
+        ewma_alpha: float = 0.3,
+        retry: Optional[RetryPolicy] = None,
+        failure_threshold: int = 5,
+        deadline_multiplier: float = 3.0,
+        min_deadline: float = 10.0,
+        hedge: bool = True,
+        hedge_percentile: float = 0.95,
+        hedge_workers: int = 32,
+        fair_share: Optional[FairShareScheduler] = None
+    ):
+        self.providers = providers
+        self.fair_share = fair_share
+        self.failure_cooldown = failure_cooldown
+        self.ewma_alpha = ewma_alpha
+        self.retry = retry or RetryPolicy()
+        self.deadline_multiplier = deadline_multiplier
+        self.min_deadline = min_deadline
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max(1, hedge_workers), thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._breakers = {provider.name: CircuitBreaker(failure_threshold, failure_cooldown) for provider in providers}
+        self._latencies = {provider.name: LatencyWindow() for provider in providers}
+        self._state: Dict[str, Dict[str, Any]] = {
+            provider.name: {
+                "latency_ewma": None,
+                "successes": 0,
+                "failures": 0,
+                "timeouts": 0,
+                "retries": 0,
+                "hedges": 0,
+                "hedge_wins": 0,
+                "consecutive_failures": 0,
+                "unhealthy_until": 0.0,
+                "last_error": None
+            }
+            for provider in providers
+        }
+
+    @property
+    def model_id(self) -> str:
+        """Stable identifier of the provider set, used to key cached results"""
+        return "|".join(provider.model_id for provider in self.providers) or "none"
+
+    def mark_unhealthy(self, provider: VisionProvider, reason: str):
+        with self._lock:
+            state = self._state[provider.name]
+            state["unhealthy_until"] = time.monotonic() + self.failure_cooldown
+            state["last_error"] = reason
+        self._breakers[provider.name].trip()
+
+    def ordered(self) -> List[VisionProvider]:
+        now = time.monotonic()
+        with self._lock:
+            def rank(item: Tuple[int, VisionProvider]):
+                index, provider = item
+                state = self._state[provider.name]
+                latency = state["latency_ewma"]
+                return (state["unhealthy_until"] > now, latency if latency is not None else 0.0, index)
+            return [provider for _, provider in sorted(enumerate(self.providers), key=rank)]
+
+    def deadline(self, provider: VisionProvider) -> float:
+        """Per-call timeout from observed latency; the provider's full timeout until there is data"""
+        p95 = self._latencies[provider.name].percentile(0.95)
+        if p95 is None:
+            return provider.timeout
+        return min(provider.timeout, max(self.min_deadline, p95 * self.deadline_multiplier))
+
+    def complete(
+        self,
+        prompt: str,
+        image_b64: str,
+        mime_type: str = "image/jpeg",
+        only: Optional[List[VisionProvider]] = None
+    ) -> Tuple[str, VisionProvider]:
+        """Return (model text, provider that produced it), trying providers in rank order.
+
+        ``only`` restricts routing to a subset of the configured providers.
+        """
+        errors: List[str] = []
+        for attempt in range(self.retry.max_attempts):
+            candidates = [
+                provider for provider in self.ordered()
+                if (only is None or provider in only) and self._breakers[provider.name].allow()
+            ]
+            if not candidates:
+                errors.append(self._circuit_open_message(only))
+                break
+
+            failures = self._race(candidates, prompt, image_b64, mime_type)
+            if isinstance(failures, tuple):
+                return failures
+            errors.extend(f"{provider.label}: {type(e).__name__}: {e}" for provider, e in failures)
+            if attempt + 1 >= self.retry.max_attempts or not any(is_retryable(e) for _, e in failures):
+                break
+            delay = self.retry.delay(attempt)
+            self._count_retries(failures)
+            print(f"[WARNING] All providers failed (attempt {attempt + 1}/{self.retry.max_attempts}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+        raise ProviderError("; ".join(errors) or "No vision providers configured")
+
+    def _race(
+        self,
+        candidates: List[VisionProvider],
+        prompt: str,
+        image_b64: str,
+        mime_type: str
+    ):
+        """One routing round: failover through ``candidates``, hedging the slow primary when possible.
+
+        Returns (text, provider) on success, otherwise the list of (provider, error) failures.
+        Breaker probe slots claimed for candidates that never get called are released.
+        """
+        failures: List[Tuple[VisionProvider, Exception]] = []
+        queue = list(candidates)
+        hedge_delay = self._latencies[queue[0].name].percentile(self.hedge_percentile) if self.hedge else None
+
+        if hedge_delay is None or len(queue) < 2:
+            # Nothing to hedge against yet: plain sequential failover on the calling thread
+            while queue:
+                provider = queue.pop(0)
+                try:
+                    text = self._call(provider, prompt, image_b64, mime_type, self._acquire())
+                except Exception as e:
+                    failures.append((provider, e))
+                    if queue:
+                        print(f"[WARNING] {provider.label} failed, trying next provider: {type(e).__name__}: {e}")
+                    continue
+                self._release(queue)
+                return text, provider
+            return failures
+
+        primary = queue[0]
+        pending: Dict[Future, VisionProvider] = {}
+
+        def launch(tenant: Optional[str]):
+            provider = queue.pop(0)
+            pending[self._hedge_executor.submit(self._call, provider, prompt, image_b64, mime_type, tenant)] = provider
+
+        launch(self._acquire())
+        hedged = False
+        while pending:
+            done, _ = wait(list(pending), timeout=None if hedged or not queue else hedge_delay, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                tenant = current_tenant.get()
+                if self.fair_share and not self.fair_share.try_acquire(tenant):
+                    # Shared capacity is taken: wait for the primary instead of spending a second slot
+                    continue
+                # Primary is slower than its usual tail: race it against the next provider
+                self._count(primary, "hedges")
+                metrics.inc("handwriting_provider_hedges_total", provider=primary.name)
+                launch(tenant if self.fair_share else None)
+                continue
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    failures.append((provider, e))
+                    continue
+                if provider is not primary:
+                    self._count(primary, "hedge_wins")
+                    metrics.inc("handwriting_provider_hedge_wins_total", provider=provider.name)
+                # The loser keeps running on the hedge pool; its outcome still feeds the stats
+                self._release(queue)
+                return text, provider
+            if not pending and queue:
+                print(f"[WARNING] {failures[-1][0].label} failed, trying next provider: {failures[-1][1]}")
+                launch(self._acquire())
+        return failures
+
+    def _acquire(self) -> Optional[str]:
+        """Wait for a fair-share slot for the current request's tenant; returns the tenant to release it for"""
+        if not self.fair_share:
+            return None
+        tenant = current_tenant.get()
+        waited = self.fair_share.acquire(tenant)
+        metrics.observe("handwriting_fair_share_wait_seconds", waited)
+        return tenant
+
+    def _call(self, provider: VisionProvider, prompt: str, image_b64: str, mime_type: str, tenant: Optional[str] = None) -> str:
+        """One upstream call; releases the fair-share slot taken for ``tenant`` (if any) when it ends"""
+        started = time.perf_counter()
+        try:
+            text = provider.complete(prompt, image_b64, mime_type, timeout=self.deadline(provider))
+        except Exception as e:
+            self._record_failure(provider, e)
+            raise
+        finally:
+            if tenant is not None:
+                self.fair_share.release(tenant)
+        self._record_success(provider, time.perf_counter() - started)
+        return text
+
+    def _release(self, unused: List[VisionProvider]):
+        """Give back half-open probe slots claimed for providers that were not called"""
+        for provider in unused:
+            breaker = self._breakers[provider.name]
+            if breaker.state == HALF_OPEN:
+                breaker.release()
+
+    def _circuit_open_message(self, only: Optional[List[VisionProvider]]) -> str:
+        waits = [
+            f"{provider.label} circuit open (retry in {self._breakers[provider.name].retry_after():.0f}s)"
+            for provider in self.providers if only is None or provider in only
+        ]
+        return "; ".join(waits) or "No vision providers configured"
+
+    def stream(self, prompt: str, image_b64: str, mime_type: str = "image/jpeg") -> Tuple[Iterator[str], VisionProvider]:
+        """Start a streamed completion on the best provider.
+
+        Failover and retries are only possible until the first chunk arrives;
+        after that an error is raised to the consumer since part of the reply was
+        already sent. Streams are never hedged.
+        """
+        errors: List[str] = []
+        for attempt in range(self.retry.max_attempts):
+            candidates = [provider for provider in self.ordered() if self._breakers[provider.name].allow()]
+            if not candidates:
+                errors.append(self._circuit_open_message(None))
+                break
+            failures: List[Tuple[VisionProvider, Exception]] = []
+            for index, provider in enumerate(candidates):
+                tenant = self._acquire()
+                started = time.perf_counter()
+                chunks = provider.stream(prompt, image_b64, mime_type, timeout=self.deadline(provider))
+                try:
+                    first = next(chunks, "")
+                except Exception as e:
+                    if tenant is not None:
+                        self.fair_share.release(tenant)
+                    self._record_failure(provider, e)
+                    failures.append((provider, e))
+                    errors.append(f"{provider.label}: {type(e).__name__}: {e}")
+                    print(f"[WARNING] {provider.label} failed, trying next provider: {type(e).__name__}: {e}")
+                    continue
+                self._release(candidates[index + 1:])
+                return self._track_stream(provider, started, first, chunks, tenant), provider
+            if attempt + 1 >= self.retry.max_attempts or not any(is_retryable(e) for _, e in failures):
+                break
+            self._count_retries(failures)
+            time.sleep(self.retry.delay(attempt))
+        raise ProviderError("; ".join(errors) or "No vision providers configured")
+
+    def _track_stream(
+        self,
+        provider: VisionProvider,
+        started: float,
+        first: str,
+        chunks: Iterator[str],
+        tenant: Optional[str] = None
+    ) -> Iterator[str]:
+        try:
+            if first:
+                yield first
+            yield from chunks
+        except Exception as e:
+            self._record_failure(provider, e)
+            raise
+        finally:
+            # Also runs when the consumer closes the stream early
+            if tenant is not None:
+                self.fair_share.release(tenant)
+        self._record_success(provider, time.perf_counter() - started)
+
+    def _count(self, provider: VisionProvider, key: str):
+        with self._lock:
+            self._state[provider.name][key] += 1
+
+    def _count_retries(self, failures: List[Tuple[VisionProvider, Exception]]):
+        for provider, _ in failures:
+            self._count(provider, "retries")
+            metrics.inc("handwriting_provider_retries_total", provider=provider.name)
+
+    def _record_success(self, provider: VisionProvider, latency: float):
+        self._breakers[provider.name].record_success()
+        self._latencies[provider.name].add(latency)
+        metrics.inc("handwriting_provider_calls_total", provider=provider.name, outcome="success")
+        with self._lock:
+            state = self._state[provider.name]
+            previous = state["latency_ewma"]
+            state["latency_ewma"] = latency if previous is None else (
+                self.ewma_alpha * latency + (1 - self.ewma_alpha) * previous
+            )
+            state["successes"] += 1
+            state["consecutive_failures"] = 0
+            state["unhealthy_until"] = 0.0
+
+    def _record_failure(self, provider: VisionProvider, error: Exception):
+        timed_out = is_timeout(error)
+        # Only upstream trouble counts against the circuit; a 400 for one bad request says nothing about health
+        if is_retryable(error):
+            self._breakers[provider.name].record_failure()
+        else:
+            self._breakers[provider.name].release()
+        metrics.inc("handwriting_provider_calls_total", provider=provider.name, outcome="timeout" if timed_out else "error")
+        with self._lock:
+            state = self._state[provider.name]
+            state["failures"] += 1
+            state["timeouts"] += int(timed_out)
+            state["consecutive_failures"] += 1
+            state["unhealthy_until"] = time.monotonic() + self.failure_cooldown
+            state["last_error"] = f"{type(error).__name__}: {error}"
+
+    def circuit_states(self) -> Dict[str, str]:
+        return {provider.name: self._breakers[provider.name].state for provider in self.providers}
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        stats = {}
+        for provider in self.providers:
+            breaker = self._breakers[provider.name]
+            p95 = self._latencies[provider.name].percentile(0.95)
+            with self._lock:
+                state = dict(self._state[provider.name])
+            stats[provider.name] = {
+                "model": provider.model,
+                "healthy": state["unhealthy_until"] <= now and breaker.state != OPEN,
+                "circuit": breaker.state,
+                "circuit_retry_after_s": round(breaker.retry_after(), 1),
+                "latency_ewma_ms": round(state["latency_ewma"] * 1000, 1) if state["latency_ewma"] is not None else None,
+                "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "deadline_s": round(self.deadline(provider), 2),
+                "successes": state["successes"],
+                "failures": state["failures"],
+                "timeouts": state["timeouts"],
+                "retries": state["retries"],
+                "hedges": state["hedges"],
+                "hedge_wins": state["hedge_wins"],
+                "last_error": state["last_error"]
+            }
+        return stats
+
+    def shutdown(self):
+        self._hedge_executor.shutdown(wait=False, cancel_futures=True)
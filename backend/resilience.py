@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker for one provider.
+
+    ``failure_threshold`` consecutive retryable failures open the circuit, so the
+    router stops sending work to the provider. After ``recovery_time`` seconds one
+    probe call is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_time = recovery_time
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.transitions: Dict[str, int] = {OPEN: 0, HALF_OPEN: 0, CLOSED: 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_time:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now; claims the probe slot when half-open"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_time:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """Give back a claimed half-open probe slot without recording an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def trip(self):
+        """Open the circuit immediately (e.g. a failed health check)"""
+        with self._lock:
+            self._open()
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_time - (time.monotonic() - self._opened_at))
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        if self._state != OPEN:
+            self._transition(OPEN)
+
+    def _transition(self, state: str):
+        self._state = state
+        self.transitions[state] += 1
+
+
+class LatencyWindow:
+    """Recent successful call latencies for one provider, for deadlines and hedge delays"""
+
+    def __init__(self, size: int = 200, min_samples: int = 10):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, point: float) -> Optional[float]:
+        """Latency at ``point`` (0..1), or None until ``min_samples`` calls have been seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(point * len(ordered)))]
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt ``n`` sleeps uniform(0, min(max_delay, base * 2**n))"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_timeout(error: Exception) -> bool:
+    return isinstance(error, (requests.Timeout, TimeoutError)) or type(error).__name__ == "APITimeoutError"
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection failures, 408/425/429 and 5xx are worth retrying; other errors are not"""
+    if is_timeout(error) or isinstance(error, (requests.ConnectionError, ConnectionError)):
+        return True
+    if type(error).__name__ == "APIConnectionError":
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 425, 429) or status >= 500
+    return False
+
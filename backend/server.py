@@ -0,0 +1,177 @@
+"""Production launcher: N pre-forked uvicorn workers sharing one listening socket.
+
+The master process imports the application once (and, with ``--preload``, the
+provider SDKs the configuration uses), binds the socket and forks the workers,
+so each worker starts with the code already loaded. Agents, client sessions
+and thread pools are built inside each worker after the fork: sockets and
+threads do not survive a fork. Run from ``backend/``::
+
+    python server.py --workers 4
+    python server.py --workers 4 --port 8080 --no-preload
+
+With more than one worker, cache, job and metrics state is shared through
+SHARED_STATE_URL (defaulting to a SQLite file next to this script). Workers
+that exit unexpectedly are restarted; SIGTERM/SIGINT stop them gracefully.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).parent
+DEFAULT_STATE_FILE = BACKEND_DIR / "shared_state.db"
+
+
+class Supervisor:
+    """Forks the workers, restarts the ones that die and stops them all on a signal"""
+
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str, graceful_timeout: float):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.graceful_timeout = graceful_timeout
+        self.children: Dict[int, int] = {}  # pid -> worker id
+        self.stopping = False
+
+    def spawn(self, worker: int):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = worker
+            return
+        # Child: own process group so a terminal Ctrl-C reaches only the master, which forwards a
+        # single SIGTERM (a second signal would make uvicorn drop in-flight requests)
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.environ["HANDWRITING_WORKER_ID"] = str(worker)
+        os.environ["HANDWRITING_WORKERS"] = str(self.workers)
+        exit_code = 0
+        try:
+            import uvicorn
+            config = uvicorn.Config(self.app, log_level=self.log_level, lifespan="on")
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"[ERROR] Worker {worker} crashed: {type(e).__name__}: {e}")
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(exit_code)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for worker in range(self.workers):
+            self.spawn(worker)
+        print(f"[OK] Started {self.workers} workers (master pid {os.getpid()})")
+
+        last_restart: Dict[int, float] = {}
+        while not self.stopping:
+            pid, status = self._reap()
+            if pid is None:
+                time.sleep(0.5)
+                continue
+            worker = self.children.pop(pid)
+            if self.stopping:
+                break
+            print(f"[WARNING] Worker {worker} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+            # Back off if the worker keeps dying right after start
+            if time.monotonic() - last_restart.get(worker, 0) < 5:
+                time.sleep(1)
+            last_restart[worker] = time.monotonic()
+            self.spawn(worker)
+        self._shutdown()
+
+    def _reap(self):
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return None, 0
+        return (pid, status) if pid else (None, 0)
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _shutdown(self):
+        print(f"[INFO] Stopping {len(self.children)} workers...")
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            pid, _ = self._reap()
+            if pid is None:
+                time.sleep(0.1)
+            else:
+                self.children.pop(pid, None)
+        for pid in self.children:
+            print(f"[WARNING] Worker pid {pid} did not stop within {self.graceful_timeout}s; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.sock.close()
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Run the Handwriting Extraction API with several worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "1")))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--graceful-timeout", type=float, default=30, help="Seconds workers get to finish in-flight requests on shutdown")
+    parser.add_argument(
+        "--preload", action=argparse.BooleanOptionalAction, default=True,
+        help="Import the configured provider/tracing SDKs in the master before forking"
+    )
+    args = parser.parse_args(argv)
+
+    load_dotenv(dotenv_path=BACKEND_DIR / ".env")
+    multi = args.workers > 1 and hasattr(os, "fork")
+    if multi and not os.getenv("SHARED_STATE_URL"):
+        # Per-worker caches and job queues would each see only a fraction of the traffic
+        os.environ["SHARED_STATE_URL"] = f"sqlite:///{DEFAULT_STATE_FILE}"
+        print(f"[INFO] SHARED_STATE_URL not set; sharing state through {DEFAULT_STATE_FILE}")
+
+    started = time.perf_counter()
+    import main as app_module
+    if args.preload:
+        from agent import preload_clients
+        loaded = preload_clients()
+        if loaded:
+            print(f"[OK] Preloaded {', '.join(loaded)}")
+    print(f"[OK] Application loaded in {time.perf_counter() - started:.2f}s")
+
+    if not multi:
+        if args.workers > 1:
+            print("[WARNING] os.fork is not available on this platform; running a single worker")
+        import uvicorn
+        uvicorn.run(app_module.app, host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    sock = bind(args.host, args.port)
+    print(f"[OK] Listening on {args.host}:{args.port}")
+    Supervisor(app_module.app, sock, args.workers, args.log_level, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    main()
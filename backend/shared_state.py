@@ -0,0 +1,233 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Set
+from urllib.parse import urlparse
+
+
+class KeyValueStore:
+    """The subset of Redis commands used to share state between worker processes.
+
+    Method names and semantics follow redis-py (string values, ``ex`` expiry in
+    seconds, ``nx`` set-if-absent), so a real Redis client can stand in for the
+    local backends below.
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ex: Optional[float] = None, nx: bool = False) -> bool:
+        """Store ``value``; with ``nx`` only if the key is absent. Returns whether it was written"""
+        raise NotImplementedError
+
+    def delete(self, *keys: str) -> int:
+        raise NotImplementedError
+
+    def sadd(self, key: str, *members: str) -> int:
+        raise NotImplementedError
+
+    def srem(self, key: str, *members: str) -> int:
+        raise NotImplementedError
+
+    def smembers(self, key: str) -> Set[str]:
+        raise NotImplementedError
+
+    def scard(self, key: str) -> int:
+        return len(self.smembers(key))
+
+    def ping(self) -> bool:
+        return True
+
+    def purge_expired(self) -> int:
+        """Drop expired keys still taking up space; returns how many (Redis expires keys itself)"""
+        return 0
+
+    def close(self):
+        pass
+
+
+class MemoryKeyValueStore(KeyValueStore):
+    """In-process fake: same semantics as the shared backends, for tests and single-process runs"""
+
+    def __init__(self):
+        self._values: Dict[str, tuple] = {}
+        self._sets: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ex: Optional[float] = None, nx: bool = False) -> bool:
+        with self._lock:
+            entry = self._values.get(key)
+            if nx and entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return False
+            self._values[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                removed += int(self._values.pop(key, None) is not None)
+                removed += int(self._sets.pop(key, None) is not None)
+            return removed
+
+    def sadd(self, key: str, *members: str) -> int:
+        with self._lock:
+            current = self._sets.setdefault(key, set())
+            before = len(current)
+            current.update(members)
+            return len(current) - before
+
+    def srem(self, key: str, *members: str) -> int:
+        with self._lock:
+            current = self._sets.get(key, set())
+            before = len(current)
+            current.difference_update(members)
+            return before - len(current)
+
+    def smembers(self, key: str) -> Set[str]:
+        with self._lock:
+            return set(self._sets.get(key, set()))
+
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._values.items() if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._values[key]
+            return len(expired)
+
+
+class SQLiteKeyValueStore(KeyValueStore):
+    """File-backed store shared by every process on one host (WAL mode, one connection per thread)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv_sets (key TEXT NOT NULL, member TEXT NOT NULL, PRIMARY KEY (key, member))")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ex: Optional[float] = None, nx: bool = False) -> bool:
+        expires_at = time.time() + ex if ex else None
+        conn = self._conn()
+        if not nx:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at))
+            return True
+        # Set-if-absent, treating an expired row as absent; one statement, so it is atomic across processes
+        cursor = conn.execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+            (key, value, expires_at, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, *keys: str) -> int:
+        conn = self._conn()
+        removed = 0
+        for key in keys:
+            removed += conn.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount
+            removed += int(conn.execute("DELETE FROM kv_sets WHERE key = ?", (key,)).rowcount > 0)
+        return removed
+
+    def sadd(self, key: str, *members: str) -> int:
+        conn = self._conn()
+        return sum(
+            conn.execute("INSERT OR IGNORE INTO kv_sets (key, member) VALUES (?, ?)", (key, member)).rowcount
+            for member in members
+        )
+
+    def srem(self, key: str, *members: str) -> int:
+        conn = self._conn()
+        return sum(
+            conn.execute("DELETE FROM kv_sets WHERE key = ? AND member = ?", (key, member)).rowcount
+            for member in members
+        )
+
+    def smembers(self, key: str) -> Set[str]:
+        return {row[0] for row in self._conn().execute("SELECT member FROM kv_sets WHERE key = ?", (key,))}
+
+    def scard(self, key: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM kv_sets WHERE key = ?", (key,)).fetchone()[0]
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)).rowcount
+
+
+class RedisKeyValueStore(KeyValueStore):
+    """Thin adapter over redis-py (optional dependency, imported only when a redis:// URL is configured)"""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SHARED_STATE_URL points at Redis but the 'redis' package is not installed") from e
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: str, ex: Optional[float] = None, nx: bool = False) -> bool:
+        return bool(self.client.set(key, value, px=int(ex * 1000) if ex else None, nx=nx))
+
+    def delete(self, *keys: str) -> int:
+        return self.client.delete(*keys) if keys else 0
+
+    def sadd(self, key: str, *members: str) -> int:
+        return self.client.sadd(key, *members) if members else 0
+
+    def srem(self, key: str, *members: str) -> int:
+        return self.client.srem(key, *members) if members else 0
+
+    def smembers(self, key: str) -> Set[str]:
+        return self.client.smembers(key)
+
+    def scard(self, key: str) -> int:
+        return self.client.scard(key)
+
+    def ping(self) -> bool:
+        return bool(self.client.ping())
+
+    def close(self):
+        self.client.close()
+
+
+def open_store(url: str) -> KeyValueStore:
+    """Build a store from a URL: ``memory://``, ``sqlite:///path/state.db`` or ``redis://host:6379/0``"""
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryKeyValueStore()
+    if scheme == "sqlite":
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else url[len("sqlite://"):]
+        return SQLiteKeyValueStore(path or "shared_state.db")
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisKeyValueStore(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {scheme or url!r}")
@@ -0,0 +1,206 @@
+import hashlib
+import io
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageOps
+
+WORK_WIDTH = 400
+MATCH_WIDTH = 100
+SKEW_ANGLES = np.arange(-3.0, 3.01, 0.5)
+MAX_ASPECT_DIFFERENCE = 0.08
+MAX_SHIFT = 0.1
+
+Box = Tuple[float, float, float, float]
+
+
+def _ink_map(gray: Image.Image) -> Image.Image:
+    """Ink darkness at WORK_WIDTH pixels wide, with paper colour and lighting gradients subtracted"""
+    gray = gray.convert("L")
+    height = max(1, round(gray.height * WORK_WIDTH / gray.width))
+    gray = gray.resize((WORK_WIDTH, height), Image.Resampling.BILINEAR)
+    background = gray.filter(ImageFilter.BoxBlur(WORK_WIDTH // 32))
+    ink = np.asarray(background, dtype=np.float32) - np.asarray(gray, dtype=np.float32)
+    return Image.fromarray(np.clip(ink, 0, None), mode="F")
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    values = values - values.mean()
+    norm = np.linalg.norm(values)
+    return values / norm if norm else values
+
+
+def _align(page: np.ndarray, fingerprint: np.ndarray) -> Tuple[float, int, int]:
+    """Best correlation of a page ink map against a template fingerprint over shifts
+    of up to MAX_SHIFT in each direction; returns (score, dy, dx) where positive lags
+    mean the page content sits lower/further right than on the template."""
+    height, width = fingerprint.shape
+    size = (2 * height, 2 * width)
+    correlation = np.fft.irfft2(np.fft.rfft2(_normalize(page), size) * np.conj(np.fft.rfft2(fingerprint, size)), size)
+    limit_y, limit_x = max(1, int(height * MAX_SHIFT)), max(1, int(width * MAX_SHIFT))
+    lags_y = np.r_[0:limit_y + 1, -limit_y:0]
+    lags_x = np.r_[0:limit_x + 1, -limit_x:0]
+    window = correlation[np.ix_(lags_y % size[0], lags_x % size[1])]
+    row, column = np.unravel_index(int(np.argmax(window)), window.shape)
+    return float(window[row, column]), int(lags_y[row]), int(lags_x[column])
+
+
+def estimate_skew(ink: Image.Image) -> float:
+    """Rotation (degrees, PIL convention) that makes text lines horizontal.
+
+    Rows of a level page alternate between ink and paper, so the row ink
+    profile has maximal variance when the page is straight.
+    """
+    best_angle, best_score = 0.0, -1.0
+    for angle in SKEW_ANGLES:
+        rotated = np.asarray(ink.rotate(float(angle), resample=Image.Resampling.BILINEAR))
+        score = float(np.var(rotated.mean(axis=1)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+class FormTemplate:
+    """A known form layout: field name -> bounding box, with a reference image to align against.
+
+    Boxes are ``[left, top, right, bottom]`` fractions of the reference page.
+    """
+
+    def __init__(self, name: str, reference: Image.Image, fields: Dict[str, Box], description: str = ""):
+        self.name = name
+        self.fields = fields
+        self.description = description
+        self.aspect = reference.height / reference.width
+        self.match_size = (MATCH_WIDTH, max(1, round(MATCH_WIDTH * self.aspect)))
+        self.fingerprint = _normalize(np.asarray(_ink_map(reference).resize(self.match_size, Image.Resampling.BOX)))
+
+    @classmethod
+    def from_file(cls, path: Path) -> "FormTemplate":
+        """Load ``<name>.json`` with ``reference`` (image path, relative to the JSON) and ``fields``"""
+        spec = json.loads(path.read_text(encoding="utf-8"))
+        with Image.open(path.parent / spec["reference"]) as reference:
+            return cls(
+                spec.get("name", path.stem),
+                ImageOps.exif_transpose(reference),
+                {field: tuple(box) for field, box in spec["fields"].items()},
+                spec.get("description", "")
+            )
+
+
+class TemplateRegistry:
+    """Matches incoming pages against known form templates and crops their field regions"""
+
+    def __init__(self, templates: List[FormTemplate], min_score: float = 0.3, padding: float = 0.01):
+        self.templates = templates
+        self.min_score = min_score
+        self.padding = padding
+
+    @classmethod
+    def from_directory(cls, directory: str, min_score: float = 0.3) -> "TemplateRegistry":
+        templates = []
+        for path in sorted(Path(directory).glob("*.json")):
+            try:
+                templates.append(FormTemplate.from_file(path))
+            except Exception as e:
+                print(f"[WARNING] Skipping form template {path.name}: {type(e).__name__}: {e}")
+        return cls(templates, min_score)
+
+    @property
+    def version(self) -> str:
+        """Changes whenever a template's fields change, for keying cached results"""
+        spec = json.dumps([[t.name, sorted(t.fields.items())] for t in self.templates], sort_keys=True)
+        return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:12]
+
+    def match(self, image_bytes: bytes) -> Optional[Dict[str, Any]]:
+        """Best template for a page, with its alignment, or None if nothing scores ``min_score``.
+
+        The page is deskewed, then its ink map is cross-correlated with each
+        template's over small shifts; the peak is the score (1.0 is identical,
+        handwriting on a matching form lowers it, unrelated pages sit near 0).
+        """
+        if not self.templates:
+            return None
+        img = Image.open(io.BytesIO(image_bytes))
+        # Filter on the header size before decoding: the ink map's height follows the page's aspect ratio
+        width, height = img.size
+        if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        aspect = height / width
+        candidates = [t for t in self.templates if abs(aspect - t.aspect) / t.aspect <= MAX_ASPECT_DIFFERENCE]
+        if not candidates:
+            return None
+        if img.format == "JPEG":
+            # Only a thumbnail is needed; let libjpeg decode at a reduced DCT scale
+            img.draft("L", (WORK_WIDTH * 2, WORK_WIDTH * 2))
+        img = ImageOps.exif_transpose(img)
+        ink = _ink_map(img)
+        skew = estimate_skew(ink)
+        if skew:
+            ink = ink.rotate(skew, resample=Image.Resampling.BILINEAR)
+
+        best: Optional[Dict[str, Any]] = None
+        for template in candidates:
+            page = np.asarray(ink.resize(template.match_size, Image.Resampling.BOX))
+            score, dy, dx = _align(page, template.fingerprint)
+            if best is None or score > best["score"]:
+                best = {
+                    "template": template,
+                    "score": score,
+                    "skew": skew,
+                    "offset": (dx / template.match_size[0], dy / template.match_size[1])
+                }
+        if best is None or best["score"] < self.min_score:
+            return None
+        return best
+
+    def crop_fields(self, image_bytes: bytes, match: Dict[str, Any]) -> Dict[str, Image.Image]:
+        """Deskew the full-resolution page and cut out each template field, shifted by the alignment offset"""
+        page = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("RGB")
+        if match["skew"]:
+            page = page.rotate(match["skew"], resample=Image.Resampling.BICUBIC, fillcolor=(255, 255, 255))
+        width, height = page.size
+        dx, dy = match["offset"]
+        crops = {}
+        for field, (left, top, right, bottom) in match["template"].fields.items():
+            box = (
+                max(0, round((left + dx - self.padding) * width)),
+                max(0, round((top + dy - self.padding) * height)),
+                min(width, round((right + dx + self.padding) * width)),
+                min(height, round((bottom + dy + self.padding) * height))
+            )
+            if box[2] > box[0] and box[3] > box[1]:
+                crops[field] = page.crop(box)
+        return crops
+
+
+def tile_fields(crops: Dict[str, Image.Image], width: int = 1024, label_height: int = 28) -> bytes:
+    """Stack field crops into one PNG, each under a grey bar carrying its field name"""
+    try:
+        font = ImageFont.load_default(size=label_height - 8)
+    except TypeError:
+        font = ImageFont.load_default()
+    strips = []
+    for field, crop in crops.items():
+        scale = min(1.0, width / crop.width)
+        resized = crop.resize((max(1, round(crop.width * scale)), max(1, round(crop.height * scale))), Image.Resampling.LANCZOS)
+        strip = Image.new("RGB", (width, label_height + resized.height + 6), (255, 255, 255))
+        draw = ImageDraw.Draw(strip)
+        draw.rectangle([0, 0, width, label_height], fill=(210, 210, 210))
+        draw.text((8, 4), field, fill=(0, 0, 0), font=font)
+        strip.paste(resized, (0, label_height + 3))
+        strips.append(strip)
+
+    tiled = Image.new("RGB", (width, sum(strip.height for strip in strips)), (255, 255, 255))
+    y = 0
+    for strip in strips:
+        tiled.paste(strip, (0, y))
+        y += strip.height
+    return encode_crop(tiled)
+
+
+def encode_crop(crop: Image.Image) -> bytes:
+    """Lossless encoding for the preprocessor to pick up; it does the size-budgeted compression"""
+    buffer = io.BytesIO()
+    crop.save(buffer, format="PNG")
+    return buffer.getvalue()
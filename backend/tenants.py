@@ -0,0 +1,182 @@
+import math
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional
+
+DEFAULT_TENANT = "default"
+
+# Tenant the current request is served for; copied into worker threads with the context
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse ``"tenant=weight,tenant=weight"`` (e.g. ``"key:3f2a9c01d4e5=4,ip:10.0.0.7=2"``)"""
+    weights = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, _, weight = entry.rpartition("=")
+        weights[tenant.strip()] = float(weight)
+    return weights
+
+
+class RateLimiter:
+    """Per-tenant token buckets: ``rate`` tokens per second refill up to ``burst``.
+
+    ``acquire`` is non-blocking: it either spends the tokens or returns how many
+    seconds until enough have refilled, for a ``Retry-After`` header.
+    """
+
+    def __init__(self, rate: float, burst: float, max_tenants: int = 10000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_tenants = max_tenants
+        self._buckets: Dict[str, list] = {}  # tenant -> [tokens, last refill]
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def acquire(self, tenant: str, cost: float = 1) -> float:
+        """0 if admitted, otherwise the seconds to wait before retrying"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(tenant)
+            if bucket is None:
+                if len(self._buckets) >= self.max_tenants:
+                    self._forget_idle(now)
+                bucket = self._buckets[tenant] = [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            self.limited += 1
+            return (cost - bucket[0]) / self.rate
+
+    def _forget_idle(self, now: float):
+        """Drop buckets that have refilled completely; they behave exactly like new ones"""
+        for tenant, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del self._buckets[tenant]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "tenants": len(self._buckets),
+                "limited": self.limited
+            }
+
+
+class FairShareScheduler:
+    """Admits provider calls under a global concurrency cap, sharing it fairly between tenants.
+
+    While fewer than ``capacity`` calls run, callers go straight through. Past
+    that, each tenant waits in its own FIFO queue and freed slots are handed out
+    by smooth weighted round-robin over the tenants that are waiting: a tenant
+    with weight 2 gets twice the slots of a weight-1 tenant, and a tenant with a
+    500-page batch queued cannot hold back one that uploads a single page.
+    """
+
+    def __init__(self, capacity: int, weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0):
+        self.capacity = max(1, capacity)
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues: Dict[str, Deque[threading.Event]] = {}
+        self._credit: Dict[str, float] = {}
+        self._running: Dict[str, int] = {}
+        self.granted = 0
+        self.waited = 0
+
+    def weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, self.default_weight)
+
+    @property
+    def saturated(self) -> bool:
+        return self._active >= self.capacity
+
+    def acquire(self, tenant: Optional[str] = None) -> float:
+        """Block until the tenant (default: the current request's) gets a slot; returns the seconds waited"""
+        tenant = tenant or current_tenant.get()
+        started = time.monotonic()
+        with self._lock:
+            if self._active < self.capacity and not self._queues:
+                self._grant(tenant)
+                return 0.0
+            self.waited += 1
+            ticket = threading.Event()
+            self._queues.setdefault(tenant, deque()).append(ticket)
+            self._credit.setdefault(tenant, 0.0)
+        ticket.wait()
+        return time.monotonic() - started
+
+    def try_acquire(self, tenant: Optional[str] = None) -> bool:
+        """Take a slot only if one is free and nobody is waiting (used for optional extra calls)"""
+        tenant = tenant or current_tenant.get()
+        with self._lock:
+            if self._active < self.capacity and not self._queues:
+                self._grant(tenant)
+                return True
+            return False
+
+    def release(self, tenant: str):
+        """Free a slot taken for ``tenant`` (passed explicitly: release may run on another thread)"""
+        with self._lock:
+            self._active -= 1
+            self._running[tenant] -= 1
+            if not self._running[tenant]:
+                del self._running[tenant]
+            while self._queues and self._active < self.capacity:
+                next_tenant = self._next_tenant()
+                queue = self._queues[next_tenant]
+                ticket = queue.popleft()
+                if not queue:
+                    del self._queues[next_tenant]
+                    del self._credit[next_tenant]
+                self._grant(next_tenant)
+                ticket.set()
+
+    def _grant(self, tenant: str):
+        self._active += 1
+        self._running[tenant] = self._running.get(tenant, 0) + 1
+        self.granted += 1
+
+    def _next_tenant(self) -> str:
+        """Smooth weighted round-robin (as in nginx) over the tenants with queued calls"""
+        total = 0.0
+        for tenant in self._queues:
+            self._credit[tenant] += self.weight(tenant)
+            total += self.weight(tenant)
+        chosen = max(self._queues, key=lambda tenant: self._credit[tenant])
+        self._credit[chosen] -= total
+        return chosen
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._lock:
+            return {tenant: len(queue) for tenant, queue in self._queues.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tenants = set(self._queues) | set(self._running)
+            return {
+                "capacity": self.capacity,
+                "running": self._active,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "granted": self.granted,
+                "waited": self.waited,
+                # Only tenants with calls running or queued right now
+                "tenants": {
+                    tenant: {
+                        "weight": self.weight(tenant),
+                        "running": self._running.get(tenant, 0),
+                        "queued": len(self._queues.get(tenant, ()))
+                    }
+                    for tenant in sorted(tenants)
+                }
+            }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
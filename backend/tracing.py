@@ -0,0 +1,270 @@
+import json
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import requests
+
+
+class StageTimer:
+    """Collects named timing spans for one request; safe to share across consensus threads"""
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, **metadata: Any):
+        """Time a block; also records the CPU time the calling thread spent inside it"""
+        started_at = time.time()
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(
+                name,
+                (time.perf_counter() - started) * 1000,
+                started_at,
+                cpu_ms=(time.thread_time() - cpu_started) * 1000,
+                **metadata
+            )
+
+    def add(
+        self,
+        name: str,
+        duration_ms: float,
+        started_at: Optional[float] = None,
+        cpu_ms: Optional[float] = None,
+        **metadata: Any
+    ):
+        """Record a span measured elsewhere"""
+        span = {
+            "name": name,
+            "start": started_at if started_at is not None else time.time() - duration_ms / 1000,
+            "duration_ms": round(duration_ms, 2)
+        }
+        if cpu_ms is not None:
+            span["cpu_ms"] = round(cpu_ms, 2)
+        if metadata:
+            span["metadata"] = metadata
+        with self._lock:
+            self.spans.append(span)
+
+    def durations(self) -> Dict[str, float]:
+        """Total milliseconds per stage name"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                totals[span["name"]] = round(totals.get(span["name"], 0.0) + span["duration_ms"], 2)
+        return totals
+
+
+def truncate_payload(value: Any, max_chars: int) -> Any:
+    """Replace payloads whose JSON form exceeds ``max_chars`` with a truncated preview"""
+    if max_chars <= 0:
+        return value
+    try:
+        serialized = json.dumps(value, default=str)
+    except (TypeError, ValueError):
+        serialized = str(value)
+    if len(serialized) <= max_chars:
+        return value
+    return {"truncated": True, "size": len(serialized), "preview": serialized[:max_chars]}
+
+
+class LangfuseSink:
+    """Exports traces (with one span per stage) through a Langfuse client.
+
+    Works with the OpenTelemetry-based SDKs (v3 ``start_span``/``update_trace``,
+    v4 ``start_observation``/``set_trace_io``) and the older v2 SDK
+    (``trace``/``span``). The OpenTelemetry-based APIs cannot backdate spans,
+    so each stage span keeps its real duration but starts at export time; the
+    original start time is kept in its metadata.
+    """
+
+    name = "langfuse"
+
+    def __init__(self, client):
+        self.client = client
+        if hasattr(client, "start_span") or hasattr(client, "start_observation"):
+            self._export_record = self._export_otel
+        elif hasattr(client, "trace"):
+            self._export_record = self._export_v2
+        else:
+            raise TypeError(f"Unsupported Langfuse client {type(client).__name__}: expected the v2, v3 or v4 SDK API")
+
+    def export(self, batch: List[Dict[str, Any]]):
+        for record in batch:
+            self._export_record(record)
+        self.client.flush()
+
+    @staticmethod
+    def _start(parent, **fields: Any):
+        """Child span under a client (root) or a span, whichever of the v3/v4 names it has"""
+        start = getattr(parent, "start_span", None) or parent.start_observation
+        return start(**fields)
+
+    def _export_otel(self, record: Dict[str, Any]):
+        root = self._start(self.client, name=record["name"], input=record["input"], output=record["output"], metadata=record["metadata"])
+        if hasattr(root, "update_trace"):
+            root.update_trace(name=record["name"], input=record["input"], output=record["output"], metadata=record["metadata"])
+        else:
+            # v4: the trace takes its name from the root span
+            root.set_trace_io(input=record["input"], output=record["output"])
+        ended = time.time_ns()
+        for span in record["spans"]:
+            started = time.time_ns()
+            child = self._start(
+                root,
+                name=span["name"],
+                metadata={
+                    **(span.get("metadata") or {}),
+                    "started_at": datetime.fromtimestamp(span["start"], tz=timezone.utc).isoformat(),
+                    "cpu_ms": span.get("cpu_ms")
+                }
+            )
+            end_time = started + int(span["duration_ms"] * 1_000_000)
+            child.end(end_time=end_time)
+            ended = max(ended, end_time)
+        root.end(end_time=ended)
+
+    def _export_v2(self, record: Dict[str, Any]):
+        trace = self.client.trace(
+            name=record["name"],
+            input=record["input"],
+            output=record["output"],
+            metadata=record["metadata"]
+        )
+        for span in record["spans"]:
+            trace.span(
+                name=span["name"],
+                start_time=datetime.fromtimestamp(span["start"], tz=timezone.utc),
+                end_time=datetime.fromtimestamp(span["start"] + span["duration_ms"] / 1000, tz=timezone.utc),
+                metadata=span.get("metadata")
+            )
+
+
+class HTTPSink:
+    """POSTs each batch as a JSON array to a collector URL (also handy with a local stub collector)"""
+
+    name = "http"
+
+    def __init__(self, url: str, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def export(self, batch: List[Dict[str, Any]]):
+        response = self.session.post(self.url, json=batch, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class TraceExporter:
+    """Background trace exporter: request threads enqueue and return immediately.
+
+    Records go into a bounded queue (overflow is dropped and counted), are sampled
+    at ``sample_rate`` and have their input/output truncated to ``max_payload_chars``.
+    A daemon thread drains the queue in batches of up to ``batch_size`` or every
+    ``flush_interval`` seconds and hands them to each sink.
+    """
+
+    def __init__(
+        self,
+        sinks: List[Any],
+        max_queue: int = 1000,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        sample_rate: float = 1.0,
+        max_payload_chars: int = 2000
+    ):
+        self.sinks = sinks
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.max_payload_chars = max_payload_chars
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self.enqueued = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.exported = 0
+        self.export_errors = 0
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def record(
+        self,
+        name: str,
+        input: Any,
+        output: Any,
+        spans: Optional[List[Dict[str, Any]]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """Queue a trace for export; never blocks. Returns False if sampled out or dropped."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        record = {
+            "name": name,
+            "timestamp": time.time(),
+            "input": truncate_payload(input, self.max_payload_chars),
+            "output": truncate_payload(output, self.max_payload_chars),
+            "spans": spans or [],
+            "metadata": metadata or {}
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker after flushing what is already queued"""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sinks": [sink.name for sink in self.sinks],
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "export_errors": self.export_errors,
+            "sample_rate": self.sample_rate
+        }
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._export(batch)
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop.is_set() and self._queue.empty()):
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _export(self, batch: List[Dict[str, Any]]):
+        for sink in self.sinks:
+            try:
+                sink.export(batch)
+            except Exception as e:
+                self.export_errors += 1
+                print(f"[WARNING] Trace export to {sink.name} failed: {type(e).__name__}: {e}")
+        self.exported += len(batch)
@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the extraction pool has no free in-flight slot"""
+
+    def __init__(self, stats: Dict[str, Any]):
+        super().__init__("Extraction pool is saturated")
+        self.stats = stats
+
+
+class ExtractionPool:
+    """Bounded thread pool that runs blocking extraction calls off the event loop.
+
+    ``workers`` threads execute calls; up to ``max_inflight`` calls may be admitted
+    at once, the excess over ``workers`` waiting in the executor queue. Callers
+    beyond that are either rejected (``wait=False``) or parked until a slot frees.
+    """
+
+    def __init__(self, workers: int, max_inflight: int):
+        self.workers = max(1, workers)
+        self.max_inflight = max(self.workers, max_inflight)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="extraction"
+        )
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._in_flight = 0
+        self._waiting = 0
+        self._completed = 0
+        self._rejected = 0
+
+    @property
+    def saturated(self) -> bool:
+        """True when a non-waiting ``run`` would be rejected right now"""
+        return self._slots.locked()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_inflight": self.max_inflight,
+            "in_flight": self._in_flight,
+            "running": min(self._in_flight, self.workers),
+            "queued": max(0, self._in_flight - self.workers),
+            "waiting": self._waiting,
+            "completed": self._completed,
+            "rejected": self._rejected
+        }
+
+    async def run(self, fn: Callable[..., Any], *args: Any, wait: bool = False) -> Any:
+        """Run ``fn(*args)`` on the pool, rejecting if saturated unless ``wait`` is set"""
+        if self._slots.locked():
+            if not wait:
+                self._rejected += 1
+                raise PoolSaturatedError(self.stats())
+            self._waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        self._in_flight += 1
+        loop = asyncio.get_running_loop()
+        # Carry the request's context (e.g. its tenant) into the worker thread
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(context.run, fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # Freed when the thread is done, not when the caller stops waiting: a cancelled
+        # request (or job) whose call already started keeps running and keeps its slot
+        future.add_done_callback(lambda _: self._release_threadsafe(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+
+    def _release(self):
+        self._in_flight -= 1
+        self._completed += 1
+        self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
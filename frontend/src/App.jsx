@@ -13,6 +13,10 @@ function App() {
     setError(null)
   }
 
+  const handlePartialResult = (data) => {
+    setResult(data)
+  }
+
   const handleUploadError = (err) => {
     setError(err)
     setResult(null)
@@ -36,6 +40,7 @@ function App() {
             <FileUpload 
               onUploadSuccess={handleUploadSuccess}
               onUploadError={handleUploadError}
+              onPartialResult={handlePartialResult}
               loading={loading}
               setLoading={setLoading}
             />
@@ -2,7 +2,13 @@ import { useState, useRef } from 'react'
 import axios from 'axios'
 import './FileUpload.css'
 
-const FileUpload = ({ onUploadSuccess, onUploadError, loading, setLoading }) => {
+const errorDetail = (body, status) => {
+  if (typeof body?.detail === 'string') return body.detail
+  if (body?.detail?.message) return body.detail.message
+  return `Request failed with status ${status}`
+}
+
+const FileUpload = ({ onUploadSuccess, onUploadError, onPartialResult, loading, setLoading }) => {
   const [preview, setPreview] = useState(null)
   const [selectedFile, setSelectedFile] = useState(null)
   const [dragActive, setDragActive] = useState(false)
@@ -62,6 +68,44 @@ const FileUpload = ({ onUploadSuccess, onUploadError, loading, setLoading }) =>
     }
   }
 
+  // Images are streamed: fields are rendered as the model emits them (NDJSON from /upload/stream)
+  const streamUpload = async (formData) => {
+    const response = await fetch('/api/upload/stream', { method: 'POST', body: formData })
+    if (!response.ok) {
+      const body = await response.json().catch(() => null)
+      throw new Error(errorDetail(body, response.status))
+    }
+    setUploadProgress(100)
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let fields = {}
+
+    const handleEvent = (event) => {
+      if (event.type === 'field') {
+        fields = { ...fields, [event.key]: event.value }
+        onPartialResult?.({ filename: selectedFile.name, extracted_data: fields, streaming: true })
+      } else if (event.type === 'result') {
+        const { type, ...result } = event
+        if (!result.success) throw new Error(result.error || 'Failed to process image')
+        onUploadSuccess(result)
+      } else if (event.type === 'error') {
+        throw new Error(event.error)
+      }
+    }
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop()
+      lines.filter((line) => line.trim()).forEach((line) => handleEvent(JSON.parse(line)))
+    }
+    if (buffer.trim()) handleEvent(JSON.parse(buffer))
+  }
+
   const handleUpload = async () => {
     if (!selectedFile) {
       onUploadError('Please select a file first')
@@ -73,6 +117,18 @@ const FileUpload = ({ onUploadSuccess, onUploadError, loading, setLoading }) =>
     const formData = new FormData()
     formData.append('file', selectedFile)
 
+    if (selectedFile.type !== 'application/pdf' && window.ReadableStream) {
+      try {
+        await streamUpload(formData)
+      } catch (err) {
+        onUploadError(err.message || 'Failed to process image')
+      } finally {
+        setLoading(false)
+        setUploadProgress(0)
+      }
+      return
+    }
+
     try {
       const response = await axios.post('/api/upload', formData, {
         headers: {
@@ -97,7 +97,7 @@ const ResultDisplay = ({ result, onReset }) => {
   return (
     <div className="result-container">
       <div className="result-header">
-        <h2>✅ Extraction Complete</h2>
+        <h2>{result.streaming ? '⏳ Extracting...' : '✅ Extraction Complete'}</h2>
         <p className="filename">File: {result.filename}</p>
       </div>
 
@@ -126,7 +126,7 @@ const ResultDisplay = ({ result, onReset }) => {
       </div>
 
       <div className="result-actions">
-        <button onClick={onReset} className="btn-primary">
+        <button onClick={onReset} className="btn-primary" disabled={result.streaming}>
           ⬆️ Upload Another Image
         </button>
       </div>